@@ -0,0 +1 @@
+"""Benchmarks do pipeline de relatórios com arquivos sintéticos (sem PII). Rodar com `python -m benchmarks`."""
@@ -0,0 +1,76 @@
+"""
+Checagem de detecção de banco no corpus sintético (o mesmo inventário que semeia as assinaturas).
+
+Uso, a partir de backend/:
+    python -m benchmarks.detection                       # todos os layouts, CSV e XLSX
+    python -m benchmarks.detection --layouts PAULISTA DIGIO_NAMED
+
+Cada arquivo passa por read_and_detect_file (espiada do cabeçalho + leitura completa) com nome
+neutro. Falha se o banco detectado não for o do layout, ou se um layout do inventário só for
+reconhecido pelas regras antigas (sem assinatura de colunas/conteúdo). Sai com código 1 se algo falhou.
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import tempfile
+from typing import List, Optional
+
+from .generators import INVENTORY_LAYOUTS, build_layouts
+from .suite import load_server
+
+DEFAULT_ROWS = 200
+FORMATS = ("csv", "xlsx")
+
+
+def check_layouts(server, layout_names: List[str], n_rows: int, seed: int) -> List[str]:
+    """Retorna as falhas em linhas legíveis (vazia se tudo foi detectado como esperado)"""
+    layouts = build_layouts()
+    failures = []
+    for index, name in enumerate(layout_names):
+        layout = layouts[name]
+        # Layouts do inventário (e variantes, como DIGIO_NAMED) têm assinatura; PRATA/STORM não
+        signed = layout.bank_type in {bank for _, bank in INVENTORY_LAYOUTS.values()}
+        for file_format in FORMATS:
+            content = layout.generate_file(n_rows, file_format, seed)
+            filename = f"bench_{index:02d}.{file_format}"
+            with contextlib.redirect_stdout(open(os.devnull, 'w')):
+                _, detection = server.read_and_detect_file(content, filename)
+            line = (f"{name:<13} {file_format:<4} → {detection.bank} "
+                    f"({detection.method}, confiança {detection.confidence:.2f})")
+            if detection.bank != layout.bank_type:
+                failures.append(f"❌ {line}  [esperado {layout.bank_type}]")
+            elif signed and detection.method == "regras":
+                failures.append(f"❌ {line}  [esperado por assinatura, não pelas regras]")
+            else:
+                print(f"✅ {line}")
+    return failures
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.detection",
+                                     description="Confere a detecção de banco em cada layout sintético")
+    parser.add_argument("--layouts", nargs="+", default=list(build_layouts()), help="Layouts a conferir (padrão: todos)")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="Linhas por arquivo")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    try:
+        server = load_server(tempfile.mkdtemp(prefix='qfaz_detect_'))
+        failures = check_layouts(server, args.layouts, args.rows, args.seed)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    if failures:
+        print(f"\n{len(failures)} falhas de detecção:")
+        for line in failures:
+            print(line)
+        return 1
+    print("\n✅ Todos os layouts detectados como esperado")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+"""
+Geradores sintéticos dos layouts de relatório bancário, sem dados de clientes.
+
+Nomes de colunas e distribuições (exemplos, % de nulos, cardinalidade) vêm de
+data/map_relat_atualizados.txt; a exportação da Storm segue storm_example.csv.
+Colunas de alta cardinalidade (propostas, CPFs, nomes, datas) são sintetizadas:
+os dígitos dos exemplos são sorteados, datas caem no intervalo dos exemplos e nomes
+são recombinados palavra a palavra - nenhum valor individual é copiado.
+"""
+import io
+import re
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+REPO_DIR = Path(__file__).resolve().parents[2]
+INVENTORY_PATH = REPO_DIR / 'data' / 'map_relat_atualizados.txt'
+STORM_EXAMPLE_PATH = REPO_DIR / 'storm_example.csv'
+
+# Linhas de dados geradas por bloco (limita a memória na geração de 1M linhas)
+CHUNK_ROWS = 100_000
+
+# Layout → (título da seção no inventário, banco esperado na detecção)
+INVENTORY_LAYOUTS = {
+    "AVERBAI": ("AVERBAI", "AVERBAI"),
+    "DIGIO": ("DIGIO", "DIGIO"),
+    "DAYCOVAL": ("BANCO DAYCOVAL", "DAYCOVAL"),
+    "VCTEX": ("BANCO VCTEX", "VCTEX"),
+    "SANTANDER": ("BANCO SANTANDER", "SANTANDER"),
+    "CREFAZ": ("BANCO CREFAZ", "CREFAZ"),
+    "QUERO_MAIS": ("BANCO QUERO MAIS CREDITO", "QUERO_MAIS"),
+    "PAN": ("BANCO PAN", "PAN"),
+    "C6": ("BANCO C6 BANK", "C6"),
+    "FACTA92": ("FACTA92", "FACTA92"),
+    "PAULISTA": ("PAULISTA", "PAULISTA"),
+    "BRB": ("BRB", "BRB"),
+    "QUALIBANKING": ("QUALIBANKING", "QUALIBANKING"),
+    "MERCANTIL": ("MERCANTIL", "MERCANTIL"),
+    "AMIGOZ": ("AMIGOZ", "AMIGOZ"),
+    "TOTALCASH": ("BANCO TOTALCASH", "TOTALCASH"),
+}
+
+# Layouts "Unnamed" (relatório impresso): quantos exemplos iniciais de cada coluna são
+# linhas de título/metadados acima da linha de rótulos. O inventário lista valores
+# distintos, não a ordem das linhas, então essa contagem é informada aqui.
+REPORT_PREAMBLES = {
+    "DIGIO": {"Unnamed: 1": 3, "Unnamed: 2": 1, "Unnamed: 15": 4, "Unnamed: 18": 1},
+    "DAYCOVAL": {"BANCO DAYCOVAL S/A - Consignado": 1, "Unnamed: 43": 3, "Pg. 1/1": 1},
+    "QUERO_MAIS": {"CAPITAL CONSIG SOCIEDADE DE CRÉDITO DIRETO S.A": 2, "Pg. 1/1": 4},
+    "PAULISTA": {"Unnamed: 1": 1},
+}
+
+# Colunas extras (nome lido pelo normalizador → coluna do inventário copiada) para layouts cujo
+# inventário usa rótulos que normalize_bank_data não lê; sem elas o layout normaliza para 0 linhas.
+# As colunas originais continuam no arquivo, então a detecção vê o layout real.
+NORMALIZER_ALIASES = {
+    "C6": {
+        "Número do Contrato": "Número da Proposta",
+        "CPF": "CNPJ/CPF do Cliente",
+        "Nome do Cliente": "Nome Cliente",
+        "Data da operação": "Data Digitação ADE",
+        "Status": "Situação Proposta",
+        "Data Nascimento": "Data Nascimento Cliente",
+    },
+}
+
+INVENTORY_SECTIONS = {section for section, _ in INVENTORY_LAYOUTS.values()}
+
+_DATE_FORMATS = [
+    (re.compile(r'^\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2}$'), '%d/%m/%Y %H:%M:%S'),
+    (re.compile(r'^\d{2}/\d{2}/\d{4} \d{2}:\d{2}$'), '%d/%m/%Y %H:%M'),
+    (re.compile(r'^\d{2}/\d{2}/\d{4}$'), '%d/%m/%Y'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$'), '%Y-%m-%d %H:%M:%S'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}$'), '%Y-%m-%d'),
+]
+_DIGIT_CHARS = np.array(list('0123456789'))
+# Nomes de pessoas: duas ou mais palavras só com letras
+_NAME_PATTERN = re.compile(r'^[^\W\d_]+( +[^\W\d_]+)+$')
+
+
+class ColumnProfile:
+    """Distribuição de uma coluna: exemplos (com pesos opcionais), fração de nulos e cardinalidade"""
+
+    def __init__(self, name: str, examples: List[str], null_ratio: float = 0.0,
+                 unique_ratio: float = 0.0, weights: Optional[List[float]] = None):
+        self.name = name
+        self.examples = [example for example in examples if example.strip()]
+        self.null_ratio = min(max(null_ratio, 0.0), 1.0)
+        self.unique_ratio = unique_ratio
+        self.weights = weights
+        self.date_format = self._date_format()
+
+    def _date_format(self) -> Optional[str]:
+        stripped = [example.strip() for example in self.examples]
+        for pattern, fmt in _DATE_FORMATS:
+            if stripped and all(pattern.match(example) for example in stripped):
+                # Datas inválidas de exemplo (ex.: 00/00/0000) tornam a coluna categórica
+                if pd.to_datetime(pd.Series(stripped), format=fmt, errors='coerce').notna().all():
+                    return fmt
+        return None
+
+    def sample(self, n_rows: int, rng: np.random.Generator) -> np.ndarray:
+        """Gera n_rows valores (object, com None nos nulos)"""
+        values = np.full(n_rows, None, dtype=object)
+        if not self.examples or n_rows == 0:
+            return values
+
+        filled = rng.random(n_rows) >= self.null_ratio
+        count = int(filled.sum())
+        if self.date_format:
+            generated = _sample_dates(self.examples, self.date_format, count, rng)
+        elif self.unique_ratio >= 0.5 and any(ch.isdigit() for ch in ''.join(self.examples)):
+            generated = _sample_digit_patterns(self.examples, count, rng)
+        elif self.unique_ratio >= 0.5 and all(_NAME_PATTERN.match(example.strip()) for example in self.examples):
+            generated = _sample_word_mix(self.examples, count, rng)
+        else:
+            choices = np.array(self.examples, dtype=object)
+            probabilities = None
+            if self.weights:
+                probabilities = np.asarray(self.weights, dtype=float)
+                probabilities = probabilities / probabilities.sum()
+            generated = choices[rng.choice(len(choices), size=count, p=probabilities)]
+
+        values[filled] = generated
+        return values
+
+
+def _sample_dates(examples: List[str], fmt: str, count: int, rng: np.random.Generator) -> np.ndarray:
+    parsed = pd.to_datetime(pd.Series([example.strip() for example in examples]), format=fmt)
+    start = parsed.min() - timedelta(days=15)
+    span_seconds = max(int((parsed.max() - parsed.min()).total_seconds()) + 30 * 86400, 86400)
+    offsets = rng.integers(0, span_seconds, size=count)
+    if '%H' not in fmt:
+        offsets -= offsets % 86400
+    dates = pd.Series(start + pd.to_timedelta(offsets, unit='s'))
+    return dates.dt.strftime(fmt).to_numpy(dtype=object)
+
+
+def _sample_digit_patterns(examples: List[str], count: int, rng: np.random.Generator) -> np.ndarray:
+    """Sorteia os dígitos de um exemplo escolhido, mantendo o formato (pontuação, tamanho, zeros à esquerda)"""
+    result = np.empty(count, dtype=object)
+    template_index = rng.integers(0, len(examples), size=count)
+    for i, template in enumerate(examples):
+        rows = np.flatnonzero(template_index == i)
+        if rows.size == 0:
+            continue
+        chars = np.tile(np.array(list(template), dtype='<U1'), (rows.size, 1))
+        positions = [pos for pos, ch in enumerate(template) if ch.isdigit()]
+        if positions:
+            chars[:, positions] = _DIGIT_CHARS[rng.integers(0, 10, size=(rows.size, len(positions)))]
+            if template[positions[0]] != '0':
+                chars[:, positions[0]] = _DIGIT_CHARS[rng.integers(1, 10, size=rows.size)]
+        result[rows] = chars.view(f'<U{len(template)}')[:, 0].astype(object)
+    return result
+
+
+def _sample_word_mix(examples: List[str], count: int, rng: np.random.Generator) -> np.ndarray:
+    """Recombina palavras dos exemplos (ex.: nomes) - 2 a 4 palavras por valor"""
+    first_words = np.array([example.split()[0] for example in examples if example.split()], dtype=object)
+    other_words = np.array([word for example in examples for word in example.split()[1:]] or list(first_words), dtype=object)
+    result = first_words[rng.integers(0, len(first_words), size=count)]
+    extra_words = rng.integers(1, 4, size=count)
+    for k in range(1, 4):
+        rows = extra_words >= k
+        result[rows] = result[rows] + ' ' + other_words[rng.integers(0, len(other_words), size=int(rows.sum()))]
+    return result
+
+
+def parse_inventory(path: Path = INVENTORY_PATH) -> Dict[str, List[ColumnProfile]]:
+    """Lê map_relat_atualizados.txt → {título da seção: [ColumnProfile, ...]}"""
+    lines = path.read_text(encoding='utf-8').splitlines()
+    raw_columns: Dict[str, list] = {}
+    declared_records: Dict[str, int] = {}
+    current = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped in INVENTORY_SECTIONS:
+            current = stripped
+            raw_columns[current] = []
+            continue
+        if current is None:
+            continue
+        found = re.search(r'\((\d+) registros\)', stripped)
+        if stripped.startswith('📄') and found:
+            declared_records[current] = int(found.group(1))
+        elif stripped.startswith('Tipo:'):
+            name = lines[i - 1].strip()
+            uniques = re.search(r'Valores únicos: (\d+)', stripped)
+            nulls = re.search(r'Nulos: (\d+)', stripped)
+            examples_line = lines[i + 1].strip() if i + 1 < len(lines) else ''
+            examples = examples_line.split('Exemplos:', 1)[-1].lstrip().split(', ') if examples_line.startswith('Exemplos:') else []
+            examples = [example for example in examples if example.strip() not in ('', '``')]
+            n_nulls = int(nulls.group(1)) if nulls else 0
+            n_uniques = int(uniques.group(1)) if uniques else len(examples)
+            raw_columns[current].append((name, examples, n_uniques, n_nulls))
+
+    sections: Dict[str, List[ColumnProfile]] = {}
+    for section, columns in raw_columns.items():
+        # Seções sem a linha "📄 ... (N registros)": estimativa pelo maior únicos + nulos
+        records = declared_records.get(section) or max((u + n for _, _, u, n in columns), default=1)
+        sections[section] = [
+            ColumnProfile(name, examples, null_ratio=n_nulls / records,
+                          unique_ratio=n_uniques / max(records - n_nulls, 1))
+            for name, examples, n_uniques, n_nulls in columns
+        ]
+    return sections
+
+
+class Layout:
+    """Layout de arquivo de um banco: gera o DataFrame bruto (como o leitor o veria) e os bytes do arquivo"""
+
+    def __init__(self, name: str, bank_type: str, columns: List[ColumnProfile],
+                 preamble: Optional[Dict[str, int]] = None, named_header: bool = False):
+        self.name = name
+        self.bank_type = bank_type
+        self.columns = columns
+        self.preamble = preamble
+        self.named_header = named_header
+
+    def _header_rows(self) -> Dict[str, list]:
+        """Relatório impresso: linhas de título/metadados seguidas da linha de rótulos"""
+        height = max(self.preamble.values(), default=0)
+        rows = {}
+        for column in self.columns:
+            skip = self.preamble.get(column.name, 0)
+            titles = column.examples[:skip]
+            label = column.examples[skip] if len(column.examples) > skip else None
+            rows[column.name] = titles + [None] * (height - len(titles)) + [label]
+        return rows
+
+    def _data_profiles(self) -> List[ColumnProfile]:
+        if self.preamble is None:
+            return self.columns
+        return [
+            ColumnProfile(column.name, column.examples[self.preamble.get(column.name, 0) + 1:],
+                          column.null_ratio, column.unique_ratio)
+            for column in self.columns
+        ]
+
+    def iter_chunks(self, n_rows: int, seed: int = 0, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """Gera o arquivo bruto (como o leitor o veria) em blocos de até chunk_rows linhas de dados"""
+        rng = np.random.default_rng(seed)
+        profiles = self._data_profiles()
+        header_rows = self._header_rows() if self.preamble is not None else None
+        names = [column.name for column in self.columns]
+        if header_rows is not None and self.named_header:
+            names = [header_rows[column.name][-1] or column.name for column in self.columns]
+
+        for start in range(0, max(n_rows, 1), chunk_rows):
+            size = min(chunk_rows, n_rows - start)
+            chunk = pd.DataFrame({name: profile.sample(size, rng) for name, profile in zip(names, profiles)})
+            if start == 0 and header_rows is not None and not self.named_header:
+                chunk = pd.concat([pd.DataFrame(header_rows), chunk], ignore_index=True)
+            yield chunk
+
+    def generate(self, n_rows: int, seed: int = 0) -> pd.DataFrame:
+        return pd.concat(self.iter_chunks(n_rows, seed), ignore_index=True)
+
+    def generate_file(self, n_rows: int, file_format: str = 'csv', seed: int = 0) -> bytes:
+        """Bytes do arquivo, escritos bloco a bloco para não manter o DataFrame inteiro em memória"""
+        buffer = io.BytesIO()
+        if file_format == 'csv':
+            for i, chunk in enumerate(self.iter_chunks(n_rows, seed)):
+                buffer.write(chunk.to_csv(sep=';', index=False, header=(i == 0)).encode('utf-8'))
+        elif file_format == 'xlsx':
+            workbook = openpyxl.Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            for i, chunk in enumerate(self.iter_chunks(n_rows, seed)):
+                if i == 0:
+                    sheet.append(list(chunk.columns))
+                for row in chunk.itertuples(index=False, name=None):
+                    sheet.append(list(row))
+            workbook.save(buffer)
+        else:
+            raise ValueError(f"Formato não suportado: {file_format}")
+        return buffer.getvalue()
+
+
+def prata_layout() -> Layout:
+    """PRATA não está no inventário: colunas do mapeamento em normalize_bank_data (mesma plataforma da VCTEX)"""
+    columns = [
+        ColumnProfile('Número da Proposta', ['512345', '498877', '530012'], unique_ratio=1.0),
+        ColumnProfile('Corban Master', ['QFZ SOLUCOES E INTERMEDIACOES LTDA']),
+        ColumnProfile('Data da operação', ['01/09/2025', '17/09/2025']),
+        ColumnProfile('Prazo proposta', ['60', '84', '120']),
+        ColumnProfile('Valor da Emissão', ['1.234,56', '987,10', '2.500,00'], unique_ratio=0.9),
+        ColumnProfile('Valor Desembolso', ['1.100,00', '850,35', '2.310,99'], unique_ratio=0.9),
+        ColumnProfile('Nome do Vendedor', ['vendedor1@q-faz.com (VENDEDOR UM)', 'vendedor2@q-faz.com (VENDEDOR DOIS)']),
+        ColumnProfile('Status', ['PAGO', 'CANCELADO', 'AGUARDANDO', 'EM ANALISE']),
+        ColumnProfile('Data do Desembolso', ['02/09/2025', '18/09/2025'], null_ratio=0.3),
+        ColumnProfile('CPF do Cliente', ['123.456.789-01', '987.654.321-00'], unique_ratio=1.0),
+        ColumnProfile('Nome do Cliente', ['MARIA SILVA SANTOS', 'JOSE OLIVEIRA LIMA', 'ANA PEREIRA COSTA'], unique_ratio=1.0),
+        ColumnProfile('Tabela', ['Tabela Shake de Morango', 'Tabela Prata Digital FGTS']),
+        ColumnProfile('Telefone', ['(11)99999-1234', '(14)98888-4321'], unique_ratio=1.0),
+        ColumnProfile('Cidade', ['SAO PAULO', 'BAURU', 'LINS']),
+        ColumnProfile('UF', ['SP', 'MG']),
+    ]
+    return Layout("PRATA", "PRATA", columns)
+
+
+def storm_layout(path: Path = STORM_EXAMPLE_PATH) -> Layout:
+    """Exportação da Storm: colunas e frequências do storm_example.csv, alta cardinalidade sintetizada"""
+    sample = pd.read_csv(path, sep=';', encoding='latin-1', dtype=str)
+    columns = []
+    for name in sample.columns:
+        values = sample[name].dropna()
+        null_ratio = 1 - len(values) / max(len(sample), 1)
+        unique_ratio = values.nunique() / max(len(values), 1)
+        if unique_ratio >= 0.5:
+            examples = values.drop_duplicates().head(20).tolist()
+            columns.append(ColumnProfile(name, examples, null_ratio, unique_ratio))
+        else:
+            counts = values.value_counts().head(50)
+            columns.append(ColumnProfile(name, counts.index.tolist(), null_ratio, unique_ratio, weights=counts.tolist()))
+    return Layout("STORM", "STORM", columns)
+
+
+def build_layouts() -> Dict[str, Layout]:
+    """Todos os layouts suportados, incluindo as variantes DIGIO "Unnamed" e com cabeçalho nomeado"""
+    inventory = parse_inventory()
+    layouts: Dict[str, Layout] = {}
+    for name, (section, bank_type) in INVENTORY_LAYOUTS.items():
+        columns = inventory[section]
+        by_name = {column.name: column for column in columns}
+        columns = columns + [
+            ColumnProfile(alias, by_name[source].examples, by_name[source].null_ratio, by_name[source].unique_ratio)
+            for alias, source in NORMALIZER_ALIASES.get(name, {}).items()
+        ]
+        layouts[name] = Layout(name, bank_type, columns, preamble=REPORT_PREAMBLES.get(name))
+    layouts["DIGIO_NAMED"] = Layout("DIGIO_NAMED", "DIGIO", inventory["DIGIO"], preamble=REPORT_PREAMBLES["DIGIO"], named_header=True)
+    layouts["PRATA"] = prata_layout()
+    layouts["STORM"] = storm_layout()
+    return layouts
@@ -0,0 +1,223 @@
+"""
+Harness de regressão de desempenho: roda o corpus sintético pelo pipeline e compara
+linhas/s, pico de RSS e banco detectado por layout e etapa com a baseline versionada (baseline.json).
+
+Uso, a partir de backend/:
+    python -m benchmarks.regression              # compara; sai com código 1 se algo regrediu
+    python -m benchmarks.regression --record     # regrava a baseline com as medições atuais
+
+Tempo: cada layout roda --repeat vezes e vale o melhor tempo (o ruído de máquina só deixa mais lento).
+Etapas curtas (detecção, deduplicação, formatação) são chamadas de novo até somar
+STAGE_TIMING_SECONDS e vale a média por chamada, então todas entram na comparação de linhas/s.
+Memória: com poucas linhas o RSS quase não cresce e, no mesmo processo, um layout reaproveita a
+memória liberada pelo anterior; o pico de RSS vem de uma passada com MEMORY_ROWS linhas, cada
+layout num processo novo. O banco detectado de cada layout também vai para a baseline e mudar é regressão.
+Layouts que parecem ter regredido em tempo são medidos de novo antes de falhar,
+já que em VMs compartilhadas a mesma carga varia até 2x de uma execução para outra.
+Mudanças de desempenho em server.py vão para revisão com a baseline regravada no mesmo PR.
+Os números dependem da máquina: grave e compare sempre no mesmo tipo de ambiente.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .generators import build_layouts
+from .suite import BACKEND_DIR, run_suite
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+DEFAULT_ROWS = 2_000
+DEFAULT_REPEAT = 3
+# Linhas por arquivo na passada de memória (com 2 mil linhas a maioria das etapas fica em 0 MB)
+MEMORY_ROWS = 10_000
+# Queda de linhas/s tolerada e crescimento de pico de RSS tolerado (frações)
+DEFAULT_SPEED_TOLERANCE = 0.30
+DEFAULT_MEMORY_TOLERANCE = 0.30
+# Tempo somado por etapa: etapas mais curtas são repetidas até chegar nele
+STAGE_TIMING_SECONDS = 0.2
+# Piso absoluto da folga de RSS: etapas que quase não alocam variam 0-2 MB entre execuções;
+# acima dele o limite é só o proporcional (base x (1 + tolerância))
+MEMORY_SLACK_MB = 4.0
+
+
+def measured(report: dict) -> List[dict]:
+    return [result for result in report["results"] if result["status"] not in ("skipped", "empty")]
+
+
+def measure_memory(layouts: List[str], rows: int, seed: int) -> List[dict]:
+    """Pico de RSS por etapa, cada layout num processo novo (sem memória liberada por layouts anteriores)"""
+    results = []
+    with tempfile.TemporaryDirectory(prefix='qfaz_memory_') as workdir:
+        for name in layouts:
+            output = Path(workdir) / f"{name}.json"
+            subprocess.run(
+                [sys.executable, "-W", "ignore", "-m", "benchmarks", "--layouts", name,
+                 "--sizes", str(rows), "--seed", str(seed), "--json", str(output)],
+                cwd=BACKEND_DIR, check=True, stdout=subprocess.DEVNULL,
+            )
+            result = json.loads(output.read_text(encoding='utf-8'))["results"][0]
+            print(f"🧮 {name:<13} {rows:,} linhas  pico RSS por etapa (MB): {result['peak_rss_mb']}")
+            results.append(result)
+    return results
+
+
+def collect_metrics(reports: List[dict], memory: List[dict]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """layout → etapa → {rows_per_sec, seconds, peak_rss_mb}: melhor tempo entre as repetições
+    e pico de RSS da passada de memória"""
+    metrics = {}
+    for report in reports:
+        for result in measured(report):
+            stages = metrics.setdefault(result["layout"], {})
+            for stage, seconds in result["stages"].items():
+                entry = stages.setdefault(stage, {"seconds": seconds, "peak_rss_mb": None})
+                entry["seconds"] = min(entry["seconds"], seconds)
+                entry["rows_per_sec"] = round(result["rows"] / entry["seconds"], 1) if entry["seconds"] > 0 else None
+    for result in memory:
+        stages = metrics.get(result["layout"], {})
+        for stage, peak in result["peak_rss_mb"].items():
+            if stage in stages:
+                stages[stage]["peak_rss_mb"] = peak
+    return metrics
+
+
+def collect_detected(report: dict) -> Dict[str, Optional[str]]:
+    """layout → banco detectado (None quando a detecção falhou)"""
+    return {result["layout"]: result.get("detected_bank")
+            for result in report["results"] if result["status"] != "skipped"}
+
+
+def regressed_layouts(regressions: List[str]) -> List[str]:
+    return sorted({line.split()[1].split("/")[0].rstrip(":") for line in regressions})
+
+
+def compare(baseline: dict, current: dict, speed_tolerance: float, memory_tolerance: float,
+            baseline_banks: Dict[str, Optional[str]],
+            current_banks: Dict[str, Optional[str]]) -> tuple[List[str], List[str], List[str]]:
+    """Retorna (regressões de tempo, outras regressões, observações) em linhas legíveis.
+    Só as de tempo valem uma nova medição: a detecção é determinística e a memória já vem de processos novos"""
+    slow, regressions, notes = [], [], []
+    for layout, bank in sorted(baseline_banks.items()):
+        if layout in current_banks and current_banks[layout] != bank:
+            regressions.append(f"❌ {layout}: banco detectado {bank} → {current_banks[layout]}")
+
+    for layout, stages in sorted(baseline.items()):
+        if layout not in current:
+            regressions.append(f"❌ {layout}: ausente nesta execução (pulado, vazio ou removido)")
+            continue
+        for stage, base in sorted(stages.items()):
+            now = current[layout].get(stage)
+            label = f"{layout}/{stage}"
+            if now is None:
+                regressions.append(f"❌ {label}: etapa ausente nesta execução")
+                continue
+
+            base_speed, now_speed = base.get("rows_per_sec"), now.get("rows_per_sec")
+            if base_speed and now_speed:
+                change = now_speed / base_speed - 1
+                line = f"{label}: linhas/s {base_speed:,.0f} → {now_speed:,.0f} ({change:+.1%})"
+                if change < -speed_tolerance:
+                    slow.append(f"❌ {line}  [tolerância -{speed_tolerance:.0%}]")
+                elif change > speed_tolerance:
+                    notes.append(f"🚀 {line}  (regrave a baseline com --record)")
+
+            base_mem, now_mem = base.get("peak_rss_mb"), now.get("peak_rss_mb")
+            if base_mem is not None and now_mem is not None:
+                limit = max(base_mem * (1 + memory_tolerance), base_mem + MEMORY_SLACK_MB)
+                if now_mem > limit:
+                    regressions.append(
+                        f"❌ {label}: pico RSS {base_mem:.1f} MB → {now_mem:.1f} MB  "
+                        f"[limite {limit:.1f} MB = +{memory_tolerance:.0%}, no mínimo +{MEMORY_SLACK_MB:.0f} MB]"
+                    )
+
+    for layout in sorted(set(current) - set(baseline)):
+        notes.append(f"🆕 {layout}: sem baseline (regrave com --record)")
+    return slow, regressions, notes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.regression",
+                                     description="Compara o desempenho do pipeline com a baseline versionada")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Arquivo JSON da baseline")
+    parser.add_argument("--record", action="store_true", help="Regrava a baseline com as medições atuais")
+    parser.add_argument("--rows", type=int, help=f"Linhas por arquivo (padrão: o da baseline ou {DEFAULT_ROWS})")
+    parser.add_argument("--layouts", nargs="+", help="Layouts a medir (padrão: os da baseline ou todos)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_SPEED_TOLERANCE, help="Queda de linhas/s tolerada")
+    parser.add_argument("--memory-tolerance", type=float, default=DEFAULT_MEMORY_TOLERANCE, help="Crescimento de pico de RSS tolerado")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Execuções por layout (melhor tempo)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    baseline_path = Path(args.baseline)
+    baseline = None
+    if not args.record:
+        if not baseline_path.exists():
+            print(f"❌ Baseline não encontrada em {baseline_path}; grave uma com --record")
+            return 2
+        baseline = json.loads(baseline_path.read_text(encoding='utf-8'))
+
+    rows = args.rows or (baseline or {}).get("rows", DEFAULT_ROWS)
+    layouts = args.layouts or (sorted(baseline["metrics"]) if baseline else list(build_layouts()))
+
+    def timing_runs(names: List[str]) -> List[dict]:
+        return [run_suite(names, [rows], "csv", args.seed, min_stage_seconds=STAGE_TIMING_SECONDS)
+                for _ in range(max(args.repeat, 1))]
+
+    memory_rows = (baseline or {}).get("memory_rows", MEMORY_ROWS)
+    reports = timing_runs(layouts)
+    memory = measure_memory(layouts, memory_rows, args.seed)
+    current = collect_metrics(reports, memory)
+    detected = collect_detected(reports[0])
+
+    if args.record:
+        baseline_path.write_text(json.dumps({
+            "recorded_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "machine": platform.machine(),
+            "python": reports[0]["python"],
+            "pandas": reports[0]["pandas"],
+            "rows": rows,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "stage_timing_seconds": STAGE_TIMING_SECONDS,
+            "memory_rows": memory_rows,
+            "detected_banks": detected,
+            "metrics": current,
+        }, ensure_ascii=False, indent=2, sort_keys=True) + "\n", encoding='utf-8')
+        print(f"📄 Baseline regravada em {baseline_path} ({len(current)} layouts, {rows} linhas; memória com {memory_rows})")
+        for result in reports[0]["results"]:
+            if result["status"] == "misdetected":
+                print(f"⚠️ {result['layout']}: gravado com banco detectado {result.get('detected_bank')} "
+                      f"(esperado {result['expected_bank']}); corrija a detecção antes de versionar")
+        return 0
+
+    if rows != baseline.get("rows"):
+        print(f"⚠️ Medido com {rows} linhas; a baseline foi gravada com {baseline.get('rows')}")
+    expected = {layout: baseline["metrics"][layout] for layout in layouts if layout in baseline["metrics"]}
+    expected_banks = {layout: bank for layout, bank in baseline.get("detected_banks", {}).items() if layout in layouts}
+    slow, regressions, notes = compare(expected, current, args.tolerance, args.memory_tolerance, expected_banks, detected)
+    retry = [layout for layout in regressed_layouts(slow) if layout in current]
+    if retry:
+        print(f"\n🔁 Medindo de novo antes de falhar: {', '.join(retry)}")
+        reports += timing_runs(retry)
+        current = collect_metrics(reports, memory)
+        slow, regressions, notes = compare(expected, current, args.tolerance, args.memory_tolerance, expected_banks, detected)
+    regressions = slow + regressions
+    print()
+    for line in notes:
+        print(line)
+    if regressions:
+        print(f"\n{len(regressions)} regressões em relação à baseline de {baseline.get('recorded_at')}:")
+        for line in regressions:
+            print(line)
+        return 1
+    print(f"✅ Sem regressões em relação à baseline de {baseline.get('recorded_at')}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Benchmark por etapa do pipeline com arquivos sintéticos (ver generators.py).
+
+Uso, a partir de backend/:
+    python -m benchmarks                                   # todos os layouts, 1k/100k/1M linhas
+    python -m benchmarks --sizes 1000 100000 --layouts AVERBAI DAYCOVAL
+    python -m benchmarks --format xlsx --json resultados.json
+
+Cada arquivo passa por read_file_optimized → detect_bank_type_enhanced → normalize_bank_data
+→ map_to_final_format → remove_duplicates_enhanced → format_csv_for_storm, com o tempo de cada
+etapa medido isoladamente. A exportação da Storm mede leitura, detecção e process_storm_data_enhanced.
+Cada etapa também registra o pico de RSS acima do RSS no início da etapa (amostrado numa thread).
+Com min_stage_seconds, etapas curtas são chamadas de novo até somar esse tempo e vale a média por chamada.
+"""
+import argparse
+import contextlib
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .generators import build_layouts, Layout
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+BANK_STAGES = [
+    "read_file_optimized", "detect_bank_type_enhanced", "normalize_bank_data",
+    "map_to_final_format", "remove_duplicates_enhanced", "format_csv_for_storm",
+]
+STORM_STAGES = ["read_file_optimized", "detect_bank_type_enhanced", "process_storm_data_enhanced"]
+# Fração das propostas geradas que aparece na Storm sintética (PAGO/CANCELADO) para a deduplicação
+STORM_MATCH_RATIO = 0.3
+# Pico de memória estimado ≈ MEMORY_FACTOR x tamanho do arquivo (strings do pandas + cópias das etapas)
+MEMORY_FACTOR = 12
+
+
+def load_server(workdir: str):
+    """Importa o server.py com registros/caches/índices apontando para um diretório temporário"""
+    for env_name, file_name in [
+        ('JOB_REGISTRY_PATH', 'jobs.sqlite3'),
+        ('STORM_INDEX_PATH', 'storm_index.sqlite3'),
+        ('READER_PROFILES_PATH', 'reader_profiles.sqlite3'),
+        ('RESULT_STORE_DIR', 'results'),
+        ('PARSE_CACHE_DIR', 'parse_cache'),
+    ]:
+        os.environ.setdefault(env_name, os.path.join(workdir, file_name))
+    if str(BACKEND_DIR) not in sys.path:
+        sys.path.insert(0, str(BACKEND_DIR))
+    import server
+    return server
+
+
+def available_memory() -> Optional[int]:
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_AVPHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+class RssSampler:
+    """Pico de RSS durante uma etapa, amostrado numa thread (sem o custo do tracemalloc)"""
+
+    INTERVAL = 0.01
+
+    def __init__(self, read_rss):
+        self.read_rss = read_rss
+        self.start = None
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.INTERVAL):
+            rss = self.read_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def __enter__(self):
+        self.start = self.peak = self.read_rss()
+        if self.start is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.start is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.read_rss() or 0)
+
+    @property
+    def growth(self) -> Optional[int]:
+        return None if self.start is None else max(self.peak - self.start, 0)
+
+
+def timed(server, result: dict, name: str, fn, *args, min_seconds: float = 0.0, stage_seconds=None):
+    """Mede fn(*args), repetindo até somar min_seconds (tempo por chamada = média).
+    stage_seconds(valor) → segundos a contar de cada chamada (padrão: a chamada inteira)"""
+    calls, seconds = 0, 0.0
+    with RssSampler(server.current_rss_bytes) as sampler:
+        while True:
+            start = time.perf_counter()
+            value = fn(*args)
+            elapsed = time.perf_counter() - start
+            seconds += stage_seconds(value) if stage_seconds else elapsed
+            calls += 1
+            if seconds >= min_seconds:
+                break
+    result["stages"][name] = round(seconds / calls, 6)
+    result["calls"][name] = calls
+    if sampler.growth is not None:
+        result["peak_rss_mb"][name] = round(sampler.growth / (1024 * 1024), 1)
+    return value
+
+
+def synthetic_storm_data(final_df: pd.DataFrame, seed: int) -> Dict[str, str]:
+    """Storm sintética: parte das propostas do próprio arquivo já PAGO/CANCELADO"""
+    proposals = final_df.get('PROPOSTA', pd.Series(dtype=object)).dropna().astype(str)
+    proposals = proposals[proposals.str.strip() != ''].unique()
+    rng = np.random.default_rng(seed)
+    chosen = proposals[rng.random(len(proposals)) < STORM_MATCH_RATIO]
+    statuses = np.where(rng.random(len(chosen)) < 0.5, 'PAGO', 'CANCELADO')
+    return dict(zip(chosen.tolist(), statuses.tolist()))
+
+
+def estimate_file_bytes(layout: Layout, n_rows: int, file_format: str) -> int:
+    sample_rows = 1_000
+    sample = layout.generate_file(sample_rows, 'csv')
+    size = len(sample) * n_rows / sample_rows
+    return int(size * (1.5 if file_format == 'xlsx' else 1))
+
+
+def run_layout(server, layout: Layout, n_rows: int, file_format: str, seed: int, index: int,
+               min_stage_seconds: float = 0.0) -> dict:
+    result = {
+        "layout": layout.name, "expected_bank": layout.bank_type, "rows": n_rows,
+        "format": file_format, "status": "ok", "stages": {}, "calls": {}, "rows_out": {}, "peak_rss_mb": {},
+    }
+    repeat = {"min_seconds": min_stage_seconds}
+
+    free_memory = available_memory()
+    estimated = estimate_file_bytes(layout, n_rows, file_format)
+    if free_memory is not None and estimated * MEMORY_FACTOR > free_memory:
+        result["status"] = "skipped"
+        result["reason"] = f"memória estimada {estimated * MEMORY_FACTOR / 1e9:.1f} GB > livre {free_memory / 1e9:.1f} GB"
+        return result
+
+    generation_start = time.perf_counter()
+    content = layout.generate_file(n_rows, file_format, seed)
+    result["generation_seconds"] = round(time.perf_counter() - generation_start, 2)
+    result["file_bytes"] = len(content)
+
+    # Nome neutro: a detecção é medida pela estrutura/conteúdo, não pelo nome do arquivo
+    filename = f"bench_{index:02d}.{file_format}"
+    gc.collect()
+
+    df = timed(server, result, "read_file_optimized", server.read_file_optimized, content, filename, **repeat)
+    del content
+    result["rows_out"]["read_file_optimized"] = len(df)
+
+    try:
+        detected = timed(server, result, "detect_bank_type_enhanced", server.detect_bank_type_enhanced, df, filename, **repeat)
+    except server.HTTPException as e:
+        detected = None
+        result["detection_error"] = str(e.detail)[:200]
+    result["detected_bank"] = detected
+    if detected != layout.bank_type:
+        result["status"] = "misdetected"
+    bank_type = layout.bank_type  # Etapas seguintes sempre com o banco do layout
+
+    if bank_type == "STORM":
+        proposals, _ = timed(server, result, "process_storm_data_enhanced", server.process_storm_data_enhanced, df, **repeat)
+        result["rows_out"]["process_storm_data_enhanced"] = len(proposals)
+        return result
+
+    normalized = timed(server, result, "normalize_bank_data", lambda: server.normalize_bank_data(df.copy(), bank_type), **repeat)
+    result["rows_out"]["normalize_bank_data"] = len(normalized)
+    del normalized
+    if result["rows_out"]["normalize_bank_data"] == 0:
+        # Pipeline vazio daqui em diante: medir map/dedupe/format não diria nada
+        result["status"] = "empty"
+        result["reason"] = f"normalize_bank_data({bank_type}) não produziu linhas"
+        return result
+
+    # map_to_final_format normaliza de novo por dentro: o tempo da etapa é só o 'map' do StageTimer
+    # (o pico de RSS continua sendo o da chamada inteira)
+    def map_once():
+        timer = server.StageTimer()
+        mapped, _ = server.map_to_final_format(df.copy(), bank_type, timer)
+        return mapped, timer.stages["map"]["seconds"]
+
+    mapped, _ = timed(server, result, "map_to_final_format", map_once, stage_seconds=lambda value: value[1], **repeat)
+    result["rows_out"]["map_to_final_format"] = len(mapped)
+    del df
+
+    storm_data = synthetic_storm_data(mapped, seed)
+    deduped, _ = timed(server, result, "remove_duplicates_enhanced", server.remove_duplicates_enhanced, mapped, storm_data, **repeat)
+    result["rows_out"]["remove_duplicates_enhanced"] = len(deduped)
+
+    csv_text = timed(server, result, "format_csv_for_storm", server.format_csv_for_storm, deduped, **repeat)
+    result["rows_out"]["format_csv_for_storm"] = max(csv_text.count('\n') - 1, 0)
+    return result
+
+
+def print_result(result: dict) -> None:
+    label = f"{result['layout']:<13} {result['rows']:>9,} {result['format']:<4}"
+    if result["status"] == "skipped":
+        print(f"{label}  ⏭️  pulado: {result['reason']}")
+        return
+    if result["status"] == "empty":
+        print(f"{label}  ❌ vazio: {result['reason']}")
+        return
+    stages = "  ".join(f"{name.split('_')[0]}={seconds:.3f}s" for name, seconds in result["stages"].items())
+    total = sum(result["stages"].values())
+    flag = "" if result["status"] == "ok" else f"  ⚠️ detectado {result.get('detected_bank')}"
+    print(f"{label}  total={total:.3f}s ({result['rows'] / max(total, 1e-9):,.0f} linhas/s)  {stages}{flag}")
+
+
+def run_suite(layout_names: List[str], sizes: List[int], file_format: str, seed: int,
+              verbose: bool = False, min_stage_seconds: float = 0.0) -> dict:
+    if not verbose:
+        logging.disable(logging.CRITICAL)
+    workdir = tempfile.mkdtemp(prefix='qfaz_bench_')
+    server = load_server(workdir)
+    layouts = build_layouts()
+    unknown = [name for name in layout_names if name not in layouts]
+    if unknown:
+        raise SystemExit(f"Layouts desconhecidos: {unknown}. Disponíveis: {sorted(layouts)}")
+
+    results = []
+    try:
+        for n_rows in sizes:
+            for index, name in enumerate(layout_names):
+                # Alguns normalizadores usam print(); fora do --verbose isso só polui a tabela
+                with contextlib.redirect_stdout(sys.stdout if verbose else open(os.devnull, 'w')) as out:
+                    result = run_layout(server, layouts[name], n_rows, file_format, seed, index, min_stage_seconds)
+                if out is not sys.stdout:
+                    out.close()
+                print_result(result)
+                results.append(result)
+    finally:
+        logging.disable(logging.NOTSET)
+
+    return {
+        "generated_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "format": file_format,
+        "seed": seed,
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> dict:
+    all_layouts = list(build_layouts())
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark por etapa com arquivos sintéticos")
+    parser.add_argument("--layouts", nargs="+", default=all_layouts, help="Layouts a medir (padrão: todos)")
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES), help="Linhas por arquivo")
+    parser.add_argument("--format", choices=["csv", "xlsx"], default="csv", help="Formato do arquivo gerado")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Grava os resultados neste arquivo JSON")
+    parser.add_argument("--verbose", action="store_true", help="Mantém os logs do server durante as medições")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.layouts, args.sizes, args.format, args.seed, args.verbose)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"📄 Resultados gravados em {args.json}")
+    return report
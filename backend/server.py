@@ -1,8 +1,12 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import FileResponse
+import time
+IMPORT_STARTED_AT = time.perf_counter()  # Início do cold start (relatório de fases em /health)
+
+from fastapi import FastAPI, APIRouter, File, UploadFile, HTTPException, Header, Query
+from fastapi.responses import FileResponse, PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 # from motor.motor_asyncio import AsyncIOMotorClient  # Comentado para deploy mais rápido
 import os
 import logging
@@ -12,16 +16,74 @@ from typing import List, Optional, Dict, Any
 import uuid
 from datetime import datetime
 import pandas as pd
+from pandas.api.types import union_categoricals
 import numpy as np
 import tempfile
 import json
 import io
 import re
 import traceback
+import hashlib
+import stat
+import threading
+import sqlite3
+import functools
+import contextlib
+import sys
+import asyncio
+import gzip
+import lzma
+import zipfile
+import zlib
+import cProfile
+import pstats
+import tracemalloc
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+class StartupReport:
+    """
+    Tempo de cada fase do cold start: import do server.py (até o uvicorn poder abrir a porta)
+    e, depois, o mapeamento de órgãos compilado em background.
+    """
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self._last_mark = started_at
+        self.phases: Dict[str, float] = {}
+        self.mapping_seconds: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+
+    def mark(self, phase: str) -> None:
+        """Fecha a fase `phase` (tempo desde a marca anterior)"""
+        now = time.perf_counter()
+        self.phases[phase] = round(now - self._last_mark, 4)
+        self._last_mark = now
+
+    def mapping_loaded(self, seconds: float) -> None:
+        self.mapping_seconds = round(seconds, 4)
+        self.ready_seconds = round(time.perf_counter() - self.started_at, 4)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "import_seconds": round(self._last_mark - self.started_at, 4),
+            "import_phases": self.phases,
+            "mapping_seconds": self.mapping_seconds,
+            "ready_seconds": self.ready_seconds,
+            # Leitores de Excel só entram em sys.modules quando chega o primeiro .xlsx/.xls
+            "excel_engines_loaded": [name for name in ("openpyxl", "xlrd") if name in sys.modules],
+        }
+
+startup_report = StartupReport(IMPORT_STARTED_AT)
+startup_report.mark("bibliotecas (fastapi, pandas, numpy)")
+
 # MongoDB connection (comentado para deploy mais rápido)
 # mongo_url = os.environ.get('MONGO_URL', '')
 # client = AsyncIOMotorClient(mongo_url) if mongo_url else None
@@ -32,19 +94,34 @@ app = FastAPI()
 
 # Health check endpoint for Docker
 @app.get("/health")
-async def health_check():
-    """Health check endpoint para verificar se a aplicação está funcionando"""
-    return {
-        "status": "healthy",
+async def health_check(strict: bool = False):
+    """Health check: 'starting' enquanto o mapeamento de órgãos compila em background, depois 'ready'.
+    Com ?strict=true responde 503 enquanto não estiver pronto (readiness probe).
+    """
+    ready = organ_mapping_ready.is_set()
+    body = {
+        "status": "ready" if ready else "starting",
         "timestamp": datetime.utcnow().isoformat(),
         "service": "Q-FAZ Backend",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "startup": startup_report.as_dict()
     }
+    if strict and not ready:
+        return JSONResponse(body, status_code=503)
+    return body
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Models
+class StageTiming(BaseModel):
+    seconds: float
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    rss_before_mb: Optional[float] = None
+    rss_after_mb: Optional[float] = None
+    peak_traced_mb: Optional[float] = None  # Só com MEMORY_TRACEMALLOC=1
+
 class ProcessingJob(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     status: str = "processing"  # processing, completed, failed
@@ -54,14 +131,399 @@ class ProcessingJob(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
     result_file: Optional[str] = None
+    stage_timings: Dict[str, StageTiming] = Field(default_factory=dict)  # Etapas do job (combinar, formatar, gravar)
+    profile_file: Optional[str] = None  # Perfil de execução (só jobs enviados com ?profile=true)
+    xlsx_file: Optional[str] = None  # Mesmo resultado em XLSX, gerado uma vez (output_format=xlsx)
+    memory: Dict[str, Any] = Field(default_factory=dict)  # RSS início/fim/pico, pico rastreado, orçamento
 
 class ReportSummary(BaseModel):
     bank_name: str
     total_records: int
     duplicates_removed: int
+    duplicates_by_status: Dict[str, int] = Field(default_factory=dict)
     status_distribution: Dict[str, int]
     mapped_records: int = 0
     unmapped_records: int = 0
+    date_order_report: Dict[str, Any] = Field(default_factory=dict)  # DAYCOVAL: ordem dia/mês por coluna
+    stage_timings: Dict[str, StageTiming] = Field(default_factory=dict)  # read, detect, clean, normalize, map, dedupe
+
+class FileOutcome(BaseModel):
+    filename: str
+    size_bytes: int = 0
+    bank: str = "DESCONHECIDO"
+    outcome: str = "ok"  # ok, storm, erro_leitura, vazio, sem_dados_mapeados, erro, ignorado
+    reason: Optional[str] = None  # Motivo quando o arquivo não entrou no resultado
+    summary: Optional[ReportSummary] = None
+
+# ===== MÉTRICAS DE DESEMPENHO (/metrics) =====
+
+MB = 1024 * 1024
+
+def current_rss_bytes() -> Optional[int]:
+    """RSS atual do processo (/proc no Linux; None onde não houver)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss_bytes() -> Optional[int]:
+    """Maior RSS que o processo já atingiu (ru_maxrss: KB no Linux, bytes no macOS)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def cgroup_memory_limit() -> Optional[int]:
+    """Limite de memória do container (cgroup v2 ou v1), se houver um definido"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        try:
+            value = Path(path).read_text().strip()
+        except OSError:
+            continue
+        if value.isdigit() and int(value) < 1 << 60:  # v1 usa um número gigante para "sem limite"
+            return int(value)
+    return None
+
+def to_mb(value: Optional[int]) -> Optional[float]:
+    return round(value / MB, 1) if value is not None else None
+
+# tracemalloc deixa o pipeline dezenas de vezes mais lento: só liga quando pedido
+if os.environ.get('MEMORY_TRACEMALLOC', '0') == '1' and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+class StageTimer:
+    """Tempo, linhas de entrada/saída e memória por etapa de um arquivo ou job (etapas repetidas acumulam)"""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+
+    def begin(self, name: str, rows_in: Optional[int] = None) -> Dict[str, Any]:
+        mark = {"name": name, "rows_in": rows_in, "rows_out": None, "rss_before": current_rss_bytes(), "traced_base": None}
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            mark["traced_base"] = tracemalloc.get_traced_memory()[0]
+        mark["start"] = time.perf_counter()
+        return mark
+
+    def end(self, mark: Dict[str, Any]) -> None:
+        seconds = time.perf_counter() - mark["start"]
+        peak_traced = None
+        if mark["traced_base"] is not None and tracemalloc.is_tracing():
+            peak_traced = max(tracemalloc.get_traced_memory()[1] - mark["traced_base"], 0)
+        entry = self.stages.setdefault(mark["name"], {
+            "seconds": 0.0, "rows_in": None, "rows_out": None,
+            "rss_before": mark["rss_before"], "rss_after": None, "peak_traced": None
+        })
+        entry["seconds"] += seconds
+        entry["rss_after"] = current_rss_bytes()
+        if peak_traced is not None:
+            entry["peak_traced"] = max(entry["peak_traced"] or 0, peak_traced)
+        for key in ("rows_in", "rows_out"):
+            if mark[key] is not None:
+                entry[key] = mark[key]
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None):
+        mark = self.begin(name, rows_in)
+        try:
+            yield mark
+        finally:
+            self.end(mark)
+
+    def peak_rss(self) -> Optional[int]:
+        values = [v for entry in self.stages.values() for v in (entry["rss_before"], entry["rss_after"]) if v is not None]
+        return max(values) if values else None
+
+    def peak_traced(self) -> Optional[int]:
+        values = [entry["peak_traced"] for entry in self.stages.values() if entry["peak_traced"] is not None]
+        return max(values) if values else None
+
+    def summary(self) -> Dict[str, StageTiming]:
+        return {
+            name: StageTiming(
+                seconds=round(entry["seconds"], 4),
+                rows_in=entry["rows_in"],
+                rows_out=entry["rows_out"],
+                rss_before_mb=to_mb(entry["rss_before"]),
+                rss_after_mb=to_mb(entry["rss_after"]),
+                peak_traced_mb=to_mb(entry["peak_traced"])
+            )
+            for name, entry in self.stages.items()
+        }
+
+def timed_stage(timer: Optional[StageTimer], name: str, rows_in: Optional[int] = None):
+    """timer.stage(...) ou um contexto vazio quando a função é chamada fora de um job"""
+    return timer.stage(name, rows_in) if timer is not None else contextlib.nullcontext({})
+
+class PipelineMetrics:
+    """Histogramas e contadores do processo, expostos no formato texto do Prometheus em /metrics"""
+
+    DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+    BYTES_BUCKETS = tuple(mb * MB for mb in (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+    BUCKETS = {
+        "qfaz_stage_peak_traced_bytes": BYTES_BUCKETS,
+        "qfaz_job_peak_rss_bytes": BYTES_BUCKETS,
+    }
+
+    HELP = {
+        "qfaz_stage_duration_seconds": ("histogram", "Duração de cada etapa do pipeline por banco"),
+        "qfaz_stage_rows_in_total": ("counter", "Linhas recebidas por etapa e banco"),
+        "qfaz_stage_rows_out_total": ("counter", "Linhas produzidas por etapa e banco"),
+        "qfaz_files_processed_total": ("counter", "Arquivos de banco processados por resultado"),
+        "qfaz_jobs_total": ("counter", "Jobs de processamento por status final"),
+        "qfaz_job_duration_seconds": ("histogram", "Duração total dos jobs de processamento"),
+        "qfaz_job_output_rows_total": ("counter", "Linhas gravadas no CSV final"),
+        "qfaz_stage_rss_after_bytes": ("gauge", "RSS do processo ao fim da última execução da etapa por banco"),
+        "qfaz_stage_peak_traced_bytes": ("histogram", "Pico de alocação rastreada (tracemalloc) por etapa e banco"),
+        "qfaz_job_peak_rss_bytes": ("histogram", "Pico de RSS observado por job"),
+        "qfaz_memory_budget_warnings_total": ("counter", "Jobs cujo pico projetado/observado chegou perto do orçamento"),
+        "qfaz_memory_budget_bytes": ("gauge", "Orçamento de memória configurado (MEMORY_BUDGET_MB ou limite do cgroup)"),
+        "qfaz_process_resident_memory_bytes": ("gauge", "RSS atual do processo"),
+        "qfaz_process_peak_resident_memory_bytes": ("gauge", "Maior RSS já atingido pelo processo"),
+        "qfaz_uploads_decompressed_total": ("counter", "Uploads compactados descompactados por formato"),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[tuple, float] = defaultdict(float)
+        self._gauges: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, list] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> tuple:
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        with self._lock:
+            self._counters[self._key(name, labels)] += value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = self.BUCKETS.get(name, self.DURATION_BUCKETS)
+        with self._lock:
+            hist = self._histograms.setdefault(self._key(name, labels), [[0] * len(buckets), 0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def record_stages(self, bank: str, timer: StageTimer) -> None:
+        for stage, entry in timer.stages.items():
+            self.observe("qfaz_stage_duration_seconds", entry["seconds"], stage=stage, bank=bank)
+            if entry["rows_in"] is not None:
+                self.inc("qfaz_stage_rows_in_total", entry["rows_in"], stage=stage, bank=bank)
+            if entry["rows_out"] is not None:
+                self.inc("qfaz_stage_rows_out_total", entry["rows_out"], stage=stage, bank=bank)
+            if entry["rss_after"] is not None:
+                self.set("qfaz_stage_rss_after_bytes", entry["rss_after"], stage=stage, bank=bank)
+            if entry["peak_traced"] is not None:
+                self.observe("qfaz_stage_peak_traced_bytes", entry["peak_traced"], stage=stage, bank=bank)
+
+    @staticmethod
+    def _labels(labels: tuple, extra: Optional[tuple] = None) -> str:
+        pairs = list(labels) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        escaped = (v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {key: [list(h[0]), h[1], h[2]] for key, h in self._histograms.items()}
+        lines = []
+        for name, (metric_type, help_text) in self.HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type in ("counter", "gauge"):
+                values = counters if metric_type == "counter" else gauges
+                for (metric, labels), value in sorted(values.items()):
+                    if metric == name:
+                        lines.append(f"{name}{self._labels(labels)} {int(value) if float(value).is_integer() else value}")
+                continue
+            bounds = self.BUCKETS.get(name, self.DURATION_BUCKETS)
+            for (metric, labels), (buckets, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, bucket_count in zip(bounds, buckets):
+                    lines.append(f"{name}_bucket{self._labels(labels, ('le', f'{bound:g}'))} {bucket_count}")
+                lines.append(f"{name}_bucket{self._labels(labels, ('le', '+Inf'))} {count}")
+                lines.append(f"{name}_sum{self._labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{self._labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+pipeline_metrics = PipelineMetrics()
+
+class JobMemoryTracker:
+    """
+    Memória de um job inteiro: RSS no início/fim, pico observado nas etapas e projeção do pico
+    antes de processar cada arquivo (RSS atual + tamanho do arquivo x MEMORY_EXPANSION_FACTOR).
+    Avisa no log quando a projeção ou o pico observado passa de MEMORY_BUDGET_WARN_RATIO do orçamento.
+    """
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.budget = memory_budget_bytes
+        self.rss_start = current_rss_bytes()
+        self.high_water_start = peak_rss_bytes()
+        self.projected_peak = None
+        self.observed_peak = self.rss_start
+        self.peak_traced = None
+        self.warnings: List[str] = []
+        self._lock = threading.Lock()  # Arquivos de um lote ZIP reportam em paralelo
+
+    def _near_budget(self, value: Optional[int]) -> bool:
+        return bool(self.budget and value and value >= self.budget * MEMORY_BUDGET_WARN_RATIO)
+
+    def _warn(self, message: str) -> None:
+        logging.warning(f"⚠️ MEMÓRIA job {self.job_id}: {message}")
+        if not self.warnings:
+            pipeline_metrics.inc("qfaz_memory_budget_warnings_total")
+        self.warnings.append(message)
+
+    def project(self, filename: str, file_bytes: int) -> None:
+        rss = current_rss_bytes()
+        if rss is None:
+            return
+        projected = rss + file_bytes * MEMORY_EXPANSION_FACTOR
+        with self._lock:
+            self.projected_peak = max(self.projected_peak or 0, projected)
+            if self._near_budget(projected):
+                self._warn(f"pico projetado {to_mb(projected)} MB para '{filename}' ({to_mb(file_bytes)} MB) "
+                           f"perto do orçamento de {to_mb(self.budget)} MB")
+
+    def observe(self, timer: StageTimer) -> None:
+        traced = timer.peak_traced()
+        with self._lock:
+            self.observed_peak = max(v for v in (self.observed_peak, timer.peak_rss(), 0) if v is not None)
+            if traced is not None:
+                self.peak_traced = max(self.peak_traced or 0, traced)
+
+    def report(self) -> Dict[str, Any]:
+        # Se o pico do processo subiu durante o job, foi este job que o atingiu
+        high_water_end = peak_rss_bytes()
+        if high_water_end and self.high_water_start and high_water_end > self.high_water_start:
+            self.observed_peak = max(self.observed_peak or 0, high_water_end)
+        if self._near_budget(self.observed_peak):
+            self._warn(f"pico observado {to_mb(self.observed_peak)} MB perto do orçamento de {to_mb(self.budget)} MB")
+        if self.observed_peak:
+            pipeline_metrics.observe("qfaz_job_peak_rss_bytes", self.observed_peak)
+        return {
+            "rss_start_mb": to_mb(self.rss_start),
+            "rss_end_mb": to_mb(current_rss_bytes()),
+            "rss_peak_mb": to_mb(self.observed_peak),
+            "projected_peak_mb": to_mb(self.projected_peak),
+            "peak_traced_mb": to_mb(self.peak_traced),
+            "budget_mb": to_mb(self.budget),
+            "budget_warnings": self.warnings,
+        }
+
+# Orçamento de memória: MEMORY_BUDGET_MB ou, na falta dele, o limite do container
+memory_budget_bytes = (
+    int(os.environ['MEMORY_BUDGET_MB']) * MB if os.environ.get('MEMORY_BUDGET_MB') else cgroup_memory_limit()
+)
+MEMORY_BUDGET_WARN_RATIO = float(os.environ.get('MEMORY_BUDGET_WARN_RATIO', '0.8'))
+# Bytes em memória por byte de arquivo durante o pipeline (DataFrame de strings + cópias das etapas)
+MEMORY_EXPANSION_FACTOR = float(os.environ.get('MEMORY_EXPANSION_FACTOR', '12'))
+if memory_budget_bytes:
+    pipeline_metrics.set("qfaz_memory_budget_bytes", memory_budget_bytes)
+
+class JobProfiler:
+    """
+    Perfil de um job sob demanda: cProfile (funções por tempo cumulativo) e amostragem
+    periódica da pilha da thread do job, exportada em formato collapsed (flamegraph).
+    Só é criado quando o job pede; sem ele o pipeline não tem nenhum custo extra.
+    """
+
+    SAMPLE_INTERVAL = 0.005
+    TOP_FUNCTIONS = 50
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.stacks: Dict[str, int] = defaultdict(int)
+        self.samples = 0
+        self.started_at = None
+        self.wall_seconds = 0.0
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="job-profiler", daemon=True)
+        self._running = False
+
+    def start(self) -> None:
+        self.started_at = time.perf_counter()
+        self._running = True
+        self._sampler.start()
+        self.profile.enable()
+
+    def stop(self) -> None:
+        """Idempotente: pode ser chamado no caminho de sucesso e de novo no finally"""
+        if not self._running:
+            return
+        self.profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        self.wall_seconds = time.perf_counter() - self.started_at
+        self._running = False
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self._thread_id)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+                self.samples += 1
+
+    def top_functions(self) -> List[Dict[str, Any]]:
+        stats = pstats.Stats(self.profile).stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:self.TOP_FUNCTIONS]
+        return [
+            {
+                "function": function_name,
+                "file": filename,
+                "line": lineno,
+                "calls": calls,
+                "primitive_calls": primitive_calls,
+                "total_seconds": round(total_time, 6),
+                "cumulative_seconds": round(cumulative_time, 6),
+            }
+            for (filename, lineno, function_name), (primitive_calls, calls, total_time, cumulative_time, _) in ranked
+        ]
+
+    def collapsed_stacks(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def report(self, job_id: str) -> Dict[str, Any]:
+        return {
+            "job_id": job_id,
+            "wall_seconds": round(self.wall_seconds, 4),
+            "sample_interval_seconds": self.SAMPLE_INTERVAL,
+            "samples": self.samples,
+            "top_functions": self.top_functions(),
+            "collapsed_stacks": self.collapsed_stacks(),
+        }
+
+def save_job_profile(job_id: str, profiler: Optional[JobProfiler]) -> Optional[str]:
+    """Encerra o profiler e grava o perfil junto do resultado do job"""
+    if profiler is None:
+        return None
+    profiler.stop()
+    try:
+        path = result_store.put(job_id, json.dumps(profiler.report(job_id), ensure_ascii=False), suffix=".profile.json")
+        logging.info(f"🔬 Perfil do job {job_id} gravado: {profiler.samples} amostras, {profiler.wall_seconds:.2f}s")
+        return path
+    except Exception as e:
+        logging.warning(f"⚠️ Falha ao gravar perfil do job {job_id}: {str(e)}")
+        return None
 
 # ===== MAPEAMENTOS COMPLETOS MELHORADOS =====
 
@@ -274,9 +736,7 @@ OPERATION_TYPES = {
     "Cartão c/ saque complementar à vista": "CARTÃO C/ SAQUE COMPLEMENTAR À VISTA"
 }
 
-# Global storage for processing state
-processing_jobs = {}
-storm_data_global = {}
+# Estado de processamento (jobs e índice Storm) fica em SQLite - ver JobRegistry e StormIndexStore
 
 # 🌍 FUNÇÕES GLOBAIS DE FORMATAÇÃO (aplicadas a TODOS os bancos)
 
@@ -392,6 +852,296 @@ def format_percentage_brazilian(percentage_str):
         logging.warning(f"⚠️ Erro ao formatar percentual '{percentage_str}': {e}")
         return f"{str(percentage_str).strip()}%"
 
+# 🌎 VERSÕES VETORIZADAS (pd.Series) - mesmas regras das funções acima, coluna inteira de uma vez
+
+# Strings que float() aceita sem ambiguidade; o resto vai para a função escalar
+_PLAIN_NUMBER_PATTERN = r'[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?'
+
+def _falsy_mask(values: pd.Series, text: pd.Series) -> pd.Series:
+    """Equivalente vetorizado de `not valor` (None, '', 0, False); `text` = str(valor).strip()
+    Só os poucos candidatos passam pelo teste em Python - NaN é "verdadeiro" e não entra"""
+    candidates = text.isin(['', '0', '0.0', '-0.0', 'False', 'None'])
+    mask = pd.Series(False, index=values.index)
+    if candidates.any():
+        mask[candidates] = [not v for v in values[candidates]]
+    return mask
+
+def _digits_only(text: pd.Series) -> pd.Series:
+    """Remove tudo que não é dígito; valores que já são só dígitos não passam pela regex"""
+    digits = text.copy()
+    needs_cleaning = ~text.str.isdecimal()
+    if needs_cleaning.any():
+        digits[needs_cleaning] = text[needs_cleaning].str.replace(r'\D', '', regex=True)
+    return digits
+
+def _apply_on_uniques(values: pd.Series, formatter) -> pd.Series:
+    """Roda o formatador vetorizado só nos valores distintos e espalha o resultado pelos códigos.
+    Colunas com muitos repetidos (taxas, usuários, situações) ficam bem mais baratas assim"""
+    codes, uniques = pd.factorize(values)  # nulos recebem código -1
+    # factorize junta 1/1.0/True (iguais em Python mas com str() diferentes) - só vale para strings
+    if len(uniques) * 2 > len(values) or not all(isinstance(u, str) for u in uniques):
+        # Índice posicional para os formatadores poderem atribuir por máscara mesmo com rótulos repetidos
+        result = formatter(values.reset_index(drop=True))
+        result.index = values.index
+        return result
+    result = formatter(pd.Series(uniques, dtype=object)).to_numpy(dtype=object)[codes]
+    null_rows = codes == -1
+    if null_rows.any():
+        result[null_rows] = formatter(values[null_rows].reset_index(drop=True)).to_numpy(dtype=object)
+    return pd.Series(result, index=values.index, dtype=object)
+
+def transform_unique_values(values: pd.Series, transform) -> pd.Series:
+    """Aplica uma transformação célula a célula (limpeza, normalização Storm, STATUS_MAPPING...) só uma vez
+    por valor distinto e espalha o resultado pelos códigos. Mesma saída de values.map(transform)"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return _transform_categories(values, transform)
+    if values.empty:
+        return values.astype(object)
+    codes, uniques = pd.factorize(values)  # nulos recebem código -1
+    # factorize junta 1/1.0/True (iguais em Python mas com str() diferentes) - só vale para strings
+    if not all(isinstance(u, str) for u in uniques):
+        return values.map(transform).astype(object)
+    transformed = np.empty(len(uniques), dtype=object)
+    transformed[:] = [transform(u) for u in uniques]
+    result = transformed[codes]
+    null_rows = codes == -1
+    if null_rows.any():
+        result[null_rows] = [transform(v) for v in values.to_numpy(dtype=object)[null_rows]]
+    return pd.Series(result, index=values.index, dtype=object)
+
+def _transform_categories(values: pd.Series, transform) -> pd.Series:
+    """Coluna categórica: transforma só as categorias e continua categórica. Categorias que passam a
+    coincidir são fundidas; nulos continuam nulos"""
+    new_categories = pd.Series([transform(c) for c in values.cat.categories], dtype=object)
+    category_codes, merged = pd.factorize(new_categories)
+    codes = values.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, category_codes[np.maximum(codes, 0)], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=merged), index=values.index)
+
+# Transformações de texto chamadas dentro dos loops por linha: o mesmo valor repetido em milhares de
+# linhas sai do cache (typed=True mantém 1, 1.0 e True separados, como str() faria)
+unique_value_cache = functools.lru_cache(maxsize=8192, typed=True)
+
+def _format_cpf_digits(digits: pd.Series) -> pd.Series:
+    """11 dígitos → 000.000.000-00 (montado em matriz de caracteres numpy, sem concatenação por célula)"""
+    if digits.empty:
+        return digits.astype(object)
+    chars = digits.to_numpy().astype('U11').view('U1').reshape(-1, 11)
+    formatted = np.empty((len(chars), 14), dtype='U1')
+    formatted[:, 0:3] = chars[:, 0:3]
+    formatted[:, 3] = '.'
+    formatted[:, 4:7] = chars[:, 3:6]
+    formatted[:, 7] = '.'
+    formatted[:, 8:11] = chars[:, 6:9]
+    formatted[:, 11] = '-'
+    formatted[:, 12:14] = chars[:, 9:11]
+    return pd.Series(formatted.view('U14').ravel(), index=digits.index).astype(object)
+
+def format_cpf_series(cpf_series: pd.Series) -> pd.Series:
+    """Versão vetorizada de format_cpf_global: remove underscore de códigos de usuário,
+    formata CPFs com 11 dígitos e mantém o resto como veio"""
+    return _apply_on_uniques(cpf_series, _format_cpf_values)
+
+def _format_cpf_values(cpf_series: pd.Series) -> pd.Series:
+    if cpf_series.empty:
+        return cpf_series.astype(object)
+    values = cpf_series if cpf_series.dtype == object else cpf_series.astype(object)
+    text = values.astype(str).str.strip()
+    digits = _digits_only(text)
+    
+    has_underscore = text.str.contains('_', regex=False)
+    is_cpf = ~has_underscore & digits.str.len().eq(11)
+    
+    result = text.copy()
+    if has_underscore.any():
+        result[has_underscore] = text[has_underscore].str.replace('_', '', regex=False)
+    if is_cpf.any():
+        result[is_cpf] = _format_cpf_digits(digits[is_cpf])
+    result[_falsy_mask(values, text)] = ""
+    return result
+
+def format_usuario_banco_series(usuario_series: pd.Series) -> pd.Series:
+    """USUARIO BANCO no relatório final: códigos com underscore e códigos longos (> 14 dígitos)
+    ficam como vieram; CPF puro com 11 dígitos é formatado; vazio/'0'/CPF zerado vira ''"""
+    return _apply_on_uniques(usuario_series, _format_usuario_banco_values)
+
+def _format_usuario_banco_values(usuario_series: pd.Series) -> pd.Series:
+    if usuario_series.empty:
+        return usuario_series.astype(object)
+    values = usuario_series if usuario_series.dtype == object else usuario_series.astype(object)
+    text = values.astype(str).str.strip()
+    digits = _digits_only(text)
+    
+    is_cpf = ~text.str.contains('_', regex=False) & digits.str.len().eq(11)
+    result = text.copy()
+    if is_cpf.any():
+        result[is_cpf] = _format_cpf_digits(digits[is_cpf])
+    result[_falsy_mask(values, text) | values.isin(['0', '000.000.000-00'])] = ''
+    return result
+
+def format_percentage_series(percentage_series: pd.Series) -> pd.Series:
+    """Versão vetorizada de format_percentage_brazilian (1,85%)"""
+    return _apply_on_uniques(percentage_series, _format_percentage_values)
+
+def _format_percentage_values(percentage_series: pd.Series) -> pd.Series:
+    if percentage_series.empty:
+        return percentage_series.astype(object)
+    values = percentage_series if percentage_series.dtype == object else percentage_series.astype(object)
+    stripped = values.astype(str).str.strip()
+    clean = stripped.str.replace('%', '', regex=False).str.replace(' ', '', regex=False)
+    
+    zero = _falsy_mask(values, stripped) | stripped.isin(['', 'nan', 'None', 'null', 'NaN']) | clean.isin(['', '0'])
+    number_text = clean.str.replace(',', '.', regex=False)
+    numeric = ~zero & number_text.str.fullmatch(_PLAIN_NUMBER_PATTERN).fillna(False).astype(bool)
+    
+    result = pd.Series("0,00%", index=values.index, dtype=object)
+    if numeric.any():
+        numbers = number_text[numeric].astype(float)
+        result[numeric] = numbers.map('{:.2f}'.format).str.replace('.', ',', regex=False) + '%'
+    
+    # Valores fora do padrão simples (inf, 1_0, etc.) seguem a regra escalar
+    stragglers = ~zero & ~numeric
+    if stragglers.any():
+        result[stragglers] = values[stragglers].map(format_percentage_brazilian)
+    return result
+
+# 💰 VALORES MONETÁRIOS POR COLUNA - centavos exatos em int64, convenção BR/US decidida por coluna
+#
+# Um único str.extract separa sinal, parte inteira (com ou sem milhares agrupados) e decimais; as regras
+# de format_value_brazilian viram comparações entre essas colunas. O que não tem essa forma (letras,
+# sinais no meio, números enormes, -0) segue na regra individual, que registra o que não consegue ler.
+
+_MONEY_MAX_CHARS = 40            # textos maiores vão direto para a regra individual
+_MONEY_MAX_INTEGER_DIGITS = 13   # até aqui o float() da regra individual representa os centavos exatos
+_MONEY_PATTERN = (
+    r'^(?P<sign>[+-]?)'
+    r'(?:(?P<lead>[0-9]{1,3})(?P<sep>[.,])(?P<group>[0-9]{3})(?P<groups>(?:(?P=sep)[0-9]{3}){0,3})'
+    r'|(?P<digits>[0-9]{1,13}))'
+    r'(?:(?P<dec>[.,])(?P<frac>[0-9]*))?\Z'
+)
+# Evidência de convenção nas células fora do padrão acima: o último separador tem 1-2 casas depois
+# (12,.5 não conta como US: a regra individual já o mantém como veio, como texto BR)
+_MONEY_BR_EVIDENCE = r'[+-]?[0-9.]*,[0-9]{1,2}'
+_MONEY_US_EVIDENCE = r'(?![0-9]+,\.[0-9]\Z)[+-]?[0-9,]*\.[0-9]{1,2}'
+_CENTS_TEXT = np.array([f"{c:02d}" for c in range(100)], dtype=object)
+_MONEY_SEPARATORS = str.maketrans('', '', '.,')
+
+def infer_money_locale(br_evidence: np.ndarray, us_evidence: np.ndarray) -> Optional[str]:
+    """
+    'BR', 'US' ou None para a coluna inteira, contando só as células que não deixam dúvida:
+    vírgula decimal com 1-2 casas (87,5 / 1.234,56) é BR; ponto decimal com 1-2 casas (87.5 / 1,234.56) é US.
+    Sem evidência ou empate: None - cada célula segue a regra individual de sempre.
+    """
+    br_count, us_count = int(br_evidence.sum()), int(us_evidence.sum())
+    if br_count == us_count:
+        return None
+    return "BR" if br_count > us_count else "US"
+
+def _format_cents(cents: pd.Series) -> np.ndarray:
+    """Centavos int64 → textos 1.255,00 (mesma saída de format_value_brazilian: negativos sem ponto de milhar)"""
+    negative = (cents < 0).to_numpy()
+    magnitude = cents.abs().to_numpy()
+    integer = (magnitude // 100).astype(str).astype(object)
+    grouped = ~negative & (magnitude >= 100_000)
+    if grouped.any():
+        integer[grouped] = [f"{v:,}".replace(',', '.') for v in (magnitude[grouped] // 100).tolist()]
+    return np.where(negative, '-', '').astype(object) + integer + ',' + _CENTS_TEXT[magnitude % 100]
+
+def _parse_money_text(text: pd.Series):
+    """
+    Lê textos de valor em lote. Retorna (resultado, resolvido, locale): `resultado` traz o texto final
+    onde `resolvido` é True; as outras linhas precisam da regra individual.
+    """
+    result = pd.Series(None, index=text.index, dtype=object)
+    clean = text.copy()
+    parts = text.str.extract(_MONEY_PATTERN)
+    missed = parts['sign'].isna()
+    if missed.any():
+        # Remove 'R$' e depois espaços/nbsp como format_value_brazilian, só onde precisa; outros brancos
+        # (tab, quebra de linha) ficam para a regra individual
+        clean[missed] = text[missed].str.replace('R$', '', regex=False).str.replace(r'[ \xa0]', '', regex=True)
+        parts.loc[missed] = clean[missed].str.extract(_MONEY_PATTERN)
+        missed = parts['sign'].isna()
+    zero = missed & (clean == '')
+    result[zero] = "0,00"
+    
+    matched = ~missed
+    grouped = parts['lead'].notna()
+    dot_groups, comma_groups = parts['sep'] == '.', parts['sep'] == ','
+    comma_decimal, dot_decimal = parts['dec'] == ',', parts['dec'] == '.'
+    frac = parts['frac'].fillna('')
+    frac_length = frac.str.len()
+    # Já no formato brasileiro (uma vírgula com duas casas, ponto ou só dígitos antes): mantém o texto
+    passthrough = comma_decimal & (frac_length == 2) & (dot_groups | (~grouped & (parts['sign'] == '')))
+    result[passthrough] = clean[passthrough]
+    
+    # Células que não deixam dúvida sobre a convenção: o último separador tem 1-2 casas depois
+    short_tail = frac_length.between(1, 2)
+    br_evidence = comma_decimal & ~comma_groups & short_tail
+    us_evidence = dot_decimal & ~dot_groups & short_tail
+    leftover = missed & ~zero
+    if leftover.any():
+        # fullmatch em coluna object volta object (NaN onde não é texto): vira bool antes de entrar na máscara
+        br_evidence[leftover] = clean[leftover].str.fullmatch(_MONEY_BR_EVIDENCE).to_numpy(dtype=bool, na_value=False)
+        us_evidence[leftover] = clean[leftover].str.fullmatch(_MONEY_US_EVIDENCE).to_numpy(dtype=bool, na_value=False)
+    locale = infer_money_locale(br_evidence.to_numpy(dtype=bool), us_evidence.to_numpy(dtype=bool))
+    
+    # Regra individual: sem vírgula o primeiro ponto é o decimal, com vírgula os pontos somem e a primeira
+    # vírgula é o decimal - então 1.234 vira 1,23. Milhares da convenção da coluna valem a parte inteira toda
+    full = dot_groups & comma_decimal
+    if locale == "BR":
+        full |= dot_groups & parts['dec'].isna()
+    elif locale == "US":
+        full |= comma_groups & ~comma_decimal
+    integer = parts['digits'].where(~grouped, parts['lead'])
+    decimals = frac.where(~grouped, parts['group'])
+    if full.any():
+        integer[full] = (parts.loc[full, 'lead'] + parts.loc[full, 'group']
+                         + parts.loc[full, 'groups'].str.translate(_MONEY_SEPARATORS))
+        decimals[full] = frac[full]
+    
+    numeric = matched & ~passthrough
+    if not numeric.any():
+        return result, zero | passthrough, locale
+    units = integer[numeric].astype(np.int64)
+    cents = units * 100 + (decimals[numeric] + '00').str[:2].astype(np.int64)
+    negative = parts.loc[numeric, 'sign'] == '-'
+    # Acima de 13 dígitos e -0,00 ficam com a regra individual
+    numeric[numeric] = ((units < 10 ** _MONEY_MAX_INTEGER_DIGITS) & ~(negative & (cents == 0))).to_numpy(dtype=bool)
+    cents = cents.where(~negative, -cents)[numeric[cents.index]]
+    result[cents.index] = _format_cents(cents)
+    return result, zero | passthrough | numeric, locale
+
+def format_money_series(series: pd.Series, column_name: str = "") -> pd.Series:
+    """
+    Versão vetorizada de format_value_brazilian para uma coluna inteira. A convenção de milhar
+    (1.234 como mil e duzentos no BR, 1,234.56 no US) é decidida uma vez pela coluna, então
+    células ambíguas seguem as demais em vez de virarem centavos.
+    """
+    return _apply_on_uniques(series, lambda values: _format_money_values(values, column_name))
+
+def _format_money_values(values: pd.Series, column_name: str) -> pd.Series:
+    result = pd.Series(np.empty(len(values), dtype=object), index=values.index)
+    if values.empty:
+        return result
+    raw = values.to_numpy(dtype=object)
+    is_text = np.fromiter((isinstance(v, str) and len(v) <= _MONEY_MAX_CHARS for v in raw), dtype=bool, count=len(raw))
+    resolved = np.zeros(len(raw), dtype=bool)
+    if is_text.any():
+        parsed, parsed_ok, locale = _parse_money_text(pd.Series(raw[is_text], dtype=object))
+        if locale:
+            logging.debug(f"💰 {column_name or 'valores'}: convenção {locale} inferida pela coluna")
+        parsed_ok = parsed_ok.to_numpy(dtype=bool)
+        text_rows = np.flatnonzero(is_text)
+        result.iloc[text_rows[parsed_ok]] = parsed.to_numpy(dtype=object)[parsed_ok]
+        resolved[text_rows[parsed_ok]] = True
+    # O resto segue a regra individual, que já registra as células que não consegue ler
+    stragglers = ~resolved
+    if stragglers.any():
+        result.iloc[np.flatnonzero(stragglers)] = [format_value_brazilian(v) for v in raw[stragglers]]
+    return result
+
+@unique_value_cache
 def clean_special_characters(text):
     """
     Remove ou substitui caracteres especiais problemáticos que quebram o processamento
@@ -497,70 +1247,72 @@ def clean_contact_field(value, field_name=""):
     # Se passou na validação, retornar valor limpo
     return clean_value
 
-def fix_daycoval_date(date_str, field_name=""):
+DAYCOVAL_ISO_DATE_PATTERN = r'^(\d{4})-(\d{1,2})-(\d{1,2})(\s+\d{2}:\d{2}:\d{2})?$'
+DAYCOVAL_SLASH_DATE_PATTERN = r'^(\d{1,2})/(\d{1,2})/(\d{4})$'
+
+def infer_daycoval_date_order(first: pd.Series, second: pd.Series) -> tuple[str, Dict[str, int]]:
     """
-    CORRECAO ESPECIFICA DAYCOVAL: 
-    Converte múltiplos formatos para DD/MM/YYYY (formato brasileiro)
-    Aceita: YYYY-MM-DD HH:MM:SS, MM/DD/YYYY, DD/MM/YYYY
-    MESMA LÓGICA DO VCTEX QUE FUNCIONOU
+    Decide uma única ordem (DD/MM ou MM/DD) para a coluna inteira a partir das datas que
+    não deixam dúvida: primeiro número > 12 é DD/MM, segundo número > 12 é MM/DD.
+    Sem evidência (ou empate) mantém MM/DD, que era o que o DAYCOVAL assumia antes.
     """
-    if not date_str or pd.isna(date_str) or str(date_str).strip() == "" or str(date_str).strip().lower() == 'nan':
-        logging.warning(f"DAYCOVAL {field_name}: Formato não reconhecido: '{date_str}'")
-        return ""
-    
-    import re
-    from datetime import datetime
-    
-    date_clean = str(date_str).strip()
-    
-    # Se for 'nan', retornar vazio
-    if date_clean.lower() == 'nan':
-        logging.warning(f"DAYCOVAL {field_name}: Formato não reconhecido: '{date_clean}'")
-        return ""
-    
-    logging.info(f"DAYCOVAL {field_name}: PROCESSANDO DATA '{date_clean}' - LÓGICA MÚLTIPLOS FORMATOS!")
-    
-    try:
-        # 🔥 NOVO: Formato YYYY-MM-DD HH:MM:SS (como '2025-10-01 00:00:00')
-        iso_pattern = re.match(r'^(\d{4})-(\d{1,2})-(\d{1,2})(\s+\d{2}:\d{2}:\d{2})?$', date_clean)
-        if iso_pattern:
-            year, month, day = iso_pattern.groups()[:3]
-            # Converter para DD/MM/YYYY
-            fixed_date = f"{day.zfill(2)}/{month.zfill(2)}/{year}"
-            logging.info(f"DAYCOVAL {field_name}: '{date_clean}' -> '{fixed_date}' (ISO convertido)")
-            return fixed_date
-        
-        # Formato XX/YY/YYYY (lógica original)
-        us_date_pattern = re.match(r'^(\d{1,2})/(\d{1,2})/(\d{4})$', date_clean)
-        if us_date_pattern:
-            first_num, second_num, year = us_date_pattern.groups()
-            
-            first_int = int(first_num)
-            second_int = int(second_num)
-            
-            # Se primeiro numero > 12, entao esta no formato DD/MM (brasileiro) - MANTER
-            if first_int > 12:
-                logging.info(f"DAYCOVAL {field_name}: '{date_clean}' mantido (já DD/MM/YYYY)")
-                return date_clean
-            
-            # Se segundo numero > 12, entao esta no formato MM/DD (americano) - TROCAR
-            elif second_int > 12:
-                fixed_date = f"{second_num}/{first_num}/{year}"  # DD/MM/YYYY
-                logging.info(f"DAYCOVAL {field_name}: '{date_clean}' -> '{fixed_date}' (MM/DD convertido)")
-                return fixed_date
-            
-            # Caso ambiguo (ambos <= 12): assumir formato americano MM/DD e converter para DD/MM
-            elif first_int <= 12 and second_int <= 12:
-                fixed_date = f"{second_num}/{first_num}/{year}"  # DD/MM/YYYY
-                logging.info(f"DAYCOVAL {field_name}: '{date_clean}' -> '{fixed_date}' (assumido MM/DD)")
-                return fixed_date
+    evidence = {"DD/MM": int((first > 12).sum()), "MM/DD": int((second > 12).sum())}
+    order = "DD/MM" if evidence["DD/MM"] > evidence["MM/DD"] else "MM/DD"
+    return order, evidence
+
+def fix_daycoval_date_column(dates: pd.Series, field_name: str = "") -> tuple[pd.Series, Dict[str, Any]]:
+    """
+    CORRECAO ESPECIFICA DAYCOVAL (por coluna):
+    Converte YYYY-MM-DD [HH:MM:SS], MM/DD/YYYY e DD/MM/YYYY para DD/MM/YYYY (formato brasileiro).
+    A ordem dia/mês das datas ambíguas (ambos <= 12) é inferida uma vez para a coluna inteira,
+    então o mesmo arquivo nunca mistura as duas interpretações.
+    Retorna a coluna corrigida e um relatório com a ordem escolhida e as linhas ambíguas.
+    """
+    text = dates.astype(str).str.strip()
+    result = pd.Series("", index=dates.index, dtype=object)
+    
+    empty = dates.isna() | text.eq('') | text.str.lower().eq('nan')
+    
+    # Formato YYYY-MM-DD HH:MM:SS (como '2025-10-01 00:00:00')
+    iso = text.str.extract(DAYCOVAL_ISO_DATE_PATTERN)
+    is_iso = ~empty & iso[0].notna()
+    if is_iso.any():
+        result[is_iso] = iso.loc[is_iso, 2].str.zfill(2) + '/' + iso.loc[is_iso, 1].str.zfill(2) + '/' + iso.loc[is_iso, 0]
+    
+    # Formato XX/YY/YYYY
+    slash = text.str.extract(DAYCOVAL_SLASH_DATE_PATTERN)
+    is_slash = ~empty & ~is_iso & slash[0].notna()
+    first = slash.loc[is_slash, 0].astype(int)
+    second = slash.loc[is_slash, 1].astype(int)
+    order, evidence = infer_daycoval_date_order(first, second)
+    
+    swapped = slash.loc[is_slash, 1] + '/' + slash.loc[is_slash, 0] + '/' + slash.loc[is_slash, 2]
+    # Primeiro > 12 já é DD/MM; segundo > 12 é MM/DD; ambíguos seguem a ordem da coluna
+    keep = (first > 12) | ((second <= 12) & (order == "DD/MM"))
+    result[is_slash] = text[is_slash].where(keep, swapped)
+    
+    ambiguous = (first <= 12) & (second <= 12) & (first != second)
+    unrecognized = ~empty & ~is_iso & ~is_slash
+    
+    report = {
+        "field": field_name,
+        "order": order,
+        "evidence": evidence,
+        "ambiguous_rows": int(ambiguous.sum()),
+        "ambiguous_sample": [str(idx) for idx in ambiguous[ambiguous].index[:20]],
+        "unrecognized_rows": int(unrecognized.sum()),
+    }
     
-    except Exception as e:
-        logging.error(f"DAYCOVAL {field_name}: Erro ao processar '{date_clean}': {e}")
+    logging.info(f"📅 DAYCOVAL {field_name}: ordem {order} (evidência DD/MM={evidence['DD/MM']}, MM/DD={evidence['MM/DD']}), "
+                 f"{int(is_iso.sum())} ISO, {report['ambiguous_rows']} ambíguas, {report['unrecognized_rows']} não reconhecidas")
+    if evidence["DD/MM"] and evidence["MM/DD"]:
+        logging.warning(f"⚠️ DAYCOVAL {field_name}: arquivo mistura datas DD/MM e MM/DD - ambíguas seguem {order}")
+    elif report["ambiguous_rows"] and not (evidence["DD/MM"] or evidence["MM/DD"]):
+        logging.warning(f"⚠️ DAYCOVAL {field_name}: {report['ambiguous_rows']} datas ambíguas sem evidência de ordem - assumido {order}")
+    if report["unrecognized_rows"]:
+        logging.warning(f"⚠️ DAYCOVAL {field_name}: {report['unrecognized_rows']} datas em formato não reconhecido ficaram vazias")
     
-    # Se nao reconhecer nenhum formato, retornar vazio 
-    logging.warning(f"DAYCOVAL {field_name}: Formato não reconhecido: '{date_clean}'")
-    return ""
+    return result, report
 
 def map_daycoval_columns(row):
     """
@@ -612,6 +1364,7 @@ def map_daycoval_columns(row):
     
     return mapped_data
 
+@unique_value_cache
 def normalize_storm_operation(operation_str):
     """
     🚨 NORMALIZAÇÃO STORM: Operações padronizadas SEM ACENTOS
@@ -627,6 +1380,7 @@ def normalize_storm_operation(operation_str):
     # Depois aplicar mapeamento Storm
     return STORM_OPERATIONS_MAPPING.get(operation_clean.upper(), operation_clean)
 
+@unique_value_cache
 def normalize_storm_organ(organ_str):
     """
     🚨 NORMALIZAÇÃO STORM: Órgãos padronizados SEM ACENTOS
@@ -911,7 +1665,7 @@ def apply_character_cleaning_to_dataframe(df: pd.DataFrame, filename: str = "")
     cleaned_columns = 0
     for column in df.columns:
         if df[column].dtype == 'object':  # Colunas de texto
-            df[column] = df[column].astype(str).apply(clean_special_characters)
+            df[column] = transform_unique_values(df[column].astype(str), clean_special_characters)
             cleaned_columns += 1
     
     if cleaned_columns > 0 and filename:
@@ -1015,9 +1769,9 @@ def load_organ_mapping():
                     }
                     
                     # 🔍 DEBUG: Log primeiras 3 linhas FACTA
-                    if 'FACTA' in banco and len([k for k in tabela_mapping.keys() if 'FACTA' in k]) <= 3:
-                        logging.info(f"🔍 DEBUG TABELA_MAPPING FACTA: Chave='{tabela_key}'")
-                        logging.info(f"   Valores: codigo={codigo_tabela}, orgao={orgao}, operacao={operacao_storm}, taxa={taxa_storm}")
+                    if 'FACTA' in banco and logging.getLogger().isEnabledFor(logging.DEBUG) and len([k for k in tabela_mapping.keys() if 'FACTA' in k]) <= 3:
+                        logging.debug(f"🔍 DEBUG TABELA_MAPPING FACTA: Chave='{tabela_key}'")
+                        logging.debug(f"   Valores: codigo={codigo_tabela}, orgao={orgao}, operacao={operacao_storm}, taxa={taxa_storm}")
                 
                 # Mapeamento genérico por BANCO|ORGÃO (para fallback quando operação não bate exatamente)
                 bank_organ_key = f"{banco}|{orgao}"
@@ -1034,31 +1788,68 @@ def load_organ_mapping():
         logging.info(f"Mapeamento carregado: {len(mapping)} bancos, {len(detailed_mapping)} combinações banco+orgao+operacao, {len(tabela_mapping)} por tabela específica, {len(bank_organ_mapping)} por banco+orgao")
         
         # 🔍 DEBUG: Mostrar primeiras chaves FACTA no TABELA_MAPPING
-        facta_keys = [k for k in tabela_mapping.keys() if 'FACTA' in k]
+        facta_keys = [k for k in tabela_mapping.keys() if 'FACTA' in k] if logging.getLogger().isEnabledFor(logging.DEBUG) else []
         if facta_keys:
-            logging.info(f"🔍 DEBUG: Primeiras {min(3, len(facta_keys))} chaves FACTA no TABELA_MAPPING:")
+            logging.debug(f"🔍 DEBUG: Primeiras {min(3, len(facta_keys))} chaves FACTA no TABELA_MAPPING:")
             for key in facta_keys[:3]:
-                logging.info(f"   Chave: '{key}'")
-                logging.info(f"   Dados: {tabela_mapping[key]}")
+                logging.debug(f"   Chave: '{key}'")
+                logging.debug(f"   Dados: {tabela_mapping[key]}")
         
         return mapping, detailed_mapping, tabela_mapping, bank_organ_mapping
     except Exception as e:
         logging.error(f"Erro ao carregar mapeamento de órgãos: {str(e)}")
         return {}, {}, {}, {}
 
-# Carregar mapeamento global - ATUALIZADO sem dependência de usuário
-try:
-    ORGAN_MAPPING, DETAILED_MAPPING, TABELA_MAPPING, BANK_ORGAN_MAPPING = load_organ_mapping()
-    logging.info("✅ Mapeamento de órgãos carregado com sucesso!")
-except Exception as e:
-    logging.error(f"❌ Erro ao carregar mapeamento: {e}")
-    ORGAN_MAPPING, DETAILED_MAPPING, TABELA_MAPPING, BANK_ORGAN_MAPPING = {}, {}, {}, {}
+# Mapeamento global - compilado em background no startup do app (ver start_organ_mapping_load)
+ORGAN_MAPPING, DETAILED_MAPPING, TABELA_MAPPING, BANK_ORGAN_MAPPING = {}, {}, {}, {}
+organ_mapping_ready = threading.Event()
+_organ_mapping_lock = threading.Lock()
+_organ_mapping_thread: Optional[threading.Thread] = None
+
+def _load_organ_mapping_globals() -> None:
+    global ORGAN_MAPPING, DETAILED_MAPPING, TABELA_MAPPING, BANK_ORGAN_MAPPING
+    start = time.perf_counter()
+    try:
+        ORGAN_MAPPING, DETAILED_MAPPING, TABELA_MAPPING, BANK_ORGAN_MAPPING = load_organ_mapping()
+        logging.info("✅ Mapeamento de órgãos carregado com sucesso!")
+    except Exception as e:
+        logging.error(f"❌ Erro ao carregar mapeamento: {e}")
+    finally:
+        startup_report.mapping_loaded(time.perf_counter() - start)
+        organ_mapping_ready.set()
+        report = startup_report.as_dict()
+        logging.info(
+            f"🚀 Cold start: import {report['import_seconds']}s {report['import_phases']}, "
+            f"mapeamento {report['mapping_seconds']}s, pronto em {report['ready_seconds']}s"
+        )
+
+def start_organ_mapping_load() -> None:
+    """Dispara a compilação do mapeamento numa thread (uma única vez por processo)"""
+    global _organ_mapping_thread
+    with _organ_mapping_lock:
+        if organ_mapping_ready.is_set() or _organ_mapping_thread is not None:
+            return
+        _organ_mapping_thread = threading.Thread(target=_load_organ_mapping_globals, name="organ-mapping", daemon=True)
+        _organ_mapping_thread.start()
+
+def ensure_organ_mapping(timeout: Optional[float] = None) -> bool:
+    """Garante o mapeamento pronto antes de usá-lo; fora do app (scripts, benchmarks) dispara o carregamento"""
+    if organ_mapping_ready.is_set():
+        return True
+    start_organ_mapping_load()
+    return organ_mapping_ready.wait(timeout)
+
+async def wait_for_organ_mapping() -> None:
+    """Espera o mapeamento sem travar o event loop (o /health continua respondendo)"""
+    if not organ_mapping_ready.is_set():
+        await asyncio.get_running_loop().run_in_executor(None, ensure_organ_mapping)
 
 def reload_organ_mapping():
     """Recarrega o mapeamento de órgãos para pegar novos códigos de tabela adicionados"""
     global ORGAN_MAPPING, DETAILED_MAPPING, TABELA_MAPPING, BANK_ORGAN_MAPPING
     try:
         logging.info("🔄 Recarregando mapeamento de órgãos...")
+        ensure_organ_mapping()  # Não corre contra a carga inicial em background
         ORGAN_MAPPING, DETAILED_MAPPING, TABELA_MAPPING, BANK_ORGAN_MAPPING = load_organ_mapping()
         logging.info("✅ Mapeamento recarregado com sucesso!")
         return True
@@ -1066,9 +1857,20 @@ def reload_organ_mapping():
         logging.error(f"❌ Erro ao recarregar mapeamento: {str(e)}")
         return False
 
-def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
-    """Leitura otimizada de arquivos com múltiplas tentativas e melhor detecção de separadores"""
+def read_file_optimized(file_content: bytes, filename: str, nrows: Optional[int] = None,
+                        profile: Optional[dict] = None, excel_file=None) -> pd.DataFrame:
+    """Leitura otimizada de arquivos com múltiplas tentativas e melhor detecção de separadores
+
+    nrows limita a leitura às primeiras linhas (espiada do cabeçalho) e, se `profile`
+    for informado, ele recebe os parâmetros da tentativa que deu certo (ver read_with_profile).
+    """
     file_ext = filename.lower().split('.')[-1]
+
+    def learned(df: pd.DataFrame, clean: bool = True, **params) -> pd.DataFrame:
+        if profile is not None:
+            profile.clear()
+            profile.update(params, clean=clean)
+        return apply_character_cleaning_to_dataframe(df, filename) if clean else df
     
     # Log para debug de QUERO MAIS
     filename_lower = filename.lower()
@@ -1091,7 +1893,8 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
                             sep=sep,
                             low_memory=False,
                             na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
-                            dtype=str  # Manter tudo como string inicialmente
+                            dtype=str,  # Manter tudo como string inicialmente
+                            nrows=nrows
                         )
                         
                         # Verificar se temos múltiplas colunas ou se precisa dividir
@@ -1103,7 +1906,7 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
                         
                         if len(df.columns) > 1 or (len(df.columns) == 1 and len(df) > 0):
                             logging.info(f"Arquivo lido com encoding {encoding} e separador '{sep}', {len(df.columns)} colunas")
-                            return apply_character_cleaning_to_dataframe(df, filename)
+                            return learned(df, reader="csv", encoding=encoding, sep=sep)
                             
                     except (UnicodeDecodeError, pd.errors.ParserError, Exception) as e:
                         continue
@@ -1128,10 +1931,11 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
                         low_memory=False,
                         na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
                         dtype=str,
-                        on_bad_lines='skip'
+                        on_bad_lines='skip',
+                        nrows=nrows
                     )
                     logging.info(f"Arquivo lido com separador auto-detectado '{best_sep}', {len(df.columns)} colunas")
-                    return df
+                    return learned(df, clean=False, reader="csv", encoding='utf-8', sep=best_sep, on_bad_lines='skip')
             except Exception as e:
                 logging.error(f"Erro na detecção automática: {str(e)}")
             
@@ -1148,19 +1952,23 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
             
             if is_potentially_quero_mais:
                 logging.warning(f"🏦 QUERO MAIS Excel detectado: {filename}")
+
+            # Workbook aberto uma única vez para todas as tentativas abaixo
+            excel_source = excel_file if excel_file is not None else pd.ExcelFile(io.BytesIO(file_content))
             
             if is_paulista:
                 logging.info(f"🏦 Detectado arquivo PAULISTA: {filename}, aplicando leitura especial...")
                 try:
                     # PAULISTA: pular primeiras 2 linhas, usar linha 3 como cabeçalho
                     df = pd.read_excel(
-                        io.BytesIO(file_content),
+                        excel_source,
                         skiprows=2,  # Pula logo e linha vazia
                         na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
-                        dtype=str
+                        dtype=str,
+                        nrows=nrows
                     )
                     logging.info(f"🏦 PAULISTA lido com skip=2: {len(df.columns)} colunas, primeiras: {list(df.columns)[:5]}")
-                    return apply_character_cleaning_to_dataframe(df, filename)
+                    return learned(df, reader="excel", sheet_name=0, skiprows=2)
                 except Exception as e:
                     logging.error(f"❌ Erro na leitura especial PAULISTA: {str(e)}")
                     # Fallback para leitura normal
@@ -1169,9 +1977,10 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
             try:
                 # Primeiro tentar leitura normal
                 df = pd.read_excel(
-                    io.BytesIO(file_content),
+                    excel_source,
                     na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
-                    dtype=str
+                    dtype=str,
+                    nrows=nrows
                 )
                 
                 # Se o DataFrame está vazio ou tem só NaN, tentar pular linhas
@@ -1188,13 +1997,14 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
                         try:
                             # Recarregar pulando primeiras linhas
                             df_paulista = pd.read_excel(
-                                io.BytesIO(file_content),
+                                excel_source,
                                 skiprows=2,  # Pula logo e "Relação de Propostas"
                                 na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
-                                dtype=str
+                                dtype=str,
+                                nrows=nrows
                             )
                             logging.info(f"🏦 PAULISTA relido: {len(df_paulista.columns)} colunas: {list(df_paulista.columns)[:5]}")
-                            return apply_character_cleaning_to_dataframe(df_paulista, filename)
+                            return learned(df_paulista, reader="excel", sheet_name=0, skiprows=2)
                         except Exception as e:
                             logging.error(f"❌ Erro na releitura PAULISTA: {str(e)}")
                 
@@ -1213,10 +2023,11 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
                         for skip_rows in range(1, 11):
                             try:
                                 df_attempt = pd.read_excel(
-                                    io.BytesIO(file_content),
+                                    excel_source,
                                     skiprows=skip_rows,
                                     na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
-                                    dtype=str
+                                    dtype=str,
+                                    nrows=nrows
                                 )
                                 
                                 # Verificar se agora temos dados válidos
@@ -1225,30 +2036,30 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
                                     valid_rows = df_attempt.dropna(how='all')
                                     if len(valid_rows) > 0:
                                         logging.info(f"Excel lido pulando {skip_rows} linhas, {len(df_attempt.columns)} colunas")
-                                        return apply_character_cleaning_to_dataframe(df_attempt, filename)
+                                        return learned(df_attempt, reader="excel", sheet_name=0, skiprows=skip_rows)
                             except:
                                 continue
                 
                 # Se chegou aqui, usar o DataFrame original
                 logging.info(f"Excel lido normalmente, {len(df.columns)} colunas")
-                return apply_character_cleaning_to_dataframe(df, filename)
+                return learned(df, reader="excel", sheet_name=0, skiprows=0)
                 
             except Exception as e:
                 # Última tentativa: ler todas as sheets e pegar a primeira com dados
                 logging.warning(f"Tentativa normal falhou: {str(e)}, tentando ler todas as sheets...")
                 try:
-                    excel_file = pd.ExcelFile(io.BytesIO(file_content))
-                    for sheet_name in excel_file.sheet_names:
+                    for sheet_name in excel_source.sheet_names:
                         try:
                             df = pd.read_excel(
-                                io.BytesIO(file_content),
+                                excel_source,
                                 sheet_name=sheet_name,
                                 na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
-                                dtype=str
+                                dtype=str,
+                                nrows=nrows
                             )
                             if not df.empty and len(df.columns) > 1:
                                 logging.info(f"Excel lido da sheet '{sheet_name}', {len(df.columns)} colunas")
-                                return apply_character_cleaning_to_dataframe(df, filename)
+                                return learned(df, reader="excel", sheet_name=sheet_name, skiprows=0)
                         except:
                             continue
                 except Exception as sheet_error:
@@ -1283,17 +2094,19 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
             
             best_sep = max(separators, key=separators.get)
             if separators[best_sep] > 0:
+                txt_encoding = 'utf-8' if file_content.decode('utf-8', errors='ignore') else 'latin-1'
                 df = pd.read_csv(
                     io.BytesIO(file_content), 
-                    encoding='utf-8' if file_content.decode('utf-8', errors='ignore') else 'latin-1',
+                    encoding=txt_encoding,
                     sep=best_sep,
                     low_memory=False,
                     na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
                     dtype=str,
-                    on_bad_lines='skip'
+                    on_bad_lines='skip',
+                    nrows=nrows
                 )
                 logging.info(f"Arquivo TXT lido com separador '{best_sep}', {len(df.columns)} colunas")
-                return df
+                return learned(df, clean=False, reader="csv", encoding=txt_encoding, sep=best_sep, on_bad_lines='skip')
             else:
                 raise ValueError("Arquivo TXT sem separadores reconhecíveis")
         else:
@@ -1302,8 +2115,319 @@ def read_file_optimized(file_content: bytes, filename: str) -> pd.DataFrame:
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erro ao ler arquivo {filename}: {str(e)}")
 
+# Linhas lidas na espiada do cabeçalho (detecção do banco antes da leitura completa)
+HEADER_PEEK_ROWS = 50
+
+
+def read_with_profile(file_content: bytes, filename: str, profile: dict,
+                      nrows: Optional[int] = None, excel_file=None) -> pd.DataFrame:
+    """Lê o arquivo numa única passada com os parâmetros de um perfil de leitura
+    (encoding, separador, skiprows, sheet), sem as tentativas de read_file_optimized"""
+    if profile["reader"] == "csv":
+        extra = {"on_bad_lines": profile["on_bad_lines"]} if profile.get("on_bad_lines") else {}
+        df = pd.read_csv(
+            io.BytesIO(file_content),
+            encoding=profile["encoding"],
+            sep=profile["sep"],
+            low_memory=False,
+            na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
+            dtype=str,
+            nrows=nrows,
+            **extra
+        )
+    else:
+        df = pd.read_excel(
+            excel_file if excel_file is not None else io.BytesIO(file_content),
+            sheet_name=profile.get("sheet_name", 0),
+            skiprows=profile.get("skiprows") or None,
+            na_values=['', 'NaN', 'NULL', 'null', 'N/A', 'n/a'],
+            dtype=str,
+            nrows=nrows
+        )
+
+    return apply_character_cleaning_to_dataframe(df, filename) if profile.get("clean", True) else df
+
+
+def layout_fingerprint(file_content: bytes, filename: str, excel_file=None) -> Optional[str]:
+    """Impressão digital barata do layout do arquivo, usada como chave dos perfis de leitura.
+
+    CSV/TXT: primeira linha bruta; Excel: primeira linha não vazia da primeira sheet
+    (e sua posição). Dígitos viram '9' para que datas e períodos do título não mudem a chave.
+    """
+    file_ext = filename.lower().split('.')[-1]
+    try:
+        if file_ext in ['csv', 'txt']:
+            first_line = file_content[:4096].split(b'\n', 1)[0].rstrip(b'\r')
+            layout = re.sub(rb'\d', b'9', first_line)
+        elif file_ext in ['xlsx', 'xls'] and excel_file is not None:
+            raw = pd.read_excel(excel_file, sheet_name=0, header=None, nrows=5, dtype=str)
+            first_filled = next((i for i in range(len(raw)) if raw.iloc[i].notna().any()), -1)
+            cells = raw.iloc[first_filled].fillna('').tolist() if first_filled >= 0 else []
+            layout = re.sub(r'\d', '9', '|'.join([
+                ','.join(excel_file.sheet_names), str(raw.shape[1]), str(first_filled), *cells
+            ])).encode('utf-8')
+        else:
+            return None
+    except Exception as e:
+        logging.debug(f"Impressão digital de layout indisponível para {filename}: {e}")
+        return None
+
+    return f"{file_ext}:{hashlib.sha1(layout).hexdigest()[:16]}"
+
+# ================================
+# 🧬 ASSINATURAS DE BANCOS (map_relat_atualizados.txt)
+# ================================
+
+BANK_INVENTORY_PATH = ROOT_DIR.parent / 'data' / 'map_relat_atualizados.txt'
+
+# Títulos de seção do inventário → tipo de banco usado no processamento
+INVENTORY_SECTION_BANKS = {
+    "AVERBAI": "AVERBAI",
+    "FACTA92": "FACTA92",
+    "DIGIO": "DIGIO",
+    "PAULISTA": "PAULISTA",
+    "BRB": "BRB",
+    "BANCO CREFAZ": "CREFAZ",
+    "BANCO SANTANDER": "SANTANDER",
+    "BANCO QUERO MAIS CREDITO": "QUERO_MAIS",
+    "BANCO DAYCOVAL": "DAYCOVAL",
+    "BANCO VCTEX": "VCTEX",
+    "BANCO PAN": "PAN",
+    "BANCO C6 BANK": "C6",
+    "QUALIBANKING": "QUALIBANKING",
+    "MERCANTIL": "MERCANTIL",
+    "AMIGOZ": "AMIGOZ",
+    "BANCO TOTALCASH": "TOTALCASH",
+}
+
+# Indicadores no nome do arquivo, na mesma ordem de prioridade das regras antigas
+BANK_FILENAME_SIGNATURES = [
+    ("STORM", ['storm', 'contratos', 'digitados']),
+    ("AVERBAI", ['averbai']),
+    ("DIGIO", ['digio', 'wfsic', 'wfi']),
+    ("PRATA", ['prata']),
+    ("VCTEX", ['vctex']),
+    ("DAYCOVAL", ['daycoval']),
+    ("QUERO_MAIS", ['quero', 'promotora', 'producao', 'produção', 'capital consig']),
+]
+
+STORM_COLUMN_INDICATORS = ['ade', 'banco empréstimo', 'status do contrato']
+
+# Frases de título dos relatórios em layout "Unnamed" (o nome do banco vem no cabeçalho ou na 1ª linha)
+BANK_CONTENT_SIGNATURES = {
+    "DIGIO": ['banco digio', 'digio s.a', 'digio s/a', 'digio bank'],
+    "DAYCOVAL": ['banco daycoval'],
+    "PAULISTA": ['banco paulista', 'relação de propostas'],
+    "QUERO_MAIS": ['capital consig', 'quero mais', 'queromais', 'qmais', 'promotora', 'grupo qfz', 'cpf correspondente'],
+    "PRATA": ['prata digital', 'shake de morango'],
+    "VCTEX": ["it's solucoes"],
+    "AVERBAI": ['averbai'],
+    "TOTALCASH": ['totalcash', 'total cash'],
+    "AMIGOZ": ['amigoz'],
+    "QUALIBANKING": ['qualibanking'],
+}
+
+# Critérios de decisão por colunas: mínimo de colunas exclusivas e cobertura da assinatura
+SIGNATURE_MIN_COLUMNS = 3
+SIGNATURE_MIN_COVERAGE = 0.5
+# Dois bancos com cobertura dentro desta margem tornam o arquivo ambíguo
+SIGNATURE_AMBIGUITY_MARGIN = 0.15
+# Linhas da amostra testadas como cabeçalho (relatórios com bloco de título acima dos rótulos)
+SIGNATURE_HEADER_ROWS = 10
+
+_INVENTORY_IGNORED_COLUMN = re.compile(r'^(unnamed:.*|pg\..*|[\d\s/.:\-]+)$')
+
+
+def normalize_header_name(name) -> str:
+    """Normaliza nome de coluna para comparação com as assinaturas"""
+    return re.sub(r'\s+', ' ', str(name)).strip().lower()
+
+
+def _report_label(examples_line: str) -> str:
+    """Primeiro exemplo de uma coluna 'Unnamed: N' que não é data/número ('' se não houver)"""
+    if not examples_line.strip().startswith('Exemplos:'):
+        return ''
+    for example in examples_line.strip()[len('Exemplos:'):].split(','):
+        label = normalize_header_name(example)
+        if label and not _INVENTORY_IGNORED_COLUMN.match(label):
+            return label
+    return ''
+
+
+def load_bank_inventory(path) -> Dict[str, set]:
+    """Lê as colunas documentadas de cada banco em map_relat_atualizados.txt
+
+    O nome de cada coluna é a linha imediatamente anterior a "Tipo: ...". Em colunas
+    'Unnamed: N' (relatório impresso) o rótulo é o primeiro exemplo que não é data/número,
+    que é a linha de rótulos (ou de título) do relatório; datas/números não identificam o banco.
+    """
+    inventory: Dict[str, set] = {}
+    current_bank = None
+    with open(path, encoding='utf-8') as inventory_file:
+        lines = inventory_file.read().splitlines()
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped in INVENTORY_SECTION_BANKS:
+            current_bank = INVENTORY_SECTION_BANKS[stripped]
+            inventory.setdefault(current_bank, set())
+        elif current_bank and stripped.startswith('Tipo:') and i > 0:
+            column = normalize_header_name(lines[i - 1])
+            if column.startswith('unnamed:'):
+                column = _report_label(lines[i + 1] if i + 1 < len(lines) else '')
+            if column and not _INVENTORY_IGNORED_COLUMN.match(column):
+                inventory[current_bank].add(column)
+
+    return inventory
+
+
+class BankDetection(BaseModel):
+    bank: Optional[str] = None
+    confidence: float = 0.0
+    method: str = ""
+    evidence: List[str] = []
+    candidates: Dict[str, float] = {}
+    ambiguous: bool = False
+
+
+class BankSignatureDetector:
+    """Detector de banco por assinaturas compiladas uma única vez.
+
+    Só as colunas exclusivas de cada banco entram na assinatura (colunas
+    compartilhadas por dois ou mais bancos, como 'CPF' ou 'Status', não
+    distinguem nada). As colunas são pontuadas contra o cabeçalho e contra cada uma das
+    primeiras SIGNATURE_HEADER_ROWS linhas (relatórios com os rótulos abaixo de um bloco de
+    título); vale a linha com melhor cobertura. O conteúdo usa o cabeçalho e a primeira linha.
+    """
+
+    def __init__(self, inventory: Dict[str, set]):
+        column_owners: Dict[str, int] = {}
+        for columns in inventory.values():
+            for column in columns:
+                column_owners[column] = column_owners.get(column, 0) + 1
+
+        self.column_signatures = {}
+        for bank, columns in inventory.items():
+            exclusive = frozenset(column for column in columns if column_owners[column] == 1)
+            if exclusive:
+                self.column_signatures[bank] = exclusive
+
+    @classmethod
+    def from_inventory(cls, path) -> "BankSignatureDetector":
+        try:
+            inventory = load_bank_inventory(path)
+        except OSError as e:
+            logging.warning(f"⚠️ Inventário de bancos indisponível ({path}): {e} - detecção apenas por nome/conteúdo")
+            inventory = {}
+
+        detector = cls(inventory)
+        logging.info(f"🧬 Assinaturas de banco compiladas: {({bank: len(cols) for bank, cols in detector.column_signatures.items()})}")
+        return detector
+
+    @staticmethod
+    def _candidate_header_rows(df: pd.DataFrame, header: List[str]):
+        """(origem, rótulos normalizados) do cabeçalho e de cada uma das primeiras linhas da amostra"""
+        yield "coluna", set(header)
+        for i in range(min(SIGNATURE_HEADER_ROWS, len(df))):
+            values = df.iloc[i].values
+            yield f"linha {i + 1}", {normalize_header_name(val) for val in values if pd.notna(val)}
+
+    def detect(self, df: pd.DataFrame, filename: str) -> BankDetection:
+        filename_lower = filename.lower()
+        for bank, indicators in BANK_FILENAME_SIGNATURES:
+            found = [indicator for indicator in indicators if indicator in filename_lower]
+            if found:
+                return BankDetection(bank=bank, confidence=1.0, method="nome do arquivo", evidence=[f"nome: {ind}" for ind in found])
+
+        header = [normalize_header_name(col) for col in df.columns]
+        storm_found = [ind for ind in STORM_COLUMN_INDICATORS if any(ind in col for col in header)]
+        if len(storm_found) >= 2:
+            return BankDetection(bank="STORM", confidence=1.0, method="colunas", evidence=[f"coluna: {ind}" for ind in storm_found])
+
+        # Colunas: cobertura das assinaturas exclusivas no cabeçalho ou numa das primeiras linhas
+        candidates: Dict[str, float] = {}
+        evidence: Dict[str, List[str]] = {}
+        for row, labels in self._candidate_header_rows(df, header):
+            for bank, signature in self.column_signatures.items():
+                matched = signature & labels
+                if not matched:
+                    continue
+                coverage = len(matched) / len(signature)
+                # Assinaturas de uma ou duas colunas são títulos de relatório: exigem todas
+                if len(signature) < SIGNATURE_MIN_COLUMNS:
+                    qualifies = len(matched) == len(signature)
+                else:
+                    qualifies = len(matched) >= SIGNATURE_MIN_COLUMNS and coverage >= SIGNATURE_MIN_COVERAGE
+                if qualifies and coverage > candidates.get(bank, 0.0):
+                    candidates[bank] = round(coverage, 3)
+                    evidence[bank] = [f"{row}: {col}" for col in sorted(matched)[:10]]
+
+        if candidates:
+            ranked = sorted(candidates.items(), key=lambda item: item[1], reverse=True)
+            best_bank, best_score = ranked[0]
+            if len(ranked) > 1 and best_score - ranked[1][1] < SIGNATURE_AMBIGUITY_MARGIN:
+                rivals = [bank for bank, score in ranked if best_score - score < SIGNATURE_AMBIGUITY_MARGIN]
+                return BankDetection(
+                    confidence=best_score, method="colunas", ambiguous=True, candidates=candidates,
+                    evidence=[f"{bank}: {', '.join(evidence[bank][:3])}" for bank in rivals]
+                )
+            return BankDetection(bank=best_bank, confidence=best_score, method="colunas", evidence=evidence[best_bank], candidates=candidates)
+
+        # Conteúdo: só em layouts de relatório, onde o título do banco vem no cabeçalho/1ª linha
+        unnamed_count = sum(1 for col in header if col.startswith('unnamed:'))
+        if df.empty or unnamed_count * 2 < len(header):
+            return BankDetection(method="colunas", candidates=candidates)
+
+        title_text = ' '.join(header) + ' ' + ' '.join(str(val).lower() for val in df.iloc[0].values if pd.notna(val))
+        content_hits = {
+            bank: [phrase for phrase in phrases if phrase in title_text]
+            for bank, phrases in BANK_CONTENT_SIGNATURES.items()
+        }
+        content_hits = {bank: found for bank, found in content_hits.items() if found}
+        content_evidence = [f"{bank}: {', '.join(found)}" for bank, found in content_hits.items()]
+
+        if len(content_hits) == 1:
+            bank, found = next(iter(content_hits.items()))
+            return BankDetection(bank=bank, confidence=0.9, method="conteúdo", evidence=[f"conteúdo: {phrase}" for phrase in found])
+
+        # Mais de um banco citado no título: as regras por conteúdo decidem (ex.: QUERO MAIS x PAULISTA)
+        return BankDetection(method="conteúdo", evidence=content_evidence)
+
+
+bank_signatures = BankSignatureDetector.from_inventory(BANK_INVENTORY_PATH)
+startup_report.mark("regras e assinaturas de bancos")
+
+
+def detect_bank(df: pd.DataFrame, filename: str) -> BankDetection:
+    """Detecta o banco com confiança e evidências.
+
+    As assinaturas decidem primeiro; arquivos ambíguos por colunas são rejeitados
+    e os sem assinatura clara seguem para as regras de estrutura/conteúdo.
+    """
+    detection = bank_signatures.detect(df, filename)
+
+    if detection.bank:
+        logging.warning(f"🎯 {detection.bank} detectado por {detection.method} (confiança {detection.confidence:.2f}): {detection.evidence[:5]}")
+        return detection
+
+    if detection.ambiguous:
+        logging.error(f"❌ Arquivo ambíguo: {filename} - {detection.evidence}")
+        raise HTTPException(status_code=400, detail=f"Arquivo ambíguo: {filename} combina com mais de um banco ({', '.join(detection.evidence)})")
+
+    bank_type = detect_bank_type_by_rules(df, filename)
+    return BankDetection(
+        bank=bank_type, confidence=0.5, method="regras",
+        evidence=detection.evidence or ["regras de estrutura/conteúdo"], candidates=detection.candidates
+    )
+
+
 def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     """Detecção melhorada de tipo de banco baseada na estrutura real dos arquivos"""
+    return detect_bank(df, filename).bank
+
+
+def detect_bank_type_by_rules(df: pd.DataFrame, filename: str) -> str:
+    """Regras de estrutura/conteúdo para arquivos sem assinatura clara"""
     filename_lower = filename.lower()
     df_columns = [str(col).lower().strip() for col in df.columns]
     
@@ -1311,38 +2435,17 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     logging.warning(f"📊 {len(df.columns)} colunas encontradas: {df_columns[:10]}...")  # Mostrar apenas primeiras 10
     logging.warning(f"📋 Filename lower: {filename_lower}")
     
-    # Detecção por nome do arquivo - mais confiável
-    if any(indicator in filename_lower for indicator in ['storm', 'contratos', 'digitados']):
-        logging.warning(f"🎯 STORM detectado por nome: {filename}")
-        return "STORM"
-    elif 'averbai' in filename_lower:
-        logging.warning(f"🎯 AVERBAI detectado por nome: {filename}")
-        return "AVERBAI"
-    elif any(indicator in filename_lower for indicator in ['digio', 'wfsic', 'wfi']):
-        logging.warning(f"🎯 DIGIO detectado por nome: {filename}")
-        return "DIGIO"
-    elif 'prata' in filename_lower:
-        logging.warning(f"🎯 PRATA detectado por nome: {filename}")
-        return "PRATA"
-    elif 'vctex' in filename_lower:
-        logging.warning(f"🎯 VCTEX detectado por nome: {filename}")
-        return "VCTEX"
-    elif 'daycoval' in filename_lower:
-        logging.warning(f"🎯 DAYCOVAL detectado por nome: {filename}")
-        return "DAYCOVAL"
-    # 🚨 CORREÇÃO: Adicionar detecção QUERO MAIS por nome
-    elif any(indicator in filename_lower for indicator in ['quero', 'promotora', 'producao', 'produção', 'capital consig']):
-        logging.warning(f"🎯 QUERO MAIS detectado por nome: {filename}")
-        return "QUERO_MAIS"
-    
-    # Detecção por estrutura de colunas específica
-    
-    # Verificar se é Storm
-    storm_indicators = ['ade', 'banco empréstimo', 'status do contrato']
-    storm_matches = sum(1 for indicator in storm_indicators if any(indicator in col for col in df_columns))
-    if storm_matches >= 2:
-        return "STORM"
-    
+    # Nome do arquivo e colunas da Storm já foram verificados pelas assinaturas (detect_bank)
+
+    # Texto das primeiras linhas, montado uma única vez para todas as regras de conteúdo
+    row_texts = [
+        ' '.join([str(val).lower() for val in df.iloc[i].values if pd.notna(val)])
+        for i in range(min(5, len(df)))
+    ]
+
+    def sample_text(n_rows: int) -> str:
+        return ''.join(" " + text for text in row_texts[:n_rows])
+
     # Verificar se é AVERBAI (tem colunas específicas como Id, IdTableComissao)
     averbai_indicators = ['id', 'idtablecomissao', 'tipoproduto', 'loginconsultor']
     averbai_matches = sum(1 for indicator in averbai_indicators if any(indicator in col for col in df_columns))
@@ -1353,11 +2456,8 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     if len(df.columns) > 50 and sum(1 for col in df_columns if 'unnamed:' in col) > 20:
         # Verificar dados específicos do Digio em múltiplas linhas
         if not df.empty:
-            all_data = ""
             # Verificar primeiras 5 linhas para ser mais preciso
-            for i in range(min(5, len(df))):
-                row_data = ' '.join([str(val).lower() for val in df.iloc[i].values if pd.notna(val)])
-                all_data += " " + row_data
+            all_data = sample_text(5)
                 
             logging.info(f"🔍 DIGIO check - dados: {all_data[:200]}...")
             
@@ -1393,7 +2493,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     # Verificar se é PRATA (tem colunas específicas)
     prata_indicators = ['corban master', 'número da proposta', 'prata digital', 'shake de morango']
     if not df.empty:
-        first_row_data = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+        first_row_data = row_texts[0]
         prata_matches = sum(1 for indicator in prata_indicators if indicator in first_row_data)
         if prata_matches >= 1:
             return "PRATA"
@@ -1401,7 +2501,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     # Verificar se é VCTEX (tem colunas específicas)
     vctex_indicators = ['corban master', 'número do contrato', "it's solucoes", 'tabela vamo']
     if not df.empty:
-        first_row_data = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+        first_row_data = row_texts[0]
         vctex_matches = sum(1 for indicator in vctex_indicators if indicator in first_row_data)
         if vctex_matches >= 1:
             return "VCTEX"
@@ -1433,10 +2533,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     if len(df.columns) > 20 and unnamed_count > 15:
         # Verificar dados específicos do Daycoval em múltiplas linhas
         if not df.empty:
-            all_data = ""
-            for i in range(min(5, len(df))):
-                row_data = ' '.join([str(val).lower() for val in df.iloc[i].values if pd.notna(val)])
-                all_data += " " + row_data
+            all_data = sample_text(5)
             
             logging.info(f"🔍 DAYCOVAL primeiras linhas: {all_data[:300]}")
             
@@ -1505,10 +2602,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     # 3. Por conteúdo específico (indicadores únicos de energia/boleto)
     if not df.empty:
         # Verificar nas primeiras 3 linhas para indicadores específicos do CREFAZ
-        all_data = ""
-        for i in range(min(3, len(df))):
-            row_data = ' '.join([str(val).lower() for val in df.iloc[i].values if pd.notna(val)])
-            all_data += " " + row_data
+        all_data = sample_text(3)
         
         # Indicadores únicos do CREFAZ (energia, boleto, etc.)
         crefaz_unique_indicators = ['crefaz', 'energia', 'boleto', 'cpfl', 'cosern', 'celpe', 'enel', 'ener', 'bol', 'luz', 'fatura']
@@ -1538,10 +2632,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     # 3. Por conteúdo específico do MERCANTIL (mais restrito)
     if not df.empty:
         # Verificar nas primeiras 5 linhas por indicadores específicos do Mercantil
-        all_data = ""
-        for i in range(min(5, len(df))):
-            row_data = ' '.join([str(val).lower() for val in df.iloc[i].values if pd.notna(val)])
-            all_data += " " + row_data
+        all_data = sample_text(5)
         
         # Indicadores específicos do MERCANTIL (removido 'qfz solucoes' para evitar conflito)
         mercantil_content_indicators = ['banco mercantil do brasil', 'credfranco', 'bmb', 'mercantil']
@@ -1585,10 +2676,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
         logging.warning(f"🔍 QUERO MAIS estrutura OK - verificando conteúdo...")
         if not df.empty:
             # Verificar nas primeiras 5 linhas para maior precisão
-            all_data = ""
-            for i in range(min(5, len(df))):
-                row_data = ' '.join([str(val).lower() for val in df.iloc[i].values if pd.notna(val)])
-                all_data += " " + row_data
+            all_data = sample_text(5)
             
             logging.info(f"🔍 QUERO MAIS check - dados: {all_data[:200]}...")
             
@@ -1627,7 +2715,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     # 3. Por conteúdo dos dados
     c6_indicators = ['c6 bank', 'c6 consignado', 'banco c6']
     if not df.empty:
-        first_row_data = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+        first_row_data = row_texts[0]
         if any(indicator in first_row_data for indicator in c6_indicators):
             return "C6"
     
@@ -1656,7 +2744,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     # 3. Por indicadores na primeira linha
     paulista_indicators = ['banco paulista', 'relação de propostas', 'analítico', 'espécie benefício']
     if not df.empty:
-        first_row_data = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+        first_row_data = row_texts[0]
         paulista_matches = sum(1 for indicator in paulista_indicators if indicator in first_row_data)
         if paulista_matches >= 2:
             return "PAULISTA"
@@ -1668,10 +2756,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
         # Verificar se tem dados que parecem do Paulista em qualquer linha
         if not df.empty:
             # Procurar em todas as linhas por palavras-chave do Paulista
-            all_data = ""
-            for i in range(min(5, len(df))):  # Verificar até 5 primeiras linhas
-                row_data = ' '.join([str(val).lower() for val in df.iloc[i].values if pd.notna(val)])
-                all_data += " " + row_data
+            all_data = sample_text(5)
             
             logging.info(f"🔍 PAULISTA check - dados: {all_data[:200]}...")
             
@@ -1705,7 +2790,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     # Verificar se é TOTALCASH (tem estrutura específica)
     totalcash_indicators = ['totalcash', 'total cash']
     if not df.empty:
-        first_row_data = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+        first_row_data = row_texts[0]
         if any(indicator in first_row_data for indicator in totalcash_indicators):
             return "TOTALCASH"
     
@@ -1715,7 +2800,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     if brb_matches >= 4:
         # Confirmar com dados
         if not df.empty:
-            first_row_data = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+            first_row_data = row_texts[0]
             if 'brb' in first_row_data or 'banco de brasília' in first_row_data or 'q-faz' in first_row_data:
                 return "BRB"
     
@@ -1743,7 +2828,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     
     # 4. Por conteúdo dos dados
     if not df.empty:
-        first_row_data = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+        first_row_data = row_texts[0]
         if 'qualibanking' in first_row_data or 'quali' in first_row_data:
             return "QUALIBANKING"
     
@@ -1754,7 +2839,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     if amigoz_matches >= 3:
         # Confirmar com dados
         if not df.empty:
-            first_row_data = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+            first_row_data = row_texts[0]
             if 'amigoz' in first_row_data or 'cartão benefício' in first_row_data or 'cartão consignado' in first_row_data:
                 return "AMIGOZ"
     
@@ -1779,7 +2864,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
         if sum(1 for col in df_columns if 'unnamed:' in col) > 20:
             # Distinguir entre DIGIO e DAYCOVAL pela primeira linha
             if not df.empty:
-                first_row_content = ' '.join([str(val).lower() for val in df.iloc[0].values if pd.notna(val)])
+                first_row_content = row_texts[0]
                 if 'daycoval' in first_row_content or 'nr.prop' in first_row_content or 'tp. operação' in first_row_content:
                     return "DAYCOVAL"
                 else:
@@ -1825,10 +2910,7 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
         # Tentativa final para Paulista: estrutura Unnamed + palavras-chave
         if len(df_columns) > 20 and sum(1 for col in df_columns if 'unnamed:' in col) > 15:
             # Procurar palavras-chave do Paulista em qualquer parte do DataFrame
-            all_text = ""
-            for i in range(min(5, len(df))):
-                row_text = ' '.join([str(val).lower() for val in df.iloc[i].values if pd.notna(val)])
-                all_text += " " + row_text
+            all_text = sample_text(5)
             
             paulista_keywords = ['inss', 'aposentad', 'pensão', 'consignado', 'benefici', 'cpf', 'proposta', 'contrato']
             keyword_matches = sum(1 for word in paulista_keywords if word in all_text)
@@ -1842,10 +2924,10 @@ def detect_bank_type_enhanced(df: pd.DataFrame, filename: str) -> str:
     
     raise HTTPException(status_code=400, detail=f"Tipo de banco não reconhecido para: {filename}. Estrutura: {len(df.columns)} colunas, {sum(1 for col in df_columns if 'unnamed:' in col)} colunas 'Unnamed'. Primeiras colunas: {df_columns[:5]}")
 
-def process_storm_data_enhanced(df: pd.DataFrame) -> Dict[str, str]:
-    """Processamento aprimorado dos dados da Storm - usa ADE e Status do Contrato"""
-    storm_proposals = {}
-    
+def process_storm_data_enhanced(df: pd.DataFrame) -> tuple[Dict[str, str], dict]:
+    """Processamento aprimorado dos dados da Storm - usa ADE e Status do Contrato
+    Retorna o dict ADE → status normalizado e as contagens (PAGO/CANCELADO) calculadas nos mesmos vetores
+    """
     logging.info(f"Processando Storm com {len(df)} linhas e colunas: {list(df.columns)}")
     
     # Identificar colunas corretas
@@ -1888,46 +2970,90 @@ def process_storm_data_enhanced(df: pd.DataFrame) -> Dict[str, str]:
             if not status_col and ('status' in col_lower or 'situacao' in col_lower):
                 status_col = col
     
-    processed_count = 0
-    pago_cancelado_count = 0
+    # ⚡ Processamento vetorizado das colunas ADE e Status (sem iterrows)
+    if ade_col is not None:
+        ade_values = df[ade_col].astype(str).str.strip()
+    else:
+        ade_values = pd.Series("", index=df.index)
     
-    for _, row in df.iterrows():
-        try:
-            # Extrair ADE
-            ade_value = str(row[ade_col]).strip() if ade_col else ""
-            
-            # Extrair Status
-            status_value = str(row[status_col]).strip().lower() if status_col else ""
-            
-            # Limpar e validar ADE
-            if ade_value and ade_value not in ['nan', 'NaN', '', 'ADE']:
-                # Manter apenas números
-                ade_clean = ''.join(c for c in ade_value if c.isdigit())
-                
-                if ade_clean and len(ade_clean) >= 6:  # ADEs têm pelo menos 6 dígitos
-                    # Normalizar status
-                    normalized_status = STATUS_MAPPING.get(status_value, status_value.upper())
-                    
-                    storm_proposals[ade_clean] = normalized_status
-                    processed_count += 1
-                    
-                    # Contar quantos estão PAGO/CANCELADO para estatística
-                    if normalized_status in ['PAGO', 'CANCELADO']:
-                        pago_cancelado_count += 1
-                    
-                    if processed_count <= 5:  # Log apenas os primeiros 5 para debug
-                        logging.info(f"Proposta Storm: ADE={ade_clean} Status={normalized_status}")
-                        
-        except Exception as e:
-            logging.error(f"Erro ao processar linha da Storm: {e}")
-            continue
+    if status_col is not None:
+        status_values = transform_unique_values(df[status_col].astype(str), lambda status: status.strip().lower())
+    else:
+        status_values = pd.Series("", index=df.index)
+    
+    # Limpar e validar ADE: manter apenas números, ADEs têm pelo menos 6 dígitos
+    ade_clean = ade_values.str.replace(r'\D', '', regex=True)
+    valid_mask = ~ade_values.isin(['nan', 'NaN', '', 'ADE']) & (ade_clean.str.len() >= 6)
+    
+    # Normalizar status: STATUS_MAPPING ou o próprio status em maiúsculas
+    normalized_status = transform_unique_values(status_values, lambda status: STATUS_MAPPING.get(status, status.upper()))
+    
+    valid_ades = ade_clean[valid_mask]
+    valid_status = normalized_status[valid_mask]
+    processed_count = len(valid_ades)
+    
+    # Mesma semântica do dict original: ordem da primeira ocorrência, status da última
+    storm_proposals = dict(zip(valid_ades.tolist(), valid_status.tolist()))
+    
+    for ade_clean_value, status in list(storm_proposals.items())[:5]:  # Log apenas os primeiros 5 para debug
+        logging.info(f"Proposta Storm: ADE={ade_clean_value} Status={status}")
+    
+    # Contagens PAGO/CANCELADO a partir dos mesmos vetores (uma linha por ADE)
+    final_status = valid_status[~valid_ades.duplicated(keep='last')]
+    pago_count = int((final_status == 'PAGO').sum())
+    cancelado_count = int((final_status == 'CANCELADO').sum())
+    pago_cancelado_count = pago_count + cancelado_count
+    
+    storm_stats = {
+        "rows": len(df),
+        "valid_rows": processed_count,
+        "total_proposals": len(storm_proposals),
+        "pago": pago_count,
+        "cancelado": cancelado_count,
+        "paid_cancelled": pago_cancelado_count
+    }
     
-    logging.info(f"Storm processada: {processed_count} propostas válidas")
-    logging.info(f"Propostas PAGO/CANCELADO (serão filtradas): {pago_cancelado_count}")
-    logging.info(f"Propostas disponíveis para processamento: {processed_count - pago_cancelado_count}")
+    logging.info(f"Storm processada: {processed_count} linhas válidas, {len(storm_proposals)} ADEs únicas")
+    logging.info(f"Propostas PAGO/CANCELADO (serão filtradas): {pago_cancelado_count} ({pago_count} PAGO, {cancelado_count} CANCELADO)")
+    logging.info(f"Propostas disponíveis para processamento: {len(storm_proposals) - pago_cancelado_count}")
     
-    return storm_proposals
+    return storm_proposals, storm_stats
+
+@unique_value_cache
+def normalize_status_text(situacao: str) -> Optional[str]:
+    """Status do banco → PAGO/CANCELADO/AGUARDANDO... via STATUS_MAPPING (exato, sem acentos, por palavra-chave).
+    None quando nada reconhece o status"""
+    situacao_lower = situacao.lower()
+    
+    # Tentar encontrar no mapeamento
+    situacao_normalizada = STATUS_MAPPING.get(situacao_lower, None)
+    
+    # Se não encontrou exato, tentar normalizar caracteres especiais e espaços
+    if not situacao_normalizada:
+        # Remover acentos e caracteres especiais para busca mais flexível
+        import unicodedata
+        situacao_clean = ''.join(
+            c for c in unicodedata.normalize('NFD', situacao_lower)
+            if unicodedata.category(c) != 'Mn'
+        )
+        situacao_clean = situacao_clean.replace('/', ' ').replace('-', ' ').strip()
+        situacao_clean = ' '.join(situacao_clean.split())  # Remove espaços múltiplos
+        
+        # Tentar encontrar novamente
+        situacao_normalizada = STATUS_MAPPING.get(situacao_clean, None)
+    
+    # Se ainda não encontrou, fazer busca por palavras-chave
+    if not situacao_normalizada:
+        if any(word in situacao_lower for word in ['pag', 'integra', 'finaliz', 'quitad', 'liberad', 'desembolsa', 'aprovad']):
+            situacao_normalizada = "PAGO"
+        elif any(word in situacao_lower for word in ['cancel', 'reprov', 'rejeit', 'negad', 'expirad', 'invalid', 'recus', 'desist']):
+            situacao_normalizada = "CANCELADO"
+        elif any(word in situacao_lower for word in ['aguard', 'pendent', 'aberto', 'digital', 'andament', 'analise', 'process', 'formal', 'cadastr', 'enviad']):
+            situacao_normalizada = "AGUARDANDO"
+    
+    return situacao_normalizada
 
+@unique_value_cache
 def normalize_operation_for_matching(operation: str) -> str:
     """Normaliza operação para comparação flexível (remove case sensitivity e preposições)"""
     if not operation:
@@ -2575,10 +3701,17 @@ def apply_mapping(bank_name: str, organ: str, operation_type: str, usuario: str
         logging.error(f"❌ Erro no mapeamento: {str(e)}")
         return {}
 
+def _stripped_text_column(df: pd.DataFrame, column: str) -> pd.Series:
+    """Coluna como str(valor).strip() - igual a str(row.get(coluna, '')).strip() no loop por linha"""
+    if column not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[column].astype(str).str.strip()
+
 def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
     """Normaliza dados do banco para estrutura padrão usando mapeamento correto baseado no arquivo"""
     # Garantir acesso às variáveis globais
     global ORGAN_MAPPING, DETAILED_MAPPING, TABELA_MAPPING, BANK_ORGAN_MAPPING
+    ensure_organ_mapping()
     
     normalized_data = []
     
@@ -2615,10 +3748,10 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
     for column in df.columns:
         if df[column].dtype == 'object':  # Colunas de texto
             original_values = df[column].astype(str)
-            df[column] = df[column].astype(str).apply(clean_special_characters)
+            df[column] = transform_unique_values(original_values, clean_special_characters)
             
             # Contar quantas células foram alteradas
-            changes_count = sum(1 for old, new in zip(original_values, df[column]) if old != new)
+            changes_count = int((original_values != df[column]).sum())
             if changes_count > 0:
                 text_columns_cleaned += 1
                 logging.info(f"🧹 {bank_type}: Coluna '{column}' - {changes_count} células limpas")
@@ -2633,6 +3766,34 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
     
     logging.info(f"Após limpeza: {len(df)} registros válidos com {len(df.columns)} colunas")
     
+    # 🌎 Colunas de posição fixa dos layouts "Unnamed" formatadas de uma vez antes do loop por linha
+    preformatted = {}
+    if bank_type == "DAYCOVAL":
+        preformatted["CPF"] = format_cpf_series(_stripped_text_column(df, 'Unnamed: 3'))
+        preformatted["TAXA"] = format_percentage_series(_stripped_text_column(df, 'Unnamed: 12'))
+        preformatted["VALOR_LIQUIDO"] = format_money_series(_stripped_text_column(df, 'Unnamed: 13'), 'Unnamed: 13')
+        preformatted["VALOR_OPERACAO"] = format_money_series(_stripped_text_column(df, 'Unnamed: 16'), 'Unnamed: 16')
+        preformatted["VALOR_PARCELA"] = format_money_series(_stripped_text_column(df, 'Unnamed: 18'), 'Unnamed: 18')
+    elif bank_type == "PAULISTA":
+        preformatted["CPF"] = format_cpf_series(_stripped_text_column(df, 'Unnamed: 4'))
+        preformatted["VALOR_OPERACAO"] = format_money_series(_stripped_text_column(df, 'Unnamed: 11'), 'Unnamed: 11')
+        preformatted["VALOR_LIBERADO"] = format_money_series(_stripped_text_column(df, 'Unnamed: 12'), 'Unnamed: 12')
+        preformatted["VALOR_PARCELA"] = format_money_series(_stripped_text_column(df, 'Unnamed: 15'), 'Unnamed: 15')
+    elif bank_type == "BRB":
+        preformatted["VALOR_PROPOSTA"] = format_money_series(_stripped_text_column(df, 'Valor da Proposta'), 'Valor da Proposta')
+        preformatted["VALOR_PARCELA"] = format_money_series(_stripped_text_column(df, 'Valor da Parcela'), 'Valor da Parcela')
+    
+    # 📅 DAYCOVAL: ordem dia/mês decidida uma vez por coluna (CSV já no layout final ou layout "Unnamed")
+    date_order_report = {}
+    if bank_type == "DAYCOVAL":
+        has_final_layout = any(col in ['PROPOSTA', 'DATA CADASTRO', 'BANCO', 'ORGAO'] for col in df.columns)
+        date_sources = {
+            "DATA_CADASTRO": 'DATA CADASTRO' if has_final_layout else 'Unnamed: 5',
+            "DATA_PAGAMENTO": 'DATA DE PAGAMENTO' if has_final_layout else 'Unnamed: 36',
+        }
+        for field, source in date_sources.items():
+            preformatted[field], date_order_report[field] = fix_daycoval_date_column(_stripped_text_column(df, source), field)
+    
     for idx, row in df.iterrows():
         logging.info(f"🔍 PROCESSANDO linha {idx}: {dict(row)}")
         
@@ -3691,7 +4852,7 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
                 normalized_row = {
                     "PROPOSTA": str(row.get('PROPOSTA', '')).strip(),
                     "ADE": str(row.get('PROPOSTA', '')).strip(),  # ADE = mesma proposta
-                    "DATA_CADASTRO": fix_daycoval_date(str(row.get('DATA CADASTRO', '')).strip(), "DATA_CADASTRO"),
+                    "DATA_CADASTRO": preformatted["DATA_CADASTRO"][idx],  # Ordem dia/mês inferida para a coluna
                     "BANCO": "BANCO DAYCOVAL",
                     "ORGAO": clean_special_characters(str(row.get('ORGAO', '')).strip()),
                     "TIPO_OPERACAO": clean_special_characters(str(row.get('TIPO DE OPERACAO', '')).strip()),
@@ -3700,7 +4861,7 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
                     "VALOR_LIBERADO": str(row.get('VALOR LIBERADO', '')).strip(),
                     "USUARIO_BANCO": str(row.get('USUARIO BANCO', '')).strip(),
                     "SITUACAO": str(row.get('SITUACAO', '')).strip(),
-                    "DATA_PAGAMENTO": fix_daycoval_date(str(row.get('DATA DE PAGAMENTO', '')).strip(), "DATA_PAGAMENTO"),
+                    "DATA_PAGAMENTO": preformatted["DATA_PAGAMENTO"][idx],  # Ordem dia/mês inferida para a coluna
                     "CPF": str(row.get('CPF', '')).strip(),
                     "NOME": str(row.get('NOME', '')).strip().upper(),
                     "DATA_NASCIMENTO": str(row.get('DATA DE NASCIMENTO', '')).strip(),
@@ -3828,11 +4989,11 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
                 normalized_row = None
             else:
                 # Aplicar formatação brasileira
-                cpf_formatted = format_cpf_global(cpf_raw)
-                valor_operacao_formatted = format_value_brazilian(valor_operacao_raw)
-                valor_liberado_formatted = format_value_brazilian(valor_liquido_raw)
-                valor_parcela_formatted = format_value_brazilian(valor_parcela_raw)
-                taxa_formatted = format_percentage_brazilian(taxa_raw)
+                cpf_formatted = preformatted["CPF"][idx]
+                valor_operacao_formatted = preformatted["VALOR_OPERACAO"][idx]
+                valor_liberado_formatted = preformatted["VALOR_LIQUIDO"][idx]
+                valor_parcela_formatted = preformatted["VALOR_PARCELA"][idx]
+                taxa_formatted = preformatted["TAXA"][idx]
             
                 logging.info(f"✅ DAYCOVAL formatado:")
                 logging.info(f"   CPF: {cpf_formatted}")
@@ -3856,8 +5017,8 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
                     continue
                 
                 # APLICAR FIX DE DATAS COM LOGS DETALHADOS
-                data_cadastro_fixed = fix_daycoval_date(str(data_cadastro_raw) if data_cadastro_raw else "", "DATA_CADASTRO")
-                data_pagamento_fixed = fix_daycoval_date(str(data_liberacao_raw) if data_liberacao_raw else "", "DATA_PAGAMENTO")
+                data_cadastro_fixed = preformatted["DATA_CADASTRO"][idx]
+                data_pagamento_fixed = preformatted["DATA_PAGAMENTO"][idx]
                 
                 logging.info(f"DAYCOVAL DATAS - ANTES: cadastro='{data_cadastro_raw}', pagamento='{data_liberacao_raw}'")
                 logging.info(f"DAYCOVAL DATAS - DEPOIS: cadastro='{data_cadastro_fixed}', pagamento='{data_pagamento_fixed}'")
@@ -4910,11 +6071,11 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
                 valor_liberado_raw = str(row.get('Unnamed: 12', '')).strip()  # Vl. Liberado
                 cpf_raw = str(row.get('Unnamed: 4', '')).strip()             # CPF/CNPJ Proponente
                 
-                # Usar as funções globais de formatação
-                valor_operacao_formatted = format_value_brazilian(valor_operacao_raw)
-                valor_liberado_formatted = format_value_brazilian(valor_liberado_raw)
-                valor_parcela_formatted = format_value_brazilian(valor_parcela_raw)
-                cpf_formatted = format_cpf_global(cpf_raw)
+                # Valores já formatados por coluna antes do loop
+                valor_operacao_formatted = preformatted["VALOR_OPERACAO"][idx]
+                valor_liberado_formatted = preformatted["VALOR_LIBERADO"][idx]
+                valor_parcela_formatted = preformatted["VALOR_PARCELA"][idx]
+                cpf_formatted = preformatted["CPF"][idx]
                 
                 logging.info(f"✅ PAULISTA formatado: CPF={cpf_formatted}, Valor={valor_operacao_formatted}, Órgão={orgao_detectado}")
                 
@@ -4995,20 +6156,18 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
             
             # ✅ FORMATAÇÃO BRASILEIRA para BRB
             # Converter valores para formato brasileiro COM R$
+            # (valores formatados por coluna antes do loop)
             valor_operacao = normalized_row.get("VALOR_OPERACAO", "")
             if valor_operacao:
-                valor_formatado = format_value_brazilian(valor_operacao)
-                normalized_row["VALOR_OPERACAO"] = f"R$ {valor_formatado}"
+                normalized_row["VALOR_OPERACAO"] = f"R$ {preformatted['VALOR_PROPOSTA'][idx]}"
             
             valor_liberado = normalized_row.get("VALOR_LIBERADO", "")
             if valor_liberado:
-                valor_formatado = format_value_brazilian(valor_liberado)
-                normalized_row["VALOR_LIBERADO"] = f"R$ {valor_formatado}"
+                normalized_row["VALOR_LIBERADO"] = f"R$ {preformatted['VALOR_PROPOSTA'][idx]}"
             
             valor_parcelas = normalized_row.get("VALOR_PARCELAS", "")
             if valor_parcelas:
-                valor_formatado = format_value_brazilian(valor_parcelas)
-                normalized_row["VALOR_PARCELAS"] = f"R$ {valor_formatado}"
+                normalized_row["VALOR_PARCELAS"] = f"R$ {preformatted['VALOR_PARCELA'][idx]}"
             
             # Formatar CPF para padrão brasileiro (vem sem formatação: 13097582800)
             normalized_row["CPF"] = format_cpf_global(normalized_row.get("CPF", ""))
@@ -5306,34 +6465,7 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
         # Aplicar mapeamento de status (normalização completa)
         if normalized_row.get("SITUACAO"):
             situacao_original = str(normalized_row["SITUACAO"]).strip()
-            situacao_lower = situacao_original.lower()
-            
-            # Tentar encontrar no mapeamento
-            situacao_normalizada = STATUS_MAPPING.get(situacao_lower, None)
-            
-            # Se não encontrou exato, tentar normalizar caracteres especiais e espaços
-            if not situacao_normalizada:
-                # Remover acentos e caracteres especiais para busca mais flexível
-                import unicodedata
-                situacao_clean = ''.join(
-                    c for c in unicodedata.normalize('NFD', situacao_lower)
-                    if unicodedata.category(c) != 'Mn'
-                )
-                situacao_clean = situacao_clean.replace('/', ' ').replace('-', ' ').strip()
-                situacao_clean = ' '.join(situacao_clean.split())  # Remove espaços múltiplos
-                
-                # Tentar encontrar novamente
-                situacao_normalizada = STATUS_MAPPING.get(situacao_clean, None)
-            
-            # Se ainda não encontrou, fazer busca por palavras-chave
-            if not situacao_normalizada:
-                situacao_palavras = situacao_lower.lower()
-                if any(word in situacao_palavras for word in ['pag', 'integra', 'finaliz', 'quitad', 'liberad', 'desembolsa', 'aprovad']):
-                    situacao_normalizada = "PAGO"
-                elif any(word in situacao_palavras for word in ['cancel', 'reprov', 'rejeit', 'negad', 'expirad', 'invalid', 'recus', 'desist']):
-                    situacao_normalizada = "CANCELADO"
-                elif any(word in situacao_palavras for word in ['aguard', 'pendent', 'aberto', 'digital', 'andament', 'analise', 'process', 'formal', 'cadastr', 'enviad']):
-                    situacao_normalizada = "AGUARDANDO"
+            situacao_normalizada = normalize_status_text(situacao_original)
             
             # Aplicar a normalização (ou manter original se não encontrou)
             normalized_row["SITUACAO"] = situacao_normalizada if situacao_normalizada else situacao_original
@@ -5582,7 +6714,7 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
             logging.warning(f"⚠️ PROPOSTA {normalized_row.get('PROPOSTA', 'N/A')}: CODIGO_TABELA vazio, definido como SEM_CODIGO")
         
         # 🔍 PRESERVAR DATAS ORIGINAIS - não deixar o mapeamento alterar
-        # EXCETO para DAYCOVAL que já foram corrigidas pelo fix_daycoval_date()
+        # EXCETO para DAYCOVAL que já foram corrigidas pelo fix_daycoval_date_column()
         data_cadastro_original = normalized_row.get('DATA_CADASTRO', '')
         data_pagamento_original = normalized_row.get('DATA_PAGAMENTO', '')
         banco_atual = normalized_row.get('BANCO', '').upper()
@@ -5591,14 +6723,14 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
         logging.info(f"📗 DEPOIS do mapeamento - PROPOSTA {normalized_row.get('PROPOSTA', 'N/A')}: ORGAO={normalized_row.get('ORGAO', '')}, CODIGO_TABELA={normalized_row.get('CODIGO_TABELA', '')}, TAXA={normalized_row.get('TAXA', '')}, OPERACAO={normalized_row.get('TIPO_OPERACAO', '')}")
         
         # ✅ GARANTIR que as datas originais sejam mantidas
-        # ⚠️  EXCETO para DAYCOVAL que precisa manter as datas corrigidas pelo fix_daycoval_date()
+        # ⚠️  EXCETO para DAYCOVAL que precisa manter as datas corrigidas pelo fix_daycoval_date_column()
         if data_cadastro_original and 'DAYCOVAL' not in banco_atual:
             normalized_row['DATA_CADASTRO'] = data_cadastro_original
         if data_pagamento_original and 'DAYCOVAL' not in banco_atual: 
             normalized_row['DATA_PAGAMENTO'] = data_pagamento_original
             
         if 'DAYCOVAL' in banco_atual:
-            logging.info(f"🔧 DAYCOVAL - MANTENDO datas corrigidas pelo fix_daycoval_date(): CADASTRO='{normalized_row.get('DATA_CADASTRO')}' | PAGAMENTO='{normalized_row.get('DATA_PAGAMENTO')}'")
+            logging.info(f"🔧 DAYCOVAL - MANTENDO datas corrigidas pelo fix_daycoval_date_column(): CADASTRO='{normalized_row.get('DATA_CADASTRO')}' | PAGAMENTO='{normalized_row.get('DATA_PAGAMENTO')}'")
         else:
             logging.info(f"📅 DATAS FINAIS PRESERVADAS - PROPOSTA {normalized_row.get('PROPOSTA', 'N/A')}: CADASTRO='{normalized_row.get('DATA_CADASTRO')}' | PAGAMENTO='{normalized_row.get('DATA_PAGAMENTO')}'")
 
@@ -5690,7 +6822,10 @@ def normalize_bank_data(df: pd.DataFrame, bank_type: str) -> pd.DataFrame:
         logging.error(f"❌ [{bank_type}] Após filtrar None, nenhum dado restou!")
         return pd.DataFrame()
     
-    return pd.DataFrame(normalized_data_clean)
+    normalized_df = pd.DataFrame(normalized_data_clean)
+    if date_order_report:
+        normalized_df.attrs["date_order_report"] = date_order_report
+    return normalized_df
 
 def _get_daycoval_operation_type(table_description: str) -> str:
     """Determina o tipo de operação baseado na descrição da tabela do Daycoval"""
@@ -5705,8 +6840,36 @@ def _get_daycoval_operation_type(table_description: str) -> str:
     else:
         return "MARGEM LIVRE (NOVO)"
 
-def map_to_final_format(df: pd.DataFrame, bank_type: str) -> tuple[pd.DataFrame, int]:
-    """Mapear dados para o formato final de 24 colunas com estatísticas de mapeamento"""
+# 🗂️ Colunas de poucos valores distintos do relatório final: categóricas do mapeamento até a saída
+OUTPUT_CATEGORICAL_COLUMNS = [
+    "BANCO", "ORGAO", "SITUACAO", "TIPO DE OPERACAO", "TAXA", "FORMALIZACAO DIGITAL", "CODIGO TABELA"
+]
+
+def as_output_categoricals(df: pd.DataFrame) -> pd.DataFrame:
+    """Converte as colunas de OUTPUT_CATEGORICAL_COLUMNS presentes em pandas categorical"""
+    for column in OUTPUT_CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+    return df
+
+def share_output_categories(frames: List[pd.DataFrame]) -> List[pd.DataFrame]:
+    """Dá a cada coluna categórica as mesmas categorias em todos os bancos - sem isso o pd.concat
+    volta a coluna para object"""
+    for column in OUTPUT_CATEGORICAL_COLUMNS:
+        present = [frame[column] for frame in frames
+                   if column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)]
+        if not present:
+            continue
+        categories = union_categoricals(present, ignore_order=True).categories
+        for frame in frames:
+            if column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = frame[column].cat.set_categories(categories)
+    return frames
+
+def map_to_final_format(df: pd.DataFrame, bank_type: str, timer: Optional[StageTimer] = None) -> tuple[pd.DataFrame, int]:
+    """Mapear dados para o formato final de 24 colunas com estatísticas de mapeamento
+    Com timer, registra as etapas 'normalize' e 'map' separadamente
+    """
     try:
         # Debug específico para PAULISTA
         if bank_type == "PAULISTA":
@@ -5716,7 +6879,10 @@ def map_to_final_format(df: pd.DataFrame, bank_type: str) -> tuple[pd.DataFrame,
                 logging.info(f"   Linha {idx}: Unnamed:0='{row.get('Unnamed: 0', 'N/A')}'")
         
         # Primeiro normalizar os dados
-        normalized_df = normalize_bank_data(df, bank_type)
+        with timed_stage(timer, "normalize", rows_in=len(df)) as stage:
+            normalized_df = normalize_bank_data(df, bank_type)
+            stage["rows_out"] = len(normalized_df)
+        map_stage = timer.begin("map", rows_in=len(normalized_df)) if timer is not None else None
         
         if normalized_df.empty:
             logging.warning(f"Dados normalizados vazios para banco {bank_type}")
@@ -5733,6 +6899,7 @@ def map_to_final_format(df: pd.DataFrame, bank_type: str) -> tuple[pd.DataFrame,
         
         final_data = []
         mapped_count = 0
+        money_columns = ("VALOR PARCELAS", "VALOR OPERACAO", "VALOR LIBERADO")
         
         for _, row in normalized_df.iterrows():
             situacao = row.get("SITUACAO", "")
@@ -5742,19 +6909,6 @@ def map_to_final_format(df: pd.DataFrame, bank_type: str) -> tuple[pd.DataFrame,
             if situacao.upper() != "PAGO":
                 data_pagamento = ""
             
-            # 🌎 APLICAR FORMATAÇÃO GLOBAL BRASILEIRA (CPF + Valores Monetários)
-            cpf_raw = row.get("CPF", "")
-            cpf_formatted = format_cpf_global(cpf_raw)
-            
-            valor_parcelas_raw = row.get("VALOR_PARCELAS", "")
-            valor_parcelas_formatted = format_value_brazilian(valor_parcelas_raw)
-            
-            valor_operacao_raw = row.get("VALOR_OPERACAO", "")
-            valor_operacao_formatted = format_value_brazilian(valor_operacao_raw)
-            
-            valor_liberado_raw = row.get("VALOR_LIBERADO", "")
-            valor_liberado_formatted = format_value_brazilian(valor_liberado_raw)
-            
             final_row = {
                 "PROPOSTA": row.get("PROPOSTA", ""),
                 "DATA CADASTRO": row.get("DATA_CADASTRO", ""),
@@ -5763,15 +6917,15 @@ def map_to_final_format(df: pd.DataFrame, bank_type: str) -> tuple[pd.DataFrame,
                 "CODIGO TABELA": row.get("CODIGO_TABELA", ""),
                 "TIPO DE OPERACAO": row.get("TIPO_OPERACAO", ""),
                 "NUMERO PARCELAS": row.get("NUMERO_PARCELAS", ""),
-                "VALOR PARCELAS": valor_parcelas_formatted,  # ✅ Formatado em padrão brasileiro
-                "VALOR OPERACAO": valor_operacao_formatted,  # ✅ Formatado em padrão brasileiro
-                "VALOR LIBERADO": valor_liberado_formatted,  # ✅ Formatado em padrão brasileiro
+                "VALOR PARCELAS": row.get("VALOR_PARCELAS", ""),  # Formatados depois em format_money_series (1.255,00)
+                "VALOR OPERACAO": row.get("VALOR_OPERACAO", ""),
+                "VALOR LIBERADO": row.get("VALOR_LIBERADO", ""),
                 "VALOR QUITAR": "",
                 "USUARIO BANCO": row.get("USUARIO_BANCO", ""),
                 "CODIGO LOJA": "",
                 "SITUACAO": situacao,
                 "DATA DE PAGAMENTO": data_pagamento,
-                "CPF": cpf_formatted,  # ✅ Formatado em padrão brasileiro (XXX.XXX.XXX-XX)
+                "CPF": row.get("CPF", ""),  # Formatado depois em format_cpf_series (XXX.XXX.XXX-XX)
                 "NOME": row.get("NOME", ""),
                 "DATA DE NASCIMENTO": row.get("DATA_NASCIMENTO", ""),
                 "TIPO DE CONTA": "",
@@ -5787,14 +6941,32 @@ def map_to_final_format(df: pd.DataFrame, bank_type: str) -> tuple[pd.DataFrame,
             if final_row["CODIGO TABELA"]:
                 mapped_count += 1
             
-            # Limpar valores 'nan'
+            # Limpar valores 'nan' (valores monetários são limpos depois de formatados)
             for key, value in final_row.items():
-                if str(value).lower() in ['nan', 'none', 'null', '']:
+                if key not in money_columns and str(value).lower() in ['nan', 'none', 'null', '']:
                     final_row[key] = ""
             
             final_data.append(final_row)
         
         result_df = pd.DataFrame(final_data)
+        result_df.attrs.update(normalized_df.attrs)
+        
+        # 🌎 CPF formatado de uma vez para a coluna inteira (mesmas regras de format_cpf_global)
+        if "CPF" in result_df.columns:
+            result_df["CPF"] = format_cpf_series(result_df["CPF"])
+            result_df.loc[result_df["CPF"].str.lower().isin(['nan', 'none', 'null']), "CPF"] = ""
+        
+        # 💰 Valores monetários formatados por coluna (convenção BR/US decidida uma vez por coluna)
+        for column in money_columns:
+            if column in result_df.columns:
+                result_df[column] = format_money_series(result_df[column], column)
+                result_df.loc[result_df[column].str.lower().isin(['nan', 'none', 'null']), column] = ""
+        
+        result_df = as_output_categoricals(result_df)
+        if map_stage is not None:
+            map_stage["rows_out"] = len(result_df)
+            timer.end(map_stage)
+        
         logging.info(f"Mapeamento concluído para {bank_type}: {len(result_df)} registros, {mapped_count} mapeados")
         return result_df, mapped_count
         
@@ -5802,59 +6974,49 @@ def map_to_final_format(df: pd.DataFrame, bank_type: str) -> tuple[pd.DataFrame,
         logging.error(f"Erro no mapeamento para {bank_type}: {str(e)}")
         return pd.DataFrame(), 0
 
-def remove_duplicates_enhanced(df: pd.DataFrame, storm_data: Dict[str, str]) -> pd.DataFrame:
-    """Remoção aprimorada de duplicatas baseada na Storm - usa ADE para comparação precisa"""
+def remove_duplicates_enhanced(df: pd.DataFrame, storm_data: Dict[str, str]) -> tuple[pd.DataFrame, Dict[str, int]]:
+    """Remoção aprimorada de duplicatas baseada na Storm - usa ADE para comparação precisa
+    Retorna o DataFrame filtrado e a contagem de removidos por status (PAGO/CANCELADO)
+    """
+    removed_by_status = {"PAGO": 0, "CANCELADO": 0}
     if df.empty:
-        return df
-    
-    filtered_data = []
-    removed_count = 0
-    pago_removido = 0
-    cancelado_removido = 0
+        return df, removed_by_status
     
     logging.info(f"🔍 Verificando {len(df)} registros contra {len(storm_data)} ADEs da Storm")
     
-    for _, row in df.iterrows():
-        proposta = str(row.get('PROPOSTA', '')).strip()
-        
-        if not proposta or proposta.lower() in ['nan', 'null', '']:
-            # Se não tem proposta válida, incluir mesmo assim
-            filtered_data.append(row.to_dict())
-            continue
-        
-        # Limpar proposta para comparar com ADEs da Storm (apenas números)
-        proposta_clean = ''.join(c for c in proposta if c.isdigit())
-        
-        # Verificar se ADE existe na Storm e está PAGO/CANCELADO
-        skip_record = False
-        matched_status = None
-        
-        # Comparação exata de ADE 
-        if proposta_clean in storm_data:
-            matched_status = storm_data[proposta_clean]
-            if matched_status in ["PAGO", "CANCELADO"]:
-                skip_record = True
-                removed_count += 1
-                if matched_status == "PAGO":
-                    pago_removido += 1
-                else:
-                    cancelado_removido += 1
-                
-                # Log apenas algumas para debug
-                if removed_count <= 3:
-                    logging.info(f"🚫 Removendo duplicata: ADE={proposta_clean} Status={matched_status}")
-        
-        # Se não foi removido como duplicata, incluir no resultado
-        if not skip_record:
-            filtered_data.append(row.to_dict())
+    if "PROPOSTA" not in df.columns:
+        # Sem coluna PROPOSTA não há como comparar - manter tudo
+        return df.reset_index(drop=True), removed_by_status
+    
+    # ⚡ Normalizar PROPOSTA vetorizado: apenas números, como as ADEs da Storm
+    propostas = df["PROPOSTA"].astype(str).str.strip()
+    has_proposta = ~propostas.str.lower().isin(['nan', 'null', ''])
+    proposta_clean = propostas.str.replace(r'\D', '', regex=True)
+    
+    # Índice Storm restrito a PAGO/CANCELADO (são as únicas que bloqueiam o registro)
+    storm_series = pd.Series(storm_data, dtype=object)
+    blocking = storm_series[storm_series.isin(["PAGO", "CANCELADO"])]
+    matched_status = proposta_clean.map(blocking)
+    
+    remove_mask = has_proposta & matched_status.notna()
+    removed_counts = matched_status[remove_mask].value_counts()
+    for status, count in removed_counts.items():
+        removed_by_status[status] = int(count)
+    removed_count = int(remove_mask.sum())
+    
+    # Log apenas algumas para debug
+    for ade, status in zip(proposta_clean[remove_mask].head(3), matched_status[remove_mask].head(3)):
+        logging.info(f"🚫 Removendo duplicata: ADE={ade} Status={status}")
+    
+    filtered_df = df[~remove_mask].reset_index(drop=True)
     
     logging.info(f"📊 DUPLICATAS PROCESSADAS:")
-    logging.info(f"   ✅ Registros mantidos: {len(filtered_data)}")
+    logging.info(f"   ✅ Registros mantidos: {len(filtered_df)}")
     logging.info(f"   🚫 Total removidos: {removed_count}")
-    logging.info(f"      💰 PAGO removidos: {pago_removido}")
-    logging.info(f"      ❌ CANCELADO removidos: {cancelado_removido}")
+    logging.info(f"      💰 PAGO removidos: {removed_by_status['PAGO']}")
+    logging.info(f"      ❌ CANCELADO removidos: {removed_by_status['CANCELADO']}")
     
-    return pd.DataFrame(filtered_data)
+    return filtered_df, removed_by_status
 
 def format_csv_for_storm(df: pd.DataFrame) -> str:
     """Formatar CSV otimizado para importação na Storm com separador ';'"""
@@ -5878,48 +7040,31 @@ def format_csv_for_storm(df: pd.DataFrame) -> str:
     # 🧹 LIMPEZA ROBUSTA: Aplicar limpeza de caracteres especiais no relatório final
     logging.info(f"🧹 Aplicando limpeza de caracteres especiais no relatório final ({len(df_ordered)} linhas)")
     
+    def clean_output_text(value):
+        cleaned = clean_special_characters(value)
+        return '' if cleaned in ['nan', 'None', 'null', 'NaN'] else cleaned
+    
     for col in df_ordered.columns:
-        df_ordered[col] = df_ordered[col].astype(str).apply(clean_special_characters)
+        if isinstance(df_ordered[col].dtype, pd.CategoricalDtype):
+            # Categóricas continuam categóricas: limpeza só nas categorias (nulos saem vazios no CSV)
+            df_ordered[col] = transform_unique_values(df_ordered[col], clean_output_text)
+            continue
+        df_ordered[col] = transform_unique_values(df_ordered[col].astype(str), clean_special_characters)
         df_ordered[col] = df_ordered[col].replace(['nan', 'None', 'null', 'NaN'], '')
     
     logging.info(f"✅ Limpeza de caracteres especiais concluída no relatório final")
     
     # 🔧 FIX: Corrigir formatação do CPF digitador (USUARIO BANCO) no relatório final
     if "USUARIO BANCO" in df_ordered.columns:
-        def format_cpf_usuario_banco(cpf_str):
-            """Manter formato original dos bancos que já vêm corretos
-            QUERO MAIS, C6, PAULISTA, DIGIO, etc: Códigos como '12345678901_202902' MANTÉM com underscore
-            Apenas formatar como CPF se for CPF puro sem código
-            """
-            if not cpf_str or cpf_str in ['', '0', '000.000.000-00']:
-                return ''  # ✅ Retornar vazio em vez de CPF falso
-            
-            cpf_clean = str(cpf_str).strip()
-            
-            # 🎯 Se contém underscore, é formato banco correto - MANTER COMO ESTÁ
-            if '_' in cpf_clean:
-                # Ex: "12345678901_202902" → "12345678901_202902" (manter original)
-                return cpf_clean
-            
-            # 🎯 Se tem mais de 14 dígitos, provavelmente é código longo - manter como está  
-            cpf_digits = ''.join(filter(str.isdigit, cpf_clean))
-            if len(cpf_digits) > 14:
-                return cpf_clean  # Manter códigos longos originais
-            
-            # 🎯 CPF normal (sem código): formatar no padrão brasileiro
-            if len(cpf_digits) == 11:
-                return f"{cpf_digits[:3]}.{cpf_digits[3:6]}.{cpf_digits[6:9]}-{cpf_digits[9:11]}"
-            else:
-                # Menos de 11 dígitos ou formato especial, manter original
-                return cpf_clean
-        
-        df_ordered["USUARIO BANCO"] = df_ordered["USUARIO BANCO"].apply(format_cpf_usuario_banco)
+        # Códigos com underscore e códigos longos (QUERO MAIS, C6, PAULISTA, DIGIO...) ficam como vieram;
+        # só CPF puro com 11 dígitos é formatado no padrão brasileiro
+        df_ordered["USUARIO BANCO"] = format_usuario_banco_series(df_ordered["USUARIO BANCO"])
     
     # Formatar datas para DD/MM/YYYY (padrão brasileiro)
     date_columns = ["DATA CADASTRO", "DATA DE PAGAMENTO", "DATA DE NASCIMENTO"]
     for date_col in date_columns:
         if date_col in df_ordered.columns:
-            df_ordered[date_col] = df_ordered[date_col].apply(lambda x: format_date_to_brazilian(x))
+            df_ordered[date_col] = format_date_series(df_ordered[date_col], date_col)
     
     # Usar separador ';' como solicitado
     return df_ordered.to_csv(index=False, sep=';', encoding='utf-8', lineterminator='\n')
@@ -5962,6 +7107,1558 @@ def format_date_to_brazilian(date_str: str) -> str:
     
     return date_str  # Retorna original se não conseguir converter
 
+# ===== MOTOR DE DATAS POR COLUNA =====
+
+# Formatos reconhecidos na amostra da coluna (regex estrita, formato strptime ou None = já está no padrão)
+DATE_COLUMN_FORMATS = {
+    "DD/MM/YYYY": (r'\d{2}/\d{2}/\d{4}', None),
+    "YYYY-MM-DD": (r'\d{4}-\d{2}-\d{2}', '%Y-%m-%d'),
+    "YYYY-MM-DD HH:MM:SS": (r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', '%Y-%m-%d %H:%M:%S'),
+    "DD/MM/YY": (r'\d{1,2}/\d{1,2}/\d{2}', None),
+}
+
+# A regra individual cai em pd.to_datetime(dayfirst=True) para "YYYY-MM-DD HH:MM:SS", que nesta versão
+# do pandas lê ano-dia-mês quando o dia cabe como mês (2025-08-12 10:00:00 → 08/12/2025).
+# O motor por coluna reproduz isso para a saída continuar idêntica.
+_DAYFIRST_SWAPS_ISO_DATETIME = pd.to_datetime('2000-01-02 00:00:00', dayfirst=True).month == 2
+
+def detect_date_format(text: pd.Series, sample_size: int = 500) -> Optional[str]:
+    """Formato dominante entre os valores não vazios de uma amostra da coluna (None se nenhum casar)"""
+    sample = text[text != ''].head(sample_size)
+    if sample.empty:
+        return None
+    counts = {
+        name: int(sample.str.fullmatch(pattern).sum())
+        for name, (pattern, _) in DATE_COLUMN_FORMATS.items()
+    }
+    best = max(counts, key=counts.get)
+    return best if counts[best] > 0 else None
+
+def _convert_date_format(text: pd.Series, date_format: str) -> pd.Series:
+    """Converte valores que casam com o formato para DD/MM/YYYY; NaN onde a data é inválida"""
+    _, strptime_format = DATE_COLUMN_FORMATS[date_format]
+    if date_format == "DD/MM/YYYY":
+        return text
+    if date_format == "DD/MM/YY":
+        parts = text.str.split('/', expand=True)
+        century = np.where(parts[2].astype(int) < 50, '20', '19')
+        year = century + parts[2]
+        return parts[0].str.zfill(2) + '/' + parts[1].str.zfill(2) + '/' + year
+    parsed = pd.to_datetime(text, format=strptime_format, errors='coerce')
+    converted = parsed.dt.strftime('%d/%m/%Y').where(parsed.notna())
+    if date_format == "YYYY-MM-DD HH:MM:SS" and _DAYFIRST_SWAPS_ISO_DATETIME:
+        swapped = parsed.notna() & (parsed.dt.day <= 12)
+        converted[swapped] = parsed[swapped].dt.strftime('%m/%d/%Y')
+    return converted
+
+def format_date_series(date_series: pd.Series, column_name: str = "") -> pd.Series:
+    """Versão por coluna de format_date_to_brazilian: detecta o formato dominante numa amostra,
+    converte a coluna inteira de uma vez e só manda para a função escalar os valores que sobrarem"""
+    return _apply_on_uniques(date_series, lambda values: _format_date_values(values, column_name))
+
+def _format_date_values(date_series: pd.Series, column_name: str) -> pd.Series:
+    if date_series.empty:
+        return date_series.astype(object)
+    values = date_series if date_series.dtype == object else date_series.astype(object)
+    text = values.astype(str).str.strip()
+    
+    result = pd.Series(np.nan, index=values.index, dtype=object)
+    date_format = detect_date_format(text)
+    if date_format:
+        pattern, _ = DATE_COLUMN_FORMATS[date_format]
+        matches = text.str.fullmatch(pattern).fillna(False).astype(bool)
+        if matches.any():
+            result[matches] = _convert_date_format(text[matches], date_format)
+    
+    # Vazios, outros formatos e datas inválidas seguem a regra escalar
+    stragglers = result.isna()
+    if stragglers.any():
+        result[stragglers] = values[stragglers].map(format_date_to_brazilian)
+    if column_name:
+        logging.info(f"📅 {column_name}: formato dominante {date_format or 'não identificado'}, {int(stragglers.sum())} valores pela regra individual")
+    return result
+
+# ===== UPLOADS COMPACTADOS (.gz / .zip / .xz) =====
+
+# Limite do conteúdo descompactado por arquivo (protege contra "zip bombs")
+MAX_DECOMPRESSED_BYTES = int(float(os.environ.get('MAX_DECOMPRESSED_MB', '1024')) * MB)
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+COMPRESSED_SUFFIXES = {'.gz': 'gzip', '.gzip': 'gzip', '.xz': 'xz', '.zip': 'zip'}
+
+def compression_of(fileobj, filename: str) -> Optional[str]:
+    """Formato de compressão pela extensão; gzip/xz também pelos bytes mágicos (xlsx é ZIP, então zip só pela extensão)"""
+    suffix = Path(filename.lower()).suffix
+    if suffix in COMPRESSED_SUFFIXES:
+        return COMPRESSED_SUFFIXES[suffix]
+    head = fileobj.read(len(XZ_MAGIC))
+    fileobj.seek(0)
+    if head.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if head.startswith(XZ_MAGIC):
+        return 'xz'
+    return None
+
+def zip_data_entries(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """Entradas de dados do ZIP, sem diretórios nem metadados do macOS/arquivos ocultos"""
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith('__MACOSX/')
+        and not Path(info.filename).name.startswith('.')
+    ]
+
+def drain_decompressed(stream, label: str, limit: int = MAX_DECOMPRESSED_BYTES) -> bytes:
+    """Descompacta em blocos direto para o buffer final (BytesIO.getvalue não copia o buffer)"""
+    output = io.BytesIO()
+    while True:
+        chunk = stream.read(DECOMPRESS_CHUNK_SIZE)
+        if not chunk:
+            break
+        output.write(chunk)
+        if output.tell() > limit:
+            raise HTTPException(
+                status_code=413,
+                detail=f"'{label}' passa de {limit // MB} MB descompactado (MAX_DECOMPRESSED_MB)"
+            )
+    return output.getvalue()
+
+def read_upload_content(fileobj, filename: str) -> tuple[bytes, str]:
+    """
+    Lê o upload, descompactando .gz/.xz/.zip em streaming a partir do arquivo temporário
+    do upload: o compactado nunca é carregado inteiro na memória junto com o descompactado.
+    Retorna (conteúdo, nome do arquivo interno) - o nome interno define o leitor (csv/xlsx/txt).
+    """
+    fileobj.seek(0)
+    compression = compression_of(fileobj, filename)
+    if compression is None:
+        return fileobj.read(), filename
+
+    inner_name = filename[:-len(Path(filename).suffix)] if Path(filename.lower()).suffix in COMPRESSED_SUFFIXES else filename
+    try:
+        if compression == 'gzip':
+            with gzip.GzipFile(fileobj=fileobj, mode='rb') as stream:
+                content = drain_decompressed(stream, filename)
+        elif compression == 'xz':
+            with lzma.LZMAFile(fileobj, mode='rb') as stream:
+                content = drain_decompressed(stream, filename)
+        else:
+            with zipfile.ZipFile(fileobj) as archive:
+                entries = zip_data_entries(archive)
+                if not entries:
+                    raise HTTPException(status_code=400, detail=f"ZIP '{filename}' não contém arquivos")
+                if len(entries) > 1:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"ZIP '{filename}' contém {len(entries)} arquivos; envie um arquivo por ZIP"
+                    )
+                inner_name = Path(entries[0].filename).name
+                with archive.open(entries[0]) as stream:
+                    content = drain_decompressed(stream, f"{filename}/{inner_name}")
+    except (OSError, EOFError, lzma.LZMAError, zipfile.BadZipFile, zlib.error) as e:
+        raise HTTPException(status_code=400, detail=f"Arquivo compactado inválido ou truncado '{filename}': {str(e)}")
+
+    pipeline_metrics.inc("qfaz_uploads_decompressed_total", format=compression)
+    logging.info(f"🗜️ '{filename}' descompactado ({compression}) → '{inner_name}' com {len(content) / MB:.1f} MB")
+    return content, inner_name
+
+async def read_upload(file: UploadFile) -> tuple[bytes, str]:
+    """Conteúdo (descompactado se preciso) e nome efetivo de um UploadFile"""
+    return read_upload_content(file.file, file.filename)
+
+# Lote ZIP (/api/process-batch): arquivos de banco processados em paralelo direto do ZIP
+BATCH_WORKERS = max(int(os.environ.get('BATCH_WORKERS', str(min(4, os.cpu_count() or 1)))), 1)
+BATCH_EXTENSIONS = ('csv', 'txt', 'xlsx', 'xls')
+# Bytes descompactados lidos de cada CSV/TXT para detectar o banco (planilhas são lidas inteiras)
+BATCH_PEEK_BYTES = 256 * 1024
+
+def read_zip_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    """Conteúdo de uma entrada, descompactado em memória (sem extrair para o disco)"""
+    with archive.open(info) as stream:
+        return drain_decompressed(stream, info.filename)
+
+def detect_zip_entry(archive: zipfile.ZipFile, info: zipfile.ZipInfo) -> str:
+    """Banco de uma entrada do lote pelas primeiras linhas, sem descompactar o arquivo inteiro"""
+    name = Path(info.filename).name
+    if name.lower().split('.')[-1] in ('xlsx', 'xls'):
+        sample = read_zip_entry(archive, info)
+    else:
+        with archive.open(info) as stream:
+            sample = stream.read(BATCH_PEEK_BYTES)
+        if len(sample) == BATCH_PEEK_BYTES:
+            sample = sample[:sample.rfind(b'\n') + 1] or sample  # Sem a última linha incompleta
+    head = read_file_optimized(sample, name, nrows=HEADER_PEEK_ROWS)
+    return detect_bank_type_enhanced(head.dropna(how='all'), name)
+
+class GzipRequestMiddleware:
+    """
+    Aceita corpos de requisição com Content-Encoding: gzip, descompactando em streaming
+    à medida que o corpo chega (o multipart é montado já sobre o conteúdo descompactado).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = list(scope["headers"])
+        encoding = next((value for name, value in headers if name == b"content-encoding"), b"").strip().lower()
+        if encoding != b"gzip":
+            return await self.app(scope, receive, send)
+
+        # O tamanho muda com a descompressão: o corpo segue sem content-length
+        scope = dict(scope, headers=[(name, value) for name, value in headers
+                                     if name not in (b"content-encoding", b"content-length")])
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        received = 0
+
+        def count(part: bytes) -> bytes:
+            nonlocal received
+            received += len(part)
+            if received > MAX_DECOMPRESSED_BYTES:
+                raise HTTPException(status_code=413, detail=f"Corpo passa de {MAX_DECOMPRESSED_BYTES // MB} MB descompactado")
+            return part
+
+        async def receive_decompressed():
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            # Descompacta em blocos de até DECOMPRESS_CHUNK_SIZE: um pedaço pequeno de gzip bomb
+            # estoura o limite sem antes expandir tudo na memória
+            parts, data = [], message.get("body", b"")
+            try:
+                while data:
+                    parts.append(count(decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE)))
+                    data = decompressor.unconsumed_tail
+                if not message.get("more_body", False):
+                    parts.append(count(decompressor.flush()))
+            except zlib.error as e:
+                raise HTTPException(status_code=400, detail=f"Corpo gzip inválido: {str(e)}")
+            return {**message, "body": b"".join(parts)}
+
+        try:
+            await self.app(scope, receive_decompressed, send)
+        except HTTPException as e:
+            response = JSONResponse({"detail": e.detail}, status_code=e.status_code)
+            await response(scope, receive, send)
+
+# ===== CACHE DE PARSING POR CONTEÚDO (SHA-256) =====
+
+# Versão do formato do cache - incrementar sempre que a leitura/detecção mudar
+# 2: detecção por assinaturas compiladas do inventário (itens antigos podem ter o banco errado)
+# 3: leitura com espiada no cabeçalho + perfis de leitor (muda o DataFrame e o banco guardados)
+# 4: rótulos de relatório (colunas 'Unnamed') nas assinaturas, pontuados nas primeiras linhas
+PARSE_CACHE_VERSION = 4
+
+class ParsedUploadCache:
+    """
+    Cache em disco dos arquivos já lidos e detectados, indexado pelo SHA-256 do upload.
+    Guarda o DataFrame limpo + tipo de banco em .npz sem objetos Python (cada coluna de texto
+    vira um bloco UTF-8 separado por NUL; nada é desserializado com pickle, então um arquivo
+    plantado no diretório não executa código) e remove os itens usados há mais tempo
+    (LRU por mtime) quando passa do limite de bytes. O diretório precisa ser do próprio processo
+    e fechado para os outros usuários; se não for, o cache fica desligado.
+    """
+
+    SUFFIX = ".npz"
+    # Separador das células de texto; frames com NUL em alguma célula não são guardados
+    SEPARATOR = "\x00"
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._usable = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(file_content: bytes, filename: str) -> str:
+        """Chave = SHA-256 do conteúdo (+ nome do arquivo, que também influencia a detecção)"""
+        digest = hashlib.sha256(file_content).hexdigest()
+        name_digest = hashlib.sha256((filename or "").lower().encode('utf-8')).hexdigest()[:8]
+        return f"v{PARSE_CACHE_VERSION}_{digest}_{name_digest}"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.SUFFIX}"
+
+    def _dir_usable(self) -> bool:
+        """Cria o diretório com modo 0700 e recusa um que seja de outro usuário ou gravável por outros"""
+        if self._usable is None:
+            try:
+                self.cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+                st = os.lstat(self.cache_dir)
+                problem = None
+                if not stat.S_ISDIR(st.st_mode):
+                    problem = "não é um diretório (link simbólico?)"
+                elif hasattr(os, 'getuid') and st.st_uid != os.getuid():
+                    problem = f"pertence ao uid {st.st_uid}, não ao processo ({os.getuid()})"
+                elif st.st_mode & 0o022:
+                    problem = f"gravável por outros usuários (modo {stat.S_IMODE(st.st_mode):o})"
+            except OSError as e:
+                problem = str(e)
+            if problem:
+                logging.warning(f"⚠️ Cache de parsing desligado - diretório {self.cache_dir} {problem}")
+            self._usable = problem is None
+        return self._usable
+
+    @classmethod
+    def _encode(cls, df: pd.DataFrame, bank_type: str) -> Optional[Dict[str, np.ndarray]]:
+        """DataFrame → arrays sem dtype object (None se alguma coluna não couber no formato)"""
+        if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+            return None
+        columns, kinds, arrays = [], [], {}
+        for i, name in enumerate(df.columns):
+            col = df.iloc[:, i]
+            if not isinstance(name, str):
+                return None
+            if col.dtype == object:
+                nulls = col.isna().to_numpy()
+                values = col[~nulls]
+                if not all(type(v) is str for v in values) or values.str.contains(cls.SEPARATOR, regex=False).any():
+                    return None
+                text = cls.SEPARATOR.join(col.where(~nulls, "").tolist())
+                arrays[f"c{i}"] = np.frombuffer(text.encode('utf-8'), dtype=np.uint8)
+                if nulls.any():
+                    arrays[f"n{i}"] = nulls
+                kinds.append("text")
+            elif isinstance(col.dtype, np.dtype) and col.dtype.kind in "biufcmM":
+                arrays[f"c{i}"] = col.to_numpy()
+                kinds.append("array")
+            else:
+                return None
+            columns.append(name)
+        meta = {"bank_type": bank_type, "rows": len(df), "columns": columns, "kinds": kinds}
+        arrays["meta"] = np.array(json.dumps(meta, ensure_ascii=False))
+        return arrays
+
+    @classmethod
+    def _decode(cls, data) -> tuple:
+        meta = json.loads(str(data["meta"]))
+        rows = meta["rows"]
+        frame = {}
+        for i, kind in enumerate(meta["kinds"]):
+            if kind == "text":
+                values = data[f"c{i}"].tobytes().decode('utf-8').split(cls.SEPARATOR) if rows else []
+                values = np.array(values, dtype=object)
+                if f"n{i}" in data:
+                    values[data[f"n{i}"]] = np.nan
+            else:
+                values = data[f"c{i}"]
+            if len(values) != rows:
+                raise ValueError(f"coluna {i} com {len(values)} linhas, esperado {rows}")
+            frame[i] = values
+        df = pd.DataFrame(frame, index=pd.RangeIndex(rows))
+        df.columns = meta["columns"]
+        return df, meta["bank_type"]
+
+    def get(self, key: str):
+        """Retorna (df, bank_type) ou None se não estiver em cache"""
+        if not self._dir_usable():
+            self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                entry = self._decode(data)
+            os.utime(path, None)  # Marca como usado recentemente (LRU)
+            self.hits += 1
+            return entry
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logging.warning(f"⚠️ Cache de parsing corrompido para {key}: {e} - descartando")
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+
+    def put(self, key: str, df: pd.DataFrame, bank_type: str) -> None:
+        """Grava o resultado de forma atômica (tmp + rename) e aplica o limite de bytes"""
+        if not self._dir_usable():
+            return
+        try:
+            arrays = self._encode(df, bank_type)
+            if arrays is None:
+                logging.info(f"ℹ️ Cache de parsing: {key} tem colunas fora do formato .npz - não guardado")
+                return
+            path = self._path(key)
+            tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp_path, 'wb') as fh:
+                np.savez(fh, **arrays)
+            os.replace(tmp_path, path)
+            self._evict()
+        except Exception as e:
+            logging.warning(f"⚠️ Não foi possível gravar cache de parsing {key}: {e}")
+
+    def _evict(self) -> None:
+        """Remove os arquivos menos usados até o total caber em max_bytes"""
+        with self._lock:
+            entries = []
+            for path in self.cache_dir.glob(f"*{self.SUFFIX}"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    path.unlink()
+                    total -= size
+                    self.evictions += 1
+                except OSError:
+                    continue
+
+    def stats(self) -> dict:
+        files = list(self.cache_dir.glob(f"*{self.SUFFIX}")) if self.cache_dir.exists() else []
+        return {
+            "entries": len(files),
+            "bytes": sum(p.stat().st_size for p in files if p.exists()),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+parse_cache = ParsedUploadCache(
+    os.environ.get('PARSE_CACHE_DIR', str(ROOT_DIR / 'parse_cache')),
+    int(os.environ.get('PARSE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+)
+
+# ===== PERFIS DE LEITURA APRENDIDOS POR LAYOUT =====
+
+class ReaderProfileStore:
+    """
+    Perfis de leitura (encoding, separador, skiprows, sheet) aprendidos nas leituras bem-sucedidas,
+    indexados pela impressão digital do layout e guardados com o banco detectado.
+    Um layout repetido é lido direto com o perfil, sem passar de novo pelas tentativas.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reader_profiles (
+                    layout TEXT PRIMARY KEY,
+                    bank_type TEXT NOT NULL,
+                    profile TEXT NOT NULL,
+                    uses INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, layout: Optional[str]) -> Optional[dict]:
+        """Retorna o perfil (com 'bank_type') aprendido para o layout, ou None"""
+        if not layout:
+            return None
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT bank_type, profile FROM reader_profiles WHERE layout = ?", (layout,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Perfis de leitura indisponíveis: {e}")
+            row = None
+        finally:
+            conn.close()
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {**json.loads(row[1]), "bank_type": row[0]}
+
+    def learn(self, layout: Optional[str], bank_type: str, profile: dict) -> None:
+        """Grava (ou reforça) o perfil que leu o layout com sucesso"""
+        if not layout or not profile:
+            return
+        params = {key: value for key, value in profile.items() if key != "bank_type"}
+        conn = self._connect()
+        try:
+            conn.execute(
+                """
+                INSERT INTO reader_profiles (layout, bank_type, profile, uses, updated_at) VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT(layout) DO UPDATE SET
+                    bank_type = excluded.bank_type, profile = excluded.profile,
+                    uses = reader_profiles.uses + 1, updated_at = excluded.updated_at
+                """,
+                (layout, bank_type, json.dumps(params, ensure_ascii=False), datetime.utcnow().timestamp())
+            )
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Não foi possível gravar perfil de leitura {layout}: {e}")
+        finally:
+            conn.close()
+
+    def forget(self, layout: str) -> None:
+        """Descarta um perfil que não leu mais o layout corretamente"""
+        self.rejected += 1
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM reader_profiles WHERE layout = ?", (layout,))
+        except sqlite3.Error as e:
+            logging.warning(f"⚠️ Não foi possível remover perfil de leitura {layout}: {e}")
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT layout, bank_type, profile, uses FROM reader_profiles ORDER BY bank_type, uses DESC"
+            ).fetchall()
+        finally:
+            conn.close()
+        return {
+            "profiles": [
+                {"layout": layout, "bank_type": bank_type, "profile": json.loads(profile), "uses": uses}
+                for layout, bank_type, profile, uses in rows
+            ],
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected
+        }
+
+reader_profiles = ReaderProfileStore(
+    os.environ.get('READER_PROFILES_PATH', str(ROOT_DIR / 'reader_profiles.sqlite3'))
+)
+
+
+def read_and_detect_file(file_content: bytes, filename: str,
+                         timer: Optional[StageTimer] = None) -> tuple[pd.DataFrame, BankDetection]:
+    """Detecta o banco pelas primeiras linhas e só então lê o arquivo inteiro, uma única vez.
+
+    1. Layout já visto: a espiada usa o perfil aprendido (sem tentativas); se o banco
+       detectado não for o do perfil, o perfil é descartado.
+    2. Layout novo: as tentativas de read_file_optimized rodam só sobre as primeiras linhas
+       e registram o perfil que funcionou.
+    3. Leitura completa com o perfil; o perfil é aprendido/reforçado para o banco detectado.
+
+    Com timer, espiadas e leitura completa somam na etapa 'read' e as detecções em 'detect'.
+    """
+    file_ext = filename.lower().split('.')[-1]
+    excel_file = None
+    with timed_stage(timer, "read"):
+        if file_ext in ['xlsx', 'xls']:
+            try:
+                excel_file = pd.ExcelFile(io.BytesIO(file_content))
+            except Exception as e:
+                raise HTTPException(status_code=400, detail=f"Erro ao ler arquivo {filename}: {str(e)}")
+        layout = layout_fingerprint(file_content, filename, excel_file)
+
+    profile = reader_profiles.get(layout)
+    head = None
+    detection = None
+
+    def detect(sample: pd.DataFrame) -> BankDetection:
+        with timed_stage(timer, "detect", rows_in=len(sample)):
+            return detect_bank(sample.dropna(how='all'), filename)
+
+    if profile is not None:
+        try:
+            with timed_stage(timer, "read"):
+                head = read_with_profile(file_content, filename, profile, nrows=HEADER_PEEK_ROWS, excel_file=excel_file)
+            detection = detect(head)
+            if detection.bank != profile["bank_type"]:
+                raise ValueError(f"layout aprendido para {profile['bank_type']}, detectado {detection.bank}")
+            logging.info(f"📐 Perfil de leitura reaproveitado para '{filename}': {profile['bank_type']} {layout}")
+        except Exception as e:
+            logging.warning(f"⚠️ Perfil de leitura {layout} descartado para '{filename}': {e}")
+            reader_profiles.forget(layout)
+            head, detection, profile = None, None, None
+
+    if head is None:
+        profile = {}
+        with timed_stage(timer, "read"):
+            head = read_file_optimized(file_content, filename, nrows=HEADER_PEEK_ROWS, profile=profile, excel_file=excel_file)
+        if head.dropna(how='all').empty:
+            # Primeiras linhas vazias não dizem nada: leitura completa com as tentativas de sempre
+            profile = {}
+            with timed_stage(timer, "read") as stage:
+                df = read_file_optimized(file_content, filename, profile=profile, excel_file=excel_file)
+                stage["rows_out"] = len(df)
+            detection = detect(df)
+            reader_profiles.learn(layout, detection.bank, profile)
+            return df, detection
+        detection = detect(head)
+
+    with timed_stage(timer, "read") as stage:
+        try:
+            df = read_with_profile(file_content, filename, profile, excel_file=excel_file)
+        except Exception as e:
+            # O perfil serviu para o cabeçalho mas não para o arquivo todo (ex.: encoding quebra mais adiante)
+            logging.warning(f"⚠️ Leitura completa com perfil falhou para '{filename}': {e} - refazendo tentativas")
+            profile = {}
+            df = read_file_optimized(file_content, filename, profile=profile, excel_file=excel_file)
+        stage["rows_out"] = len(df)
+
+    reader_profiles.learn(layout, detection.bank, profile)
+    return df, detection
+
+# ===== ÍNDICE PERSISTENTE DA STORM (ADE → STATUS) =====
+
+class CompactStormIndex:
+    """
+    Representação compacta do índice Storm: ADEs como array int64 ordenado e status como
+    códigos uint8 (tabela de status no ponteiro JSON). Os arrays são gravados em .npy e
+    abertos com mmap, então todos os workers compartilham a mesma cópia via page cache.
+    """
+
+    # Sem zero à esquerda e até 18 dígitos: cabe em int64 e volta para a mesma string
+    CANONICAL_ADE_PATTERN = r'[1-9][0-9]{0,17}'
+
+    def __init__(self, ades: np.ndarray, codes: np.ndarray, status_table: List[str], version: int = 0):
+        self.ades = ades
+        self.codes = codes
+        self.status_table = np.array(status_table, dtype=object)
+        self.version = version
+
+    def __len__(self) -> int:
+        return len(self.ades)
+
+    @classmethod
+    def canonical_mask(cls, ades: pd.Series) -> pd.Series:
+        """ADEs que cabem em int64 sem perder informação"""
+        return ades.str.fullmatch(cls.CANONICAL_ADE_PATTERN).fillna(False).astype(bool)
+
+    @classmethod
+    def build(cls, ades: pd.Series, statuses: pd.Series, version: int = 0) -> tuple['CompactStormIndex', pd.DataFrame]:
+        """Monta o índice; retorna também as linhas não canônicas (ficam só no SQLite)"""
+        ades = ades.astype(str).reset_index(drop=True)
+        statuses = statuses.astype(str).reset_index(drop=True)
+        canonical = cls.canonical_mask(ades)
+        codes, status_table = pd.factorize(statuses[canonical], sort=True)
+        if len(status_table) > 255:
+            raise ValueError(f"Status demais para codificar em uint8: {len(status_table)}")
+        ade_ints = ades[canonical].astype(np.int64).to_numpy()
+        order = np.argsort(ade_ints, kind='stable')
+        index = cls(ade_ints[order], codes.astype(np.uint8)[order], list(status_table), version)
+        leftovers = pd.DataFrame({"ade": ades[~canonical], "status": statuses[~canonical]})
+        return index, leftovers
+
+    def lookup(self, ades: pd.Series, canonical: Optional[pd.Series] = None) -> pd.Series:
+        """Busca vetorizada (searchsorted); retorna status por ADE ou NaN se ausente/não canônica"""
+        ades = ades.astype(str)
+        result = pd.Series(np.nan, index=ades.index, dtype=object)
+        if canonical is None:
+            canonical = self.canonical_mask(ades)
+        if not canonical.any() or len(self.ades) == 0:
+            return result
+        values = ades[canonical].astype(np.int64).to_numpy()
+        positions = np.searchsorted(self.ades, values)
+        positions = np.minimum(positions, len(self.ades) - 1)
+        found = self.ades[positions] == values
+        statuses = np.full(len(values), np.nan, dtype=object)
+        statuses[found] = self.status_table[self.codes[positions[found]]]
+        result[canonical] = statuses
+        return result
+
+    def save(self, directory: Path, prefix: str) -> Path:
+        """Grava os arrays e troca o ponteiro JSON de forma atômica; retorna o caminho do ponteiro"""
+        directory.mkdir(parents=True, exist_ok=True)
+        ades_name = f"{prefix}.{self.version}.ades.npy"
+        codes_name = f"{prefix}.{self.version}.codes.npy"
+        np.save(directory / ades_name, self.ades)
+        np.save(directory / codes_name, self.codes)
+        pointer = directory / f"{prefix}.snapshot.json"
+        tmp_pointer = pointer.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_pointer, 'w', encoding='utf-8') as fh:
+            json.dump({
+                "version": self.version,
+                "ades": ades_name,
+                "codes": codes_name,
+                "status_table": [str(s) for s in self.status_table],
+                "total": len(self.ades)
+            }, fh)
+        os.replace(tmp_pointer, pointer)
+        # Snapshots antigos podem ser removidos: quem ainda tem mmap aberto continua lendo normalmente
+        for old in directory.glob(f"{prefix}.*.npy"):
+            if old.name not in (ades_name, codes_name):
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+        return pointer
+
+    @classmethod
+    def load(cls, pointer: Path) -> 'CompactStormIndex':
+        with open(pointer, 'r', encoding='utf-8') as fh:
+            meta = json.load(fh)
+        ades = np.load(pointer.parent / meta["ades"], mmap_mode='r')
+        codes = np.load(pointer.parent / meta["codes"], mmap_mode='r')
+        return cls(ades, codes, meta["status_table"], meta["version"])
+
+class StormIndexStore:
+    """
+    Índice ADE → Status da Storm persistido em SQLite (modo WAL).
+    Sobrevive a restarts, é compartilhado entre workers do uvicorn e recebe cada novo
+    export da Storm como upsert: só as ADEs cujo status mudou são reescritas.
+    """
+
+    LOOKUP_BATCH_SIZE = 900  # Abaixo do limite de variáveis do SQLite (999)
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.snapshot_dir = Path(db_path).parent
+        self.snapshot_prefix = Path(db_path).stem
+        self._snapshot = None
+        self._snapshot_mtime = None
+        self._snapshot_lock = threading.Lock()
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_schema(self) -> None:
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS storm_exports (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    filename TEXT,
+                    sha256 TEXT,
+                    uploaded_at TEXT NOT NULL,
+                    total_proposals INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS storm_status (
+                    ade TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    export_id INTEGER NOT NULL REFERENCES storm_exports(id),
+                    updated_at TEXT NOT NULL
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS idx_storm_status_status ON storm_status(status);
+            """)
+
+    def upsert_export(self, proposals: Dict[str, str], filename: str = "", sha256: str = "") -> dict:
+        """Registra um export da Storm e mescla seus status no índice (bulk, uma transação)"""
+        now = datetime.utcnow().isoformat()
+        conn = self._connect()
+        try:
+            with conn:
+                total_before = conn.execute("SELECT COUNT(*) FROM storm_status").fetchone()[0]
+                cursor = conn.execute(
+                    "INSERT INTO storm_exports (filename, sha256, uploaded_at, total_proposals) VALUES (?, ?, ?, ?)",
+                    (filename, sha256, now, len(proposals))
+                )
+                export_id = cursor.lastrowid
+                changes_before = conn.total_changes
+                conn.executemany(
+                    """
+                    INSERT INTO storm_status (ade, status, export_id, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(ade) DO UPDATE SET
+                        status = excluded.status,
+                        export_id = excluded.export_id,
+                        updated_at = excluded.updated_at
+                    WHERE storm_status.status != excluded.status
+                    """,
+                    ((ade, status, export_id, now) for ade, status in proposals.items())
+                )
+                changed = conn.total_changes - changes_before
+                total_after = conn.execute("SELECT COUNT(*) FROM storm_status").fetchone()[0]
+        finally:
+            conn.close()
+
+        inserted = total_after - total_before
+        updated = changed - inserted
+        result = {
+            "export_id": export_id,
+            "inserted": inserted,
+            "updated": updated,
+            "unchanged": len(proposals) - inserted - updated,
+            "index_total": total_after
+        }
+        logging.info(f"💾 Índice Storm atualizado (export #{export_id}): {inserted} novas, {updated} com status alterado, {result['unchanged']} inalteradas, {total_after} ADEs no total")
+        if inserted or updated or not self._pointer_path().exists():
+            self.rebuild_snapshot(export_id)
+        return result
+
+    def _pointer_path(self) -> Path:
+        return self.snapshot_dir / f"{self.snapshot_prefix}.snapshot.json"
+
+    def rebuild_snapshot(self, version: Optional[int] = None) -> Optional[CompactStormIndex]:
+        """Gera o snapshot compacto (mmap) a partir do SQLite"""
+        conn = self._connect()
+        try:
+            if version is None:
+                version = conn.execute("SELECT COALESCE(MAX(id), 0) FROM storm_exports").fetchone()[0]
+            rows = pd.read_sql_query("SELECT ade, status FROM storm_status", conn)
+        finally:
+            conn.close()
+        try:
+            index, leftovers = CompactStormIndex.build(rows["ade"], rows["status"], version)
+            index.save(self.snapshot_dir, self.snapshot_prefix)
+        except Exception as e:
+            logging.error(f"❌ Erro ao gerar snapshot compacto da Storm: {e}")
+            return None
+        logging.info(f"🗜️ Snapshot Storm v{version}: {len(index)} ADEs em {index.ades.nbytes + index.codes.nbytes} bytes ({len(leftovers)} ADEs não numéricas ficam só no SQLite)")
+        return index
+
+    def snapshot(self) -> Optional[CompactStormIndex]:
+        """Snapshot compacto atual (reabre o mmap quando outro worker publica uma versão nova)"""
+        pointer = self._pointer_path()
+        with self._snapshot_lock:
+            try:
+                mtime = pointer.stat().st_mtime_ns
+            except FileNotFoundError:
+                if self.count() == 0:
+                    return None
+                # Índice existe no SQLite mas ainda não tem snapshot (ex.: banco migrado)
+                self.rebuild_snapshot()
+                try:
+                    mtime = pointer.stat().st_mtime_ns
+                except FileNotFoundError:
+                    return None
+            if self._snapshot is None or mtime != self._snapshot_mtime:
+                try:
+                    self._snapshot = CompactStormIndex.load(pointer)
+                    self._snapshot_mtime = mtime
+                except Exception as e:
+                    logging.error(f"❌ Erro ao abrir snapshot Storm: {e}")
+                    self._snapshot = None
+            return self._snapshot
+
+    def lookup_many(self, ades) -> Dict[str, str]:
+        """Busca o status de várias ADEs; ADEs ausentes não aparecem no resultado
+        Usa o snapshot compacto (searchsorted) e só consulta o SQLite, em lotes, para ADEs não numéricas
+        """
+        unique_ades = pd.Series(pd.unique(pd.Series(ades, dtype=object).dropna().astype(str)), dtype=object)
+        unique_ades = unique_ades[unique_ades != ""]
+        found = {}
+        if unique_ades.empty:
+            return found
+        compact = self.snapshot()
+        if compact is not None:
+            canonical = CompactStormIndex.canonical_mask(unique_ades)
+            statuses = compact.lookup(unique_ades, canonical)
+            hits = statuses.notna()
+            found.update(zip(unique_ades[hits].tolist(), statuses[hits].tolist()))
+            unique_ades = unique_ades[~canonical]
+        return {**found, **self._lookup_sqlite(unique_ades.tolist())}
+
+    def _lookup_sqlite(self, unique_ades: List[str]) -> Dict[str, str]:
+        """Consulta direta no SQLite, em lotes"""
+        found = {}
+        if not unique_ades:
+            return found
+        conn = self._connect()
+        try:
+            for start in range(0, len(unique_ades), self.LOOKUP_BATCH_SIZE):
+                batch = unique_ades[start:start + self.LOOKUP_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                rows = conn.execute(f"SELECT ade, status FROM storm_status WHERE ade IN ({placeholders})", batch)
+                found.update(rows)
+        finally:
+            conn.close()
+        return found
+
+    def get_export(self, export_id: int) -> Optional[dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT id, filename, sha256, uploaded_at, total_proposals FROM storm_exports WHERE id = ?",
+                (export_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if not row:
+            return None
+        return dict(zip(["id", "filename", "sha256", "uploaded_at", "total_proposals"], row))
+
+    def count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM storm_status").fetchone()[0]
+        finally:
+            conn.close()
+
+    def count_paid_cancelled(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM storm_status WHERE status IN ('PAGO', 'CANCELADO')").fetchone()[0]
+        finally:
+            conn.close()
+
+storm_index = StormIndexStore(
+    os.environ.get('STORM_INDEX_PATH', str(ROOT_DIR / 'storm_index.sqlite3'))
+)
+
+# ===== REGISTRO DE JOBS COMPARTILHADO (SQLite WAL) =====
+
+class JobRegistry:
+    """
+    Registro de jobs de processamento visível para todos os workers do host.
+    Jobs expiram por TTL e pelo número máximo guardado; mudanças de status são atômicas
+    (só passam de 'processing' para 'completed'/'failed' uma única vez).
+    """
+
+    VALID_TRANSITIONS = {
+        "processing": {"completed", "failed"},
+    }
+
+    def __init__(self, db_path: str, ttl_seconds: int, max_jobs: int):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_jobs = max_jobs
+        self.evicted = 0
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_created_at ON jobs(created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def create(self, job: ProcessingJob) -> ProcessingJob:
+        now = datetime.utcnow().timestamp()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, status, data, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job.id, job.status, job.model_dump_json(), now, now)
+            )
+            self._evict(conn, now)
+        finally:
+            conn.close()
+        return job
+
+    def get(self, job_id: str) -> Optional[ProcessingJob]:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT data FROM jobs WHERE id = ? AND created_at >= ?",
+                (job_id, datetime.utcnow().timestamp() - self.ttl_seconds)
+            ).fetchone()
+        finally:
+            conn.close()
+        return ProcessingJob.model_validate_json(row[0]) if row else None
+
+    def transition(self, job_id: str, to_status: str, **updates) -> Optional[ProcessingJob]:
+        """Muda o status de forma atômica; retorna o job atualizado ou None se a transição não é válida"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row:
+                conn.execute("ROLLBACK")
+                return None
+            job = ProcessingJob.model_validate_json(row[0])
+            if to_status not in self.VALID_TRANSITIONS.get(job.status, set()):
+                conn.execute("ROLLBACK")
+                logging.warning(f"⚠️ Transição inválida do job {job_id}: {job.status} → {to_status}")
+                return None
+            job = job.model_copy(update={**updates, "status": to_status})
+            conn.execute(
+                "UPDATE jobs SET status = ?, data = ?, updated_at = ? WHERE id = ?",
+                (job.status, job.model_dump_json(), datetime.utcnow().timestamp(), job_id)
+            )
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def update(self, job_id: str, **updates) -> Optional[ProcessingJob]:
+        """Atualiza campos de um job sem mudar o status (ex.: XLSX gerado depois da conclusão)"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if not row:
+                conn.execute("ROLLBACK")
+                return None
+            job = ProcessingJob.model_validate_json(row[0]).model_copy(update=updates)
+            conn.execute(
+                "UPDATE jobs SET data = ?, updated_at = ? WHERE id = ?",
+                (job.model_dump_json(), datetime.utcnow().timestamp(), job_id)
+            )
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Remove jobs expirados (TTL) e os mais antigos além de max_jobs"""
+        expired = conn.execute("DELETE FROM jobs WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        overflow = conn.execute(
+            "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_jobs,)
+        ).rowcount
+        if expired or overflow:
+            self.evicted += expired + overflow
+            logging.info(f"🧹 Jobs removidos do registro: {expired} expirados, {overflow} acima do limite de {self.max_jobs}")
+
+    def result_files(self) -> set:
+        """Caminhos dos resultados (CSV, XLSX e perfis) referenciados por jobs finalizados ainda válidos"""
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT data FROM jobs WHERE status IN ('completed', 'failed') AND created_at >= ?",
+                (datetime.utcnow().timestamp() - self.ttl_seconds,)
+            ).fetchall()
+        finally:
+            conn.close()
+        files = set()
+        for row in rows:
+            job = ProcessingJob.model_validate_json(row[0])
+            files.update({job.result_file, job.xlsx_file, job.profile_file})
+        return files - {None}
+
+    def count(self) -> int:
+        conn = self._connect()
+        try:
+            return conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+        finally:
+            conn.close()
+
+job_registry = JobRegistry(
+    os.environ.get('JOB_REGISTRY_PATH', str(ROOT_DIR / 'jobs.sqlite3')),
+    ttl_seconds=int(os.environ.get('JOB_TTL_SECONDS', str(24 * 60 * 60))),
+    max_jobs=int(os.environ.get('JOB_MAX_COUNT', '1000'))
+)
+
+# ===== ARMAZENAMENTO GERENCIADO DOS RESULTADOS (quota + TTL) =====
+
+class ResultFileStore:
+    """
+    Guarda os CSVs finais (e artefatos do job, como XLSX e perfis) em um diretório próprio
+    com limite de tamanho e TTL; sufixos terminados em .gz são gravados já compactados.
+    O mtime de cada arquivo marca o último download: na falta de espaço saem primeiro os
+    resultados baixados há mais tempo. Arquivos sem job correspondente são limpos no startup.
+    """
+
+    SUFFIXES = (".csv", ".csv.gz", ".xlsx", ".profile.json")
+
+    # Arquivos mais novos que isso nunca são tratados como órfãos (job de outro worker pode estar terminando)
+    ORPHAN_GRACE_SECONDS = 300
+
+    def __init__(self, store_dir: str, max_bytes: int, ttl_seconds: int):
+        self.store_dir = Path(store_dir)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evictions = {"ttl": 0, "quota": 0, "orphans": 0}
+        self._lock = threading.Lock()
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, job_id: str, suffix: str = ".csv") -> Path:
+        return self.store_dir / f"{job_id}{suffix}"
+
+    def put(self, job_id: str, content: str, suffix: str = ".csv") -> str:
+        """Grava o resultado de forma atômica e aplica TTL/quota"""
+        def write(tmp_path: Path) -> None:
+            if suffix.endswith(".gz"):
+                opener = functools.partial(gzip.open, tmp_path, 'wt', encoding='utf-8', compresslevel=RESULT_GZIP_LEVEL)
+            else:
+                opener = functools.partial(open, tmp_path, 'w', encoding='utf-8')
+            with opener() as f:
+                f.write(content)
+        return self.put_with(job_id, write, suffix)
+
+    def put_with(self, job_id: str, write, suffix: str) -> str:
+        """Como put, mas quem grava é `write(caminho_temporário)` - para arquivos gerados em streaming (XLSX)"""
+        path = self.path_for(job_id, suffix)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        self.evict(keep={path.name})
+        return str(path)
+
+    def touch(self, path: str) -> None:
+        """Marca o resultado como baixado agora (ordem de remoção por quota)"""
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+    def _entries(self) -> List[tuple]:
+        entries = []
+        for path in self.store_dir.iterdir():
+            if not path.name.endswith(self.SUFFIXES):
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        entries.sort(key=lambda e: e[0])
+        return entries
+
+    def _remove(self, path: Path, reason: str) -> bool:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return False
+        self.evictions[reason] += 1
+        return True
+
+    def evict(self, keep: Optional[set] = None) -> None:
+        """Remove resultados expirados e, se a quota estourar, os baixados há mais tempo"""
+        keep = keep or set()
+        with self._lock:
+            now = datetime.utcnow().timestamp()
+            entries = self._entries()
+            remaining = []
+            for mtime, size, path in entries:
+                if path.name not in keep and now - mtime > self.ttl_seconds:
+                    self._remove(path, "ttl")
+                else:
+                    remaining.append((mtime, size, path))
+            total = sum(size for _, size, _ in remaining)
+            for mtime, size, path in remaining:
+                if total <= self.max_bytes:
+                    break
+                if path.name in keep:
+                    continue
+                if self._remove(path, "quota"):
+                    total -= size
+            if total > self.max_bytes:
+                logging.warning(f"⚠️ Armazenamento de resultados acima da quota: {total} > {self.max_bytes} bytes")
+
+    def cleanup_orphans(self, known_files: set) -> int:
+        """Remove arquivos temporários e resultados que nenhum job válido referencia"""
+        known_names = {Path(f).name for f in known_files}
+        now = datetime.utcnow().timestamp()
+        removed = 0
+        with self._lock:
+            for path in list(self.store_dir.iterdir()):
+                if not path.name.endswith((".tmp",) + self.SUFFIXES):
+                    continue
+                try:
+                    age = now - path.stat().st_mtime
+                except OSError:
+                    continue
+                if path.name in known_names or age < self.ORPHAN_GRACE_SECONDS:
+                    continue
+                if self._remove(path, "orphans"):
+                    removed += 1
+        if removed:
+            logging.info(f"🧹 {removed} resultados órfãos removidos de {self.store_dir}")
+        return removed
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        return {
+            "directory": str(self.store_dir),
+            "files": len(entries),
+            "total_bytes": total,
+            "max_bytes": self.max_bytes,
+            "usage_percent": round(total / self.max_bytes * 100, 2) if self.max_bytes else None,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": dict(self.evictions)
+        }
+
+# Compressão dos CSVs de resultado (1 = mais rápido, 9 = menor); CSV da Storm comprime ~10x já no nível 6
+RESULT_GZIP_LEVEL = int(os.environ.get('RESULT_GZIP_LEVEL', '6'))
+# Respostas (JSON de bank_summaries, /metrics...) acima disso vão compactadas para quem aceita gzip
+RESPONSE_GZIP_MIN_BYTES = int(os.environ.get('RESPONSE_GZIP_MIN_BYTES', '1024'))
+
+result_store = ResultFileStore(
+    os.environ.get('RESULT_STORE_DIR', str(Path(tempfile.gettempdir()) / 'qfaz_results')),
+    max_bytes=int(os.environ.get('RESULT_STORE_MAX_BYTES', str(1024 * 1024 * 1024))),
+    ttl_seconds=int(os.environ.get('RESULT_TTL_SECONDS', str(job_registry.ttl_seconds)))
+)
+
+startup_report.mark("armazenamentos (cache, perfis, índice Storm, jobs, resultados)")
+
+@app.on_event("startup")
+async def start_background_loads():
+    """Mapeamento de órgãos compila numa thread: o uvicorn abre a porta sem esperar por ele"""
+    start_organ_mapping_load()
+
+@app.on_event("startup")
+async def cleanup_result_store():
+    """Remove resultados órfãos/expirados deixados por execuções anteriores"""
+    try:
+        result_store.cleanup_orphans(job_registry.result_files())
+        result_store.evict()
+    except Exception as e:
+        logging.warning(f"⚠️ Falha na limpeza do armazenamento de resultados: {str(e)}")
+
+def require_admin(token: Optional[str]) -> None:
+    """Valida o token administrativo (ADMIN_TOKEN); sem token configurado os endpoints ficam desativados"""
+    admin_token = os.environ.get('ADMIN_TOKEN', '')
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Endpoints administrativos desativados (ADMIN_TOKEN não configurado)")
+    if token != admin_token:
+        raise HTTPException(status_code=403, detail="Token administrativo inválido")
+
+XLSX_MEDIA_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Linhas do CSV lidas por vez ao gerar o XLSX: a memória não cresce com o tamanho do resultado
+XLSX_CHUNK_ROWS = 20_000
+# Limite de linhas por aba do Excel (cabeçalho incluído)
+XLSX_MAX_ROWS = 1_048_576
+OUTPUT_FORMAT_QUERY = Query("csv", pattern="^(csv|xlsx)$", description="Formato do resultado: csv (';') ou xlsx")
+_xlsx_guard = threading.Lock()
+_xlsx_locks: Dict[str, threading.Lock] = {}
+
+def write_storm_xlsx(csv_path: str, xlsx_path: Path) -> None:
+    """
+    Converte o CSV final (';', gz ou não) em XLSX com o modo write-only do openpyxl: o CSV é
+    lido em blocos e as linhas vão direto para o arquivo. Mesmas colunas e valores do CSV,
+    todos como texto (CPF, proposta e códigos mantêm os zeros à esquerda). Resultados acima
+    do limite de linhas do Excel continuam em abas seguintes, cada uma com o cabeçalho.
+    """
+    # Import tardio: openpyxl fica fora do cold start
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    workbook = Workbook(write_only=True)
+    sheet, sheet_rows = None, XLSX_MAX_ROWS
+    chunks = pd.read_csv(csv_path, sep=';', dtype=str, keep_default_na=False, encoding='utf-8', chunksize=XLSX_CHUNK_ROWS)
+    for index, chunk in enumerate(chunks):
+        if index == 0:
+            header = list(chunk.columns)
+        # Caracteres de controle são inválidos no XML da planilha (e quebrariam o writer no meio)
+        chunk = chunk.replace(ILLEGAL_CHARACTERS_RE, '', regex=True)
+        for row in chunk.itertuples(index=False, name=None):
+            # Passou do limite de linhas do Excel: continua numa aba nova ("Storm 2", ...), com o cabeçalho
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet("Storm" if sheet is None else f"Storm {len(workbook.worksheets) + 1}")
+                sheet.append(header)
+                sheet_rows = 1
+            sheet.append(row)
+            sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet("Storm").append(header)
+    workbook.save(xlsx_path)
+
+def ensure_result_xlsx(job: ProcessingJob) -> str:
+    """XLSX do job: gerado uma vez a partir do CSV gravado e reaproveitado nos downloads seguintes"""
+    if job.xlsx_file and os.path.exists(job.xlsx_file):
+        return job.xlsx_file
+    with _xlsx_guard:
+        lock = _xlsx_locks.setdefault(job.id, threading.Lock())
+    try:
+        with lock:
+            # Outro download pode ter gerado o arquivo enquanto este esperava
+            current = job_registry.get(job.id)
+            if current and current.xlsx_file and os.path.exists(current.xlsx_file):
+                return current.xlsx_file
+            start = time.perf_counter()
+            path = result_store.put_with(job.id, functools.partial(write_storm_xlsx, job.result_file), ".xlsx")
+            job_registry.update(job.id, xlsx_file=path)
+            logging.info(f"📗 XLSX do job {job.id} gerado em {time.perf_counter() - start:.2f}s ({os.path.getsize(path) / MB:.1f} MB)")
+            return path
+    finally:
+        with _xlsx_guard:
+            _xlsx_locks.pop(job.id, None)
+
+def index_storm_content(content: bytes, filename: str) -> Dict[str, Any]:
+    """Lê uma exportação da Storm e mescla no índice persistente; HTTP 400 se o arquivo não for da Storm"""
+    timer = StageTimer()
+    cache_key = parse_cache.key_for(content, filename)
+    cached = parse_cache.get(cache_key)
+    if cached is not None:
+        df, bank_type = cached
+        logging.info(f"♻️ Storm '{filename}' reaproveitada do cache de parsing")
+    else:
+        # Detectar tipo de banco pelo cabeçalho e ler o arquivo uma única vez
+        df, detection = read_and_detect_file(content, filename, timer)
+        bank_type = detection.bank
+        parse_cache.put(cache_key, df, bank_type)
+
+    if bank_type != "STORM":
+        raise HTTPException(status_code=400, detail="Este não é um arquivo da Storm válido")
+
+    # Processar dados da Storm
+    with timer.stage("normalize", rows_in=len(df)) as stage:
+        storm_proposals, storm_stats = process_storm_data_enhanced(df)
+        stage["rows_out"] = len(storm_proposals)
+
+    # Mesclar no índice persistente (upsert - só status alterados são reescritos)
+    with timer.stage("write", rows_in=len(storm_proposals)):
+        index_result = storm_index.upsert_export(
+            storm_proposals,
+            filename=filename,
+            sha256=hashlib.sha256(content).hexdigest()
+        )
+    pipeline_metrics.record_stages("STORM", timer)
+
+    return {
+        "total_proposals": len(storm_proposals),
+        "paid_cancelled": storm_stats["paid_cancelled"],
+        "paid": storm_stats["pago"],
+        "cancelled": storm_stats["cancelado"],
+        "filename": filename,
+        "export_id": index_result["export_id"],
+        "inserted": index_result["inserted"],
+        "updated": index_result["updated"],
+        "unchanged": index_result["unchanged"],
+        "index_total": index_result["index_total"]
+    }
+
+def process_bank_file(content: bytes, filename: str,
+                      memory: JobMemoryTracker) -> tuple[Optional[pd.DataFrame], FileOutcome]:
+    """
+    Pipeline de um arquivo de banco: leitura + detecção (ou cache), limpeza, mapeamento e
+    remoção das propostas já conhecidas pela Storm. Devolve o DataFrame filtrado (None quando
+    o arquivo não contribui com linhas) e o desfecho do arquivo. Cada chamada tem seu próprio
+    StageTimer, então arquivos diferentes podem rodar em threads paralelas.
+    """
+    timer = StageTimer()
+    bank_type = "DESCONHECIDO"
+
+    def skipped(outcome: str, reason: str) -> tuple[None, FileOutcome]:
+        return None, FileOutcome(filename=filename, size_bytes=len(content), bank=bank_type, outcome=outcome, reason=reason)
+
+    try:
+        logging.info(f"Processando arquivo: {filename}")
+
+        # 🔍 LOG DETALHADO PARA DEBUG - CAPTURAR TODOS OS ARQUIVOS
+        file_ext = filename.lower().split('.')[-1]
+        file_size = len(content)
+        logging.warning(f"🔍 ARQUIVO RECEBIDO: '{filename}' | Formato: {file_ext} | Tamanho: {file_size} bytes")
+        memory.project(filename, file_size)
+
+        # Verificar se pode ser QUERO MAIS
+        filename_lower = filename.lower()
+        quero_mais_indicators = ['quero', 'promotora', 'producao', 'produção', 'capital', 'consig', 'qfz', 'grupo']
+        has_quero_mais_indicator = any(indicator in filename_lower for indicator in quero_mais_indicators)
+
+        if has_quero_mais_indicator:
+            logging.error(f"🎯 POSSÍVEL QUERO MAIS DETECTADO: {filename}")
+        else:
+            logging.warning(f"📋 Arquivo sem indicadores QUERO MAIS: {filename}")
+
+        # ♻️ Reaproveitar leitura + detecção se o mesmo arquivo já foi enviado antes
+        cache_key = parse_cache.key_for(content, filename)
+        cached = parse_cache.get(cache_key)
+        if cached is not None:
+            df, bank_type = cached
+            logging.info(f"♻️ CACHE HIT: '{filename}' → {bank_type} ({len(df)} linhas), pulando leitura e detecção")
+        else:
+            # Detectar banco pelas primeiras linhas e ler o arquivo uma única vez (perfil de leitura)
+            try:
+                logging.error(f"🔄 TENTANDO LER ARQUIVO: '{filename}'")
+                df, detection = read_and_detect_file(content, filename, timer)
+                bank_type = detection.bank
+                logging.error(f"✅ ARQUIVO LIDO COM SUCESSO: '{filename}' → {len(df.columns)} colunas, {len(df)} linhas")
+                logging.error(f"✅ BANCO DETECTADO: '{filename}' → {bank_type} ({detection.method}, confiança {detection.confidence:.2f})")
+
+                if bank_type == "QUERO_MAIS":
+                    logging.error(f"🎯 SUCESSO! QUERO MAIS DETECTADO: {filename}")
+
+            except Exception as read_error:
+                logging.error(f"❌ ERRO AO LER/DETECTAR ARQUIVO '{filename}': {str(read_error)}")
+                logging.error(f"❌ Stack trace: {traceback.format_exc()}")
+                pipeline_metrics.inc("qfaz_files_processed_total", bank=bank_type, outcome="erro_leitura")
+                return skipped("erro_leitura", f"Erro ao ler/detectar: {str(read_error)}")
+
+            # Validar DataFrame
+            if df is None or df.empty:
+                logging.error(f"❌ DATAFRAME VAZIO: '{filename}' (None: {df is None}, Empty: {df.empty if df is not None else 'N/A'})")
+                pipeline_metrics.inc("qfaz_files_processed_total", bank=bank_type, outcome="vazio")
+                return skipped("vazio", "Arquivo sem linhas")
+
+            # Limpar DataFrame - remover linhas completamente vazias
+            original_rows = len(df)
+            with timer.stage("clean", rows_in=original_rows) as stage:
+                df = df.dropna(how='all')
+                stage["rows_out"] = len(df)
+            cleaned_rows = len(df)
+            logging.error(f"🧹 LIMPEZA CONCLUÍDA: '{filename}' ({original_rows} → {cleaned_rows} linhas)")
+
+            if df.empty:
+                logging.error(f"❌ ARQUIVO SEM DADOS APÓS LIMPEZA: '{filename}'")
+                pipeline_metrics.inc("qfaz_files_processed_total", bank=bank_type, outcome="vazio")
+                return skipped("vazio", "Arquivo sem dados após remover as linhas vazias")
+
+            parse_cache.put(cache_key, df, bank_type)
+
+        if bank_type == "STORM":
+            return skipped("storm", "Exportação da Storm: não entra no relatório final")
+
+        # Log especial para QUERO MAIS
+        if bank_type == "QUERO_MAIS":
+            logging.error(f"🎉 QUERO MAIS CONFIRMADO: {filename} → Processando...")
+
+        logging.info(f"✅ Banco detectado: {bank_type}, Registros originais: {len(df)}, Colunas: {len(df.columns)}")
+
+        # DEBUG: Log adicional para PAULISTA
+        if 'AF5EEBB7' in filename or 'paulista' in filename.lower():
+            logging.error(f"🔍 DEBUG PAULISTA: Arquivo={filename}, Banco detectado={bank_type}")
+            logging.error(f"🔍 DEBUG PAULISTA: Primeiras colunas: {list(df.columns)[:10]}")
+            if not df.empty:
+                first_row = df.iloc[0].to_dict()
+                logging.error(f"🔍 DEBUG PAULISTA: Primeira linha: {first_row}")
+
+        # Mapear para formato final
+        if bank_type == "PAULISTA":
+            logging.error(f"🏦 PAULISTA: Chamando map_to_final_format com {len(df)} linhas")
+
+        mapped_df, mapped_count = map_to_final_format(df, bank_type, timer)
+        date_order_report = mapped_df.attrs.pop("date_order_report", {})
+
+        logging.info(f"🗺️ MAPEAMENTO RESULTADO: {bank_type} → {len(mapped_df)} linhas mapeadas de {len(df)} originais")
+
+        if mapped_df.empty:
+            logging.error(f"❌ CRÍTICO: Nenhum dado mapeado para {filename} (banco: {bank_type})")
+            logging.error(f"   📊 DataFrame original tinha {len(df)} linhas")
+            logging.error(f"   🔍 Primeiras colunas do DF: {list(df.columns)[:10] if not df.empty else 'DF vazio'}")
+            pipeline_metrics.record_stages(bank_type, timer)
+            memory.observe(timer)
+            pipeline_metrics.inc("qfaz_files_processed_total", bank=bank_type, outcome="sem_dados_mapeados")
+            return skipped("sem_dados_mapeados", f"Nenhuma linha mapeada para {bank_type}")
+
+        # Remover duplicatas baseado na Storm
+        original_count = len(mapped_df)
+        with timer.stage("dedupe", rows_in=original_count) as stage:
+            propostas_digits = mapped_df["PROPOSTA"].astype(str).str.replace(r'\D', '', regex=True) if "PROPOSTA" in mapped_df.columns else []
+            storm_matches = storm_index.lookup_many(propostas_digits)
+            filtered_df, duplicates_by_status = remove_duplicates_enhanced(mapped_df, storm_matches)
+            stage["rows_out"] = len(filtered_df)
+        duplicates_removed = original_count - len(filtered_df)
+
+        logging.info(f"📊 DUPLICATAS: {duplicates_removed} removidas, {len(filtered_df)} restantes de {original_count}")
+
+        if not filtered_df.empty:
+            logging.info(f"✅ SUCESSO: DataFrame de {bank_type} adicionado ao resultado final ({len(filtered_df)} linhas)")
+        else:
+            logging.error(f"❌ CRÍTICO: Todas as linhas de {bank_type} foram removidas como duplicatas!")
+            logging.error(f"   📊 Original: {original_count} → Duplicatas: {duplicates_removed} → Restou: 0")
+
+        # Criar resumo
+        status_dist = {}
+        if not filtered_df.empty and "SITUACAO" in filtered_df.columns:
+            # Categórica: value_counts lista também as categorias sem linhas restantes
+            status_dist = {status: int(count) for status, count in filtered_df["SITUACAO"].value_counts().items() if count}
+
+        summary = ReportSummary(
+            bank_name=bank_type,
+            total_records=len(filtered_df),
+            duplicates_removed=duplicates_removed,
+            duplicates_by_status=duplicates_by_status,
+            status_distribution=status_dist,
+            mapped_records=mapped_count,
+            unmapped_records=original_count - mapped_count,
+            date_order_report=date_order_report,
+            stage_timings=timer.summary()
+        )
+        pipeline_metrics.record_stages(bank_type, timer)
+        memory.observe(timer)
+        pipeline_metrics.inc("qfaz_files_processed_total", bank=bank_type, outcome="ok")
+        return (None if filtered_df.empty else filtered_df), FileOutcome(
+            filename=filename, size_bytes=len(content), bank=bank_type, summary=summary
+        )
+
+    except Exception as e:
+        logging.error(f"Erro ao processar arquivo {filename}: {str(e)}")
+        pipeline_metrics.inc("qfaz_files_processed_total", bank=bank_type, outcome="erro")
+        return skipped("erro", str(e))
+
+def complete_bank_job(job_id: str, all_final_data: List[pd.DataFrame], bank_summaries: List[ReportSummary],
+                      memory: JobMemoryTracker, job_start: float, profiler: Optional[JobProfiler] = None,
+                      output_format: str = "csv") -> Dict[str, Any]:
+    """Combina os bancos no CSV final da Storm, grava o resultado e conclui o job; devolve a resposta da API"""
+    # Etapas do job inteiro (o CSV final é um só para todos os bancos)
+    job_timer = StageTimer()
+    with job_timer.stage("combine", rows_in=sum(len(part) for part in all_final_data)) as stage:
+        final_df = pd.concat(share_output_categories(all_final_data), ignore_index=True)
+
+        # 🧹 LIMPEZA FINAL: Garantir que não há caracteres especiais no relatório final
+        logging.info(f"🧹 Aplicando limpeza final de caracteres especiais no relatório combinado ({len(final_df)} registros)")
+        for col in final_df.columns:
+            if isinstance(final_df[col].dtype, pd.CategoricalDtype):
+                final_df[col] = transform_unique_values(final_df[col], clean_special_characters)
+            elif final_df[col].dtype == 'object':
+                final_df[col] = transform_unique_values(final_df[col].astype(str), clean_special_characters)
+        logging.info(f"✅ Limpeza final concluída - relatório pronto para Storm")
+        stage["rows_out"] = len(final_df)
+
+    # **FORMATAÇÃO OTIMIZADA PARA STORM COM SEPARADOR ';'**
+    with job_timer.stage("format", rows_in=len(final_df)) as stage:
+        csv_content = format_csv_for_storm(final_df)
+        stage["rows_out"] = len(final_df)
+
+    # Gravado já em gzip: o download serve o arquivo como está para quem aceita gzip
+    with job_timer.stage("write", rows_in=len(final_df)):
+        result_path = result_store.put(job_id, csv_content, suffix=".csv.gz")
+    logging.info(f"🗜️ Resultado {job_id}: {len(csv_content) / MB:.1f} MB → {os.path.getsize(result_path) / MB:.1f} MB em gzip")
+
+    xlsx_path = None
+    if output_format == "xlsx":
+        # Gerado junto com o CSV; os downloads em XLSX reaproveitam este arquivo
+        with job_timer.stage("xlsx", rows_in=len(final_df)):
+            xlsx_path = result_store.put_with(job_id, functools.partial(write_storm_xlsx, result_path), ".xlsx")
+
+    stage_timings = job_timer.summary()
+    pipeline_metrics.record_stages("TODOS", job_timer)
+    memory.observe(job_timer)
+    memory_report = memory.report()
+    pipeline_metrics.observe("qfaz_job_duration_seconds", time.perf_counter() - job_start)
+    pipeline_metrics.inc("qfaz_jobs_total", status="completed")
+    pipeline_metrics.inc("qfaz_job_output_rows_total", len(final_df))
+    profile_path = save_job_profile(job_id, profiler)
+
+    # Atualizar job (transição atômica processing → completed)
+    job_registry.transition(
+        job_id,
+        "completed",
+        completed_at=datetime.utcnow(),
+        message=f"Processamento concluído: {len(final_df)} registros",
+        total_records=len(final_df),
+        result_file=result_path,
+        xlsx_file=xlsx_path,
+        stage_timings=stage_timings,
+        profile_file=profile_path,
+        memory=memory_report
+    )
+
+    response = {
+        "job_id": job_id,
+        "message": "Processamento concluído com sucesso",
+        "total_records": len(final_df),
+        "bank_summaries": [summary.dict() for summary in bank_summaries],
+        "stage_timings": {name: timing.model_dump() for name, timing in stage_timings.items()},
+        "memory": memory_report,
+        "download_url": f"/api/download-result/{job_id}" + ("?output_format=xlsx" if xlsx_path else "")
+    }
+    if profile_path:
+        response["profile_url"] = f"/api/processing-status/{job_id}/profile"
+    return response
+
 @api_router.post("/upload-storm")
 async def upload_storm_report(file: UploadFile = File(...)):
     """Upload e processamento do relatório da Storm"""
@@ -5969,30 +8666,11 @@ async def upload_storm_report(file: UploadFile = File(...)):
         if not file.filename:
             raise HTTPException(status_code=400, detail="Nome do arquivo é obrigatório")
         
-        content = await file.read()
+        content, filename = await read_upload(file)
         if len(content) == 0:
             raise HTTPException(status_code=400, detail="Arquivo está vazio")
         
-        df = read_file_optimized(content, file.filename)
-        
-        # Detectar tipo de banco
-        bank_type = detect_bank_type_enhanced(df, file.filename)
-        if bank_type != "STORM":
-            raise HTTPException(status_code=400, detail="Este não é um arquivo da Storm válido")
-        
-        # Processar dados da Storm
-        storm_proposals = process_storm_data_enhanced(df)
-        
-        # Armazenar globalmente
-        global storm_data_global
-        storm_data_global = storm_proposals
-        
-        return {
-            "message": "Arquivo da Storm processado com sucesso",
-            "total_proposals": len(storm_proposals),
-            "paid_cancelled": sum(1 for status in storm_proposals.values() if status in ["PAGO", "CANCELADO"]),
-            "filename": file.filename
-        }
+        return {"message": "Arquivo da Storm processado com sucesso", **index_storm_content(content, filename)}
         
     except HTTPException:
         raise
@@ -6001,14 +8679,26 @@ async def upload_storm_report(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @api_router.post("/process-banks")
-async def process_bank_reports(files: List[UploadFile] = File(...)):
+async def process_bank_reports(
+    files: List[UploadFile] = File(...),
+    profile: bool = Query(False, description="Roda o job sob profiler (requer X-Admin-Token)"),
+    output_format: str = OUTPUT_FORMAT_QUERY,
+    x_admin_token: Optional[str] = Header(None)
+):
     """Processamento aprimorado de múltiplos relatórios de bancos"""
+    profiler = None
     try:
-        if not storm_data_global:
+        if profile:
+            require_admin(x_admin_token)
+        
+        if storm_index.count() == 0:
             raise HTTPException(status_code=400, detail="Primeiro faça upload do relatório da Storm")
         
         if not files or len(files) == 0:
             raise HTTPException(status_code=400, detail="Nenhum arquivo de banco foi enviado")
+        
+        # Logo após um deploy o mapeamento ainda pode estar compilando em background
+        await wait_for_organ_mapping()
 
         # 🔍 LOG INICIAL DETALHADO
         logging.error(f"🚀 INICIANDO PROCESSAMENTO DE {len(files)} ARQUIVOS")
@@ -6019,221 +8709,318 @@ async def process_bank_reports(files: List[UploadFile] = File(...)):
 
         job_id = str(uuid.uuid4())
         job = ProcessingJob(id=job_id, total_records=0, processed_records=0)
-        processing_jobs[job_id] = job
+        job_registry.create(job)
+        
+        if profile:
+            profiler = JobProfiler()
+            profiler.start()
+            logging.info(f"🔬 Job {job_id} rodando com profiler")
+        memory = JobMemoryTracker(job_id)
         
         all_final_data = []
         bank_summaries = []
+        job_start = time.perf_counter()
         
         for file in files:
             try:
                 if not file.filename:
                     continue
-                
-                content = await file.read()
-                if len(content) == 0:
-                    continue
-                
-                logging.info(f"Processando arquivo: {file.filename}")
-                
-                # 🔍 LOG DETALHADO PARA DEBUG - CAPTURAR TODOS OS ARQUIVOS
-                file_ext = file.filename.lower().split('.')[-1] if file.filename else 'unknown'
-                file_size = len(content)
-                logging.warning(f"🔍 ARQUIVO RECEBIDO: '{file.filename}' | Formato: {file_ext} | Tamanho: {file_size} bytes")
-                
-                # Verificar se pode ser QUERO MAIS
-                filename_lower = file.filename.lower() if file.filename else ""
-                quero_mais_indicators = ['quero', 'promotora', 'producao', 'produção', 'capital', 'consig', 'qfz', 'grupo']
-                has_quero_mais_indicator = any(indicator in filename_lower for indicator in quero_mais_indicators)
-                
-                if has_quero_mais_indicator:
-                    logging.error(f"🎯 POSSÍVEL QUERO MAIS DETECTADO: {file.filename}")
-                else:
-                    logging.warning(f"📋 Arquivo sem indicadores QUERO MAIS: {file.filename}")
-                
-                # Ler arquivo com tratamento de erros melhorado
-                try:
-                    logging.error(f"🔄 TENTANDO LER ARQUIVO: '{file.filename}'")
-                    df = read_file_optimized(content, file.filename)
-                    logging.error(f"✅ ARQUIVO LIDO COM SUCESSO: '{file.filename}' → {len(df.columns)} colunas, {len(df)} linhas")
-                except Exception as read_error:
-                    logging.error(f"❌ ERRO AO LER ARQUIVO '{file.filename}': {str(read_error)}")
-                    logging.error(f"❌ Stack trace da leitura: {traceback.format_exc()}")
-                    continue
-                
-                # Validar DataFrame
-                logging.error(f"🔍 VALIDANDO DATAFRAME: '{file.filename}'")
-                if df is None or df.empty:
-                    logging.error(f"❌ DATAFRAME VAZIO: '{file.filename}' (None: {df is None}, Empty: {df.empty if df is not None else 'N/A'})")
-                    continue
-                
-                # Limpar DataFrame - remover linhas completamente vazias
-                original_rows = len(df)
-                df = df.dropna(how='all')
-                cleaned_rows = len(df)
-                logging.error(f"🧹 LIMPEZA CONCLUÍDA: '{file.filename}' ({original_rows} → {cleaned_rows} linhas)")
-                
-                if df.empty:
-                    logging.error(f"❌ ARQUIVO SEM DADOS APÓS LIMPEZA: '{file.filename}'")
-                    continue
-                    
-                logging.error(f"✅ ARQUIVO VÁLIDO PRONTO PARA DETECÇÃO: '{file.filename}'")
-                
-                # Detectar tipo de banco
-                try:
-                    logging.error(f"🔍 INICIANDO DETECÇÃO DE BANCO para: '{file.filename}'")
-                    logging.error(f"🔍 DataFrame info: {len(df)} linhas x {len(df.columns)} colunas")
-                    logging.error(f"🔍 Primeiras 3 colunas: {list(df.columns[:3])}")
-                    
-                    bank_type = detect_bank_type_enhanced(df, file.filename)
-                    
-                    logging.error(f"✅ BANCO DETECTADO: '{file.filename}' → {bank_type}")
-                    
-                    if bank_type == "QUERO_MAIS":
-                        logging.error(f"🎯 SUCESSO! QUERO MAIS DETECTADO: {file.filename}")
-                    
-                except Exception as detect_error:
-                    logging.error(f"❌ Erro ao detectar banco em '{file.filename}': {str(detect_error)}")
-                    logging.error(f"❌ Stack trace: {traceback.format_exc()}")
-                    continue
-                
-                if bank_type == "STORM":
-                    continue  # Pular arquivos da Storm
-                
-                # Log especial para QUERO MAIS
-                if bank_type == "QUERO_MAIS":
-                    logging.error(f"🎉 QUERO MAIS CONFIRMADO: {file.filename} → Processando...")
-                
-                logging.info(f"✅ Banco detectado: {bank_type}, Registros originais: {len(df)}, Colunas: {len(df.columns)}")
-                
-                # DEBUG: Log adicional para PAULISTA
-                if 'AF5EEBB7' in file.filename or 'paulista' in file.filename.lower():
-                    logging.error(f"🔍 DEBUG PAULISTA: Arquivo={file.filename}, Banco detectado={bank_type}")
-                    logging.error(f"🔍 DEBUG PAULISTA: Primeiras colunas: {list(df.columns)[:10]}")
-                    if not df.empty:
-                        first_row = df.iloc[0].to_dict()
-                        logging.error(f"🔍 DEBUG PAULISTA: Primeira linha: {first_row}")
-                
-                # Mapear para formato final
-                if bank_type == "PAULISTA":
-                    logging.error(f"🏦 PAULISTA: Chamando map_to_final_format com {len(df)} linhas")
-                
-                mapped_df, mapped_count = map_to_final_format(df, bank_type)
-                
-                logging.info(f"🗺️ MAPEAMENTO RESULTADO: {bank_type} → {len(mapped_df)} linhas mapeadas de {len(df)} originais")
-                
-                if mapped_df.empty:
-                    logging.error(f"❌ CRÍTICO: Nenhum dado mapeado para {file.filename} (banco: {bank_type})")
-                    logging.error(f"   📊 DataFrame original tinha {len(df)} linhas")
-                    logging.error(f"   🔍 Primeiras colunas do DF: {list(df.columns)[:10] if not df.empty else 'DF vazio'}")
-                    continue
-                
-                # Remover duplicatas baseado na Storm
-                original_count = len(mapped_df)
-                filtered_df = remove_duplicates_enhanced(mapped_df, storm_data_global)
-                duplicates_removed = original_count - len(filtered_df)
-                
-                logging.info(f"📊 DUPLICATAS: {duplicates_removed} removidas, {len(filtered_df)} restantes de {original_count}")
-                
-                if not filtered_df.empty:
-                    all_final_data.append(filtered_df)
-                    logging.info(f"✅ SUCESSO: DataFrame de {bank_type} adicionado ao resultado final ({len(filtered_df)} linhas)")
-                else:
-                    logging.error(f"❌ CRÍTICO: Todas as linhas de {bank_type} foram removidas como duplicatas!")
-                    logging.error(f"   📊 Original: {original_count} → Duplicatas: {duplicates_removed} → Restou: 0")
-                
-                # Criar resumo
-                status_dist = {}
-                if not filtered_df.empty and "SITUACAO" in filtered_df.columns:
-                    status_dist = filtered_df["SITUACAO"].value_counts().to_dict()
-                
-                bank_summaries.append(ReportSummary(
-                    bank_name=bank_type,
-                    total_records=len(filtered_df),
-                    duplicates_removed=duplicates_removed,
-                    status_distribution=status_dist,
-                    mapped_records=mapped_count,
-                    unmapped_records=original_count - mapped_count
-                ))
-                
+                # .gz/.xz/.zip descompactados em streaming; o nome interno define o leitor
+                content, filename = await read_upload(file)
+            except HTTPException as e:
+                # Compactado inválido/truncado (400) ou acima de MAX_DECOMPRESSED_MB (413): recusa o envio inteiro
+                logging.error(f"❌ Arquivo recusado '{file.filename}': {e.detail}")
+                pipeline_metrics.inc("qfaz_files_processed_total", bank="DESCONHECIDO", outcome="erro_leitura")
+                pipeline_metrics.inc("qfaz_jobs_total", status="failed")
+                job_registry.transition(job_id, "failed", completed_at=datetime.utcnow(), message=str(e.detail),
+                                        profile_file=save_job_profile(job_id, profiler), memory=memory.report())
+                raise
             except Exception as e:
                 logging.error(f"Erro ao processar arquivo {file.filename}: {str(e)}")
+                pipeline_metrics.inc("qfaz_files_processed_total", bank="DESCONHECIDO", outcome="erro")
+                continue
+            if len(content) == 0:
                 continue
+            
+            filtered_df, outcome = process_bank_file(content, filename, memory)
+            del content
+            if filtered_df is not None:
+                all_final_data.append(filtered_df)
+            if outcome.summary is not None:
+                bank_summaries.append(outcome.summary)
         
         # Combinar todos os dados
         if not all_final_data:
             logging.error("🚫 ERRO CRÍTICO: Nenhum DataFrame válido foi processado!")
             for i, file in enumerate(files):
                 logging.error(f"   📂 Arquivo {i+1}: {file.filename}")
-            raise HTTPException(status_code=400, detail="Nenhum dado válido foi processado. Verifique se os arquivos têm o formato correto e contêm dados válidos.")
-        
-        final_df = pd.concat(all_final_data, ignore_index=True)
-        
-        # 🧹 LIMPEZA FINAL: Garantir que não há caracteres especiais no relatório final
-        logging.info(f"🧹 Aplicando limpeza final de caracteres especiais no relatório combinado ({len(final_df)} registros)")
-        for col in final_df.columns:
-            if final_df[col].dtype == 'object':
-                final_df[col] = final_df[col].astype(str).apply(clean_special_characters)
-        logging.info(f"✅ Limpeza final concluída - relatório pronto para Storm")
-        
-        # **FORMATAÇÃO OTIMIZADA PARA STORM COM SEPARADOR ';'**
-        csv_content = format_csv_for_storm(final_df)
-        
-        temp_file = tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, encoding='utf-8')
-        temp_file.write(csv_content)
-        temp_file.close()
+            message = "Nenhum dado válido foi processado. Verifique se os arquivos têm o formato correto e contêm dados válidos."
+            # O HTTPException abaixo passa direto pelo except: o job fecha aqui como em process_batch
+            job_registry.transition(job_id, "failed", completed_at=datetime.utcnow(), message=message,
+                                    profile_file=save_job_profile(job_id, profiler), memory=memory.report())
+            pipeline_metrics.inc("qfaz_jobs_total", status="failed")
+            raise HTTPException(status_code=400, detail=message)
         
-        # Atualizar job
-        job.status = "completed"
-        job.completed_at = datetime.utcnow()
-        job.message = f"Processamento concluído: {len(final_df)} registros"
-        job.total_records = len(final_df)
-        job.result_file = temp_file.name
-        
-        return {
-            "job_id": job_id,
-            "message": "Processamento concluído com sucesso",
-            "total_records": len(final_df),
-            "bank_summaries": [summary.dict() for summary in bank_summaries],
-            "download_url": f"/api/download-result/{job_id}"
-        }
+        return complete_bank_job(job_id, all_final_data, bank_summaries, memory, job_start, profiler, output_format)
         
     except HTTPException:
         raise
     except Exception as e:
         logging.error(f"Erro no processamento: {str(e)}")
         if 'job' in locals():
-            job.status = "failed"
-            job.message = str(e)
+            pipeline_metrics.inc("qfaz_jobs_total", status="failed")
+            job_registry.transition(
+                job.id, "failed", completed_at=datetime.utcnow(), message=str(e),
+                profile_file=save_job_profile(job.id, profiler),
+                memory=memory.report() if 'memory' in locals() else {}
+            )
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+    finally:
+        if profiler is not None:
+            profiler.stop()
+
+@api_router.post("/process-batch")
+async def process_batch(file: UploadFile = File(...), output_format: str = OUTPUT_FORMAT_QUERY):
+    """
+    Lote ZIP com a exportação da Storm e os relatórios dos bancos num único upload.
+    Cada entrada é detectada pelas primeiras linhas; a Storm é indexada antes de tudo e os
+    bancos rodam em paralelo (BATCH_WORKERS threads) lendo direto do ZIP, sem extrair para o disco.
+    A resposta traz o desfecho de cada entrada, com o motivo das que ficaram de fora.
+    """
+    try:
+        if not file.filename or Path(file.filename.lower()).suffix != '.zip':
+            raise HTTPException(status_code=400, detail="Envie o lote como um arquivo .zip")
+        try:
+            archive = zipfile.ZipFile(file.file)
+        except zipfile.BadZipFile as e:
+            raise HTTPException(status_code=400, detail=f"ZIP inválido '{file.filename}': {str(e)}")
+
+        await wait_for_organ_mapping()
+
+        with archive:
+            entries = zip_data_entries(archive)
+            if not entries:
+                raise HTTPException(status_code=400, detail=f"ZIP '{file.filename}' não contém arquivos")
+            logging.info(f"📦 LOTE '{file.filename}': {len(entries)} arquivos")
+
+            # 1. Detectar cada entrada pelas primeiras linhas
+            outcomes: Dict[str, FileOutcome] = {}
+            storm_entries, bank_entries = [], []
+            for info in entries:
+                outcome = outcomes[info.filename] = FileOutcome(filename=info.filename, size_bytes=info.file_size)
+                extension = info.filename.lower().split('.')[-1]
+                if extension not in BATCH_EXTENSIONS:
+                    outcome.outcome, outcome.reason = "ignorado", f"Formato não suportado: {extension}"
+                    continue
+                if info.file_size == 0:
+                    outcome.outcome, outcome.reason = "vazio", "Arquivo vazio"
+                    continue
+                try:
+                    outcome.bank = detect_zip_entry(archive, info)
+                except Exception as e:
+                    outcome.outcome = "erro_leitura"
+                    outcome.reason = f"Erro ao ler/detectar: {getattr(e, 'detail', None) or str(e)}"
+                    continue
+                (storm_entries if outcome.bank == "STORM" else bank_entries).append(info)
+                logging.info(f"   📁 {info.filename} → {outcome.bank}")
+
+            # 2. Storm primeiro: os bancos deduplicam contra o índice já atualizado
+            storm_results = []
+            for info in storm_entries:
+                outcome = outcomes[info.filename]
+                try:
+                    storm_results.append(index_storm_content(read_zip_entry(archive, info), Path(info.filename).name))
+                    outcome.outcome = "storm"
+                except Exception as e:
+                    outcome.outcome, outcome.reason = "erro", getattr(e, 'detail', None) or str(e)
+
+            if storm_index.count() == 0:
+                raise HTTPException(status_code=400, detail="O lote não tem exportação da Storm válida e o índice está vazio")
+            if not bank_entries:
+                raise HTTPException(status_code=400, detail={
+                    "message": "Nenhum relatório de banco reconhecido no lote",
+                    "entries": [outcome.model_dump() for outcome in outcomes.values()]
+                })
+
+            job_id = str(uuid.uuid4())
+            job = ProcessingJob(id=job_id, total_records=0, processed_records=0)
+            job_registry.create(job)
+            memory = JobMemoryTracker(job_id)
+            job_start = time.perf_counter()
+
+            # 3. Bancos em paralelo, cada thread descompactando a sua entrada
+            def run_entry(info: zipfile.ZipInfo) -> tuple[Optional[pd.DataFrame], FileOutcome]:
+                try:
+                    content = read_zip_entry(archive, info)
+                except Exception as e:
+                    logging.error(f"Erro ao processar arquivo {info.filename}: {str(e)}")
+                    pipeline_metrics.inc("qfaz_files_processed_total", bank=outcomes[info.filename].bank, outcome="erro")
+                    return None, FileOutcome(filename=info.filename, size_bytes=info.file_size, outcome="erro",
+                                             reason=getattr(e, 'detail', None) or str(e))
+                return process_bank_file(content, Path(info.filename).name, memory)
+
+            # Maiores primeiro: o último arquivo a terminar não é um grande que começou tarde
+            scheduled = sorted(bank_entries, key=lambda info: info.file_size, reverse=True)
+            loop = asyncio.get_running_loop()
+            with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(scheduled)), thread_name_prefix="lote") as pool:
+                results = await asyncio.gather(*(loop.run_in_executor(pool, run_entry, info) for info in scheduled))
+            processed = {info.filename: result for info, result in zip(scheduled, results)}
+
+        # Resultado na ordem do ZIP, independente de qual thread terminou primeiro
+        all_final_data, bank_summaries = [], []
+        for info in bank_entries:
+            filtered_df, outcome = processed[info.filename]
+            outcome.filename = info.filename
+            if outcome.bank == "DESCONHECIDO":
+                outcome.bank = outcomes[info.filename].bank
+            outcomes[info.filename] = outcome
+            if filtered_df is not None:
+                all_final_data.append(filtered_df)
+            if outcome.summary is not None:
+                bank_summaries.append(outcome.summary)
+
+        entry_outcomes = [outcome.model_dump() for outcome in outcomes.values()]
+        if not all_final_data:
+            message = "Nenhum dado válido foi processado no lote"
+            job_registry.transition(job_id, "failed", completed_at=datetime.utcnow(), message=message, memory=memory.report())
+            pipeline_metrics.inc("qfaz_jobs_total", status="failed")
+            raise HTTPException(status_code=400, detail={"message": message, "entries": entry_outcomes})
+
+        response = complete_bank_job(job_id, all_final_data, bank_summaries, memory, job_start, output_format=output_format)
+        response["storm"] = storm_results
+        response["entries"] = entry_outcomes
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Erro no processamento do lote: {str(e)}")
+        if 'job' in locals():
+            pipeline_metrics.inc("qfaz_jobs_total", status="failed")
+            job_registry.transition(
+                job.id, "failed", completed_at=datetime.utcnow(), message=str(e),
+                memory=memory.report() if 'memory' in locals() else {}
+            )
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Accept-Encoding aceita gzip (explícito ou '*') com q > 0"""
+    for part in (accept_encoding or "").split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() not in ('gzip', 'x-gzip', '*'):
+            continue
+        match = re.search(r'q\s*=\s*([0-9.]+)', params)
+        try:
+            if match is None or float(match.group(1)) > 0:
+                return True
+        except ValueError:
+            continue
+    return False
+
+def iter_gunzip(path: str, chunk_size: int = DECOMPRESS_CHUNK_SIZE):
+    """Descompacta o resultado em blocos para clientes sem gzip (memória constante)"""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
 @api_router.get("/download-result/{job_id}")
-async def download_result(job_id: str):
-    """Download do resultado processado"""
-    if job_id not in processing_jobs:
+async def download_result(job_id: str, output_format: str = OUTPUT_FORMAT_QUERY,
+                          accept_encoding: Optional[str] = Header(None)):
+    """Download do resultado processado (gzip como está gravado ou descompactado na hora; ou XLSX)"""
+    job = job_registry.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job não encontrado")
     
-    job = processing_jobs[job_id]
     if job.status != "completed":
         raise HTTPException(status_code=400, detail="Processamento ainda não concluído")
     
-    if not hasattr(job, 'result_file') or not os.path.exists(job.result_file):
-        raise HTTPException(status_code=404, detail="Arquivo de resultado não encontrado")
+    if not job.result_file or not os.path.exists(job.result_file):
+        raise HTTPException(status_code=404, detail="Arquivo de resultado não encontrado (expirado ou removido)")
+    
+    filename = f"relatorio_final_storm_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+    
+    if output_format == "xlsx":
+        xlsx_path = await asyncio.get_running_loop().run_in_executor(None, ensure_result_xlsx, job)
+        result_store.touch(xlsx_path)
+        return FileResponse(path=xlsx_path, filename=filename[:-len(".csv")] + ".xlsx", media_type=XLSX_MEDIA_TYPE)
+    
+    result_store.touch(job.result_file)
+    
+    if not job.result_file.endswith(".gz"):
+        # Resultado gravado antes da compressão no armazenamento
+        return FileResponse(path=job.result_file, filename=filename, media_type='text/csv')
+    
+    if accepts_gzip(accept_encoding):
+        return FileResponse(
+            path=job.result_file,
+            filename=filename,
+            media_type='text/csv',
+            headers={"Content-Encoding": "gzip", "Vary": "Accept-Encoding"}
+        )
     
-    return FileResponse(
-        path=job.result_file,
-        filename=f"relatorio_final_storm_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-        media_type='text/csv'
+    return StreamingResponse(
+        iter_gunzip(job.result_file),
+        media_type='text/csv',
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}  # Vary vem do GZipMiddleware
     )
 
 @api_router.get("/processing-status/{job_id}")
 async def get_processing_status(job_id: str):
     """Status do processamento"""
-    if job_id not in processing_jobs:
+    job = job_registry.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job não encontrado")
     
-    job = processing_jobs[job_id]
     return job.dict()
 
+@api_router.get("/processing-status/{job_id}/profile")
+async def get_job_profile(job_id: str, format: str = Query("json", pattern="^(json|collapsed)$"),
+                          x_admin_token: Optional[str] = Header(None)):
+    """Perfil do job (?profile=true): top funções por tempo cumulativo ou pilhas collapsed para flamegraph"""
+    require_admin(x_admin_token)
+    job = job_registry.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    if not job.profile_file or not os.path.exists(job.profile_file):
+        raise HTTPException(status_code=404, detail="Job sem perfil (não foi enviado com profile=true ou o perfil expirou)")
+    
+    with open(job.profile_file, encoding='utf-8') as f:
+        report = json.load(f)
+    if format == "collapsed":
+        return PlainTextResponse(
+            report["collapsed_stacks"],
+            headers={"Content-Disposition": f'attachment; filename="profile_{job_id}.collapsed.txt"'}
+        )
+    report.pop("collapsed_stacks", None)
+    return report
+
+@api_router.get("/admin/result-store")
+async def get_result_store_stats(x_admin_token: Optional[str] = Header(None)):
+    """Uso de disco e contadores de remoção do armazenamento de resultados"""
+    require_admin(x_admin_token)
+    return result_store.stats()
+
+@api_router.get("/admin/reader-profiles")
+async def get_reader_profiles(x_admin_token: Optional[str] = Header(None)):
+    """Perfis de leitura aprendidos por layout (encoding, separador, skiprows, sheet) e seus usos"""
+    require_admin(x_admin_token)
+    return reader_profiles.stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas do processo (tempo/memória por etapa e banco, linhas, jobs) no formato texto do Prometheus"""
+    rss = current_rss_bytes()
+    # ru_maxrss é atualizado pelo kernel com atraso; o pico nunca é menor que o RSS atual
+    peak = max((v for v in (rss, peak_rss_bytes()) if v is not None), default=None)
+    for name, value in (("qfaz_process_resident_memory_bytes", rss),
+                        ("qfaz_process_peak_resident_memory_bytes", peak)):
+        if value is not None:
+            pipeline_metrics.set(name, value)
+    return PlainTextResponse(pipeline_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @api_router.get("/")
 async def root():
     return {"message": "Sistema de Processamento de Relatórios Financeiros - V6.6.0 Melhorias Completas DIGIO, VCTEX e AVERBAI"}
@@ -6241,6 +9028,7 @@ async def root():
 @api_router.post("/reload-mapping")
 async def reload_mapping():
     """Endpoint para recarregar o mapeamento de órgãos quando novos códigos são adicionados"""
+    await wait_for_organ_mapping()
     try:
         success = reload_organ_mapping()
         if success:
@@ -6260,6 +9048,7 @@ async def reload_mapping():
 @api_router.get("/averbai-codes")
 async def get_averbai_codes():
     """Endpoint para listar todos os códigos AVERBAI reconhecidos pelo sistema"""
+    await wait_for_organ_mapping()
     try:
         averbai_codes = {
             "FGTS": [],
@@ -6309,15 +9098,16 @@ async def get_averbai_codes():
 @api_router.post("/debug-file")
 async def debug_file(file: UploadFile = File(...)):
     """Endpoint de debug para testar leitura e detecção de arquivos"""
+    await wait_for_organ_mapping()
     try:
-        content = await file.read()
+        content, filename = await read_upload(file)
         
         # Tentar ler arquivo
         try:
-            df = read_file_optimized(content, file.filename)
+            df = read_file_optimized(content, filename)
             
             debug_info = {
-                "filename": file.filename,
+                "filename": filename,
                 "file_size": len(content),
                 "success": True,
                 "rows": len(df),
@@ -6334,8 +9124,9 @@ async def debug_file(file: UploadFile = File(...)):
             
             # Tentar detectar banco
             try:
-                bank_type = detect_bank_type_enhanced(df, file.filename)
-                debug_info["detected_bank"] = bank_type
+                detection = detect_bank(df, filename)
+                debug_info["detected_bank"] = detection.bank
+                debug_info["detection"] = detection.model_dump()
             except Exception as detect_error:
                 debug_info["detected_bank"] = f"ERRO: {str(detect_error)}"
             
@@ -6343,7 +9134,7 @@ async def debug_file(file: UploadFile = File(...)):
             
         except Exception as read_error:
             return {
-                "filename": file.filename,
+                "filename": filename,
                 "file_size": len(content),
                 "success": False,
                 "error": str(read_error),
@@ -6359,6 +9150,11 @@ app.include_router(api_router)
 # Mount static files for frontend (comentado para Railway - frontend está no Azure)
 # app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
+# Corpos com Content-Encoding: gzip (uploads por links lentos das filiais)
+app.add_middleware(GzipRequestMiddleware)
+# Respostas grandes compactadas; as que já têm Content-Encoding (CSV pré-compactado) passam intactas
+app.add_middleware(GZipMiddleware, minimum_size=RESPONSE_GZIP_MIN_BYTES)
+
 # Configure CORS with a safe default.
 # If CORS_ORIGINS is set to '*' or empty, we allow all origins but disable credentials
 # because Starlette does not allow allow_credentials=True with '*' origin.
@@ -6389,6 +9185,7 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+startup_report.mark("rotas e middlewares")
 
 if __name__ == "__main__":
     import os